@@ -1,27 +1,35 @@
-import dynamic_testing_environment
-import app_analyzer
 import argparse
 import glob
 import os
 import logging
-import requests
+import multiprocessing
+import queue
 from stats import Statistic
 import time
 import shutil
 import subprocess
 from adb import ADB
-import frida_monitoring
+from analysis_worker import AnalysisWorker, get_num_log, get_stats_files
+from triage import triage_apps
+import spans
+from job_ledger import JobLedger
+from scheduler import AppScheduler, ORDERS, ORDER_SJF, ORDER_LJF
+from intake import IntakeWatcher, DEFAULT_POLL_INTERVAL
+from job_api import start_job_api, job_api_port, DEFAULT_API_HOST
+from dynamic_testing_environment import TYPE_SIMULATED
+from emulator_client import EmulatorManagerClient, EmulatorManagerError
+from host_resources import Autoscaler
+from device_setup import get_setup_profile
 from p3detector.prediction_model import PredictionModel
-from androguard.core.bytecodes.apk import APK
 import json
-import hashlib
-import signal
 import sys
 
 
-LOCAL_URL_EMULATOR = "http://127.0.0.1:21212"
-MAX_TENTATIVE = 2
-MAX_TIME_ANALYSIS = 600
+# Adb address of the pool emulators, each emulator forwards its adb port on ADB_BASE_PORT_EMULATOR + 2 * i.
+ADB_HOST_EMULATOR = "127.0.0.1"
+ADB_BASE_PORT_EMULATOR = 5555
+# Sent by a pool worker when it takes an app from the shared queue, in place of the result of the app.
+APP_TAKEN = None
 
 if 'LOG_LEVEL' in os.environ:
     log_level = os.environ['LOG_LEVEL']
@@ -34,34 +42,6 @@ logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s(
                     datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
 
 
-class MyTimeoutExcpetion(Exception):
-    pass
-
-
-def handler_timeout(signum, frame):
-    logger.info(
-        "Timeout analysis is reached {sig}, on line {line}, in {file_name}".format(sig=signum, line=str(frame.f_lineno),
-                                                                                   file_name=str(
-                                                                                       frame.f_code.co_filename)))
-    raise MyTimeoutExcpetion("Timeout reached")
-
-
-def md5(fname):
-    hash_md5 = hashlib.md5()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
-
-
-def write_json_file_log(md5_app: str, dict_analysis_app: dict):
-    dir_result = os.path.join(os.getcwd(), "logs", md5_app)
-    if not os.path.exists(dir_result):
-        os.makedirs(dir_result)
-    with open(os.path.join(dir_result, "{}.json".format(md5_app)), "w") as json_file:
-        json.dump(dict_analysis_app, json_file, indent=4)
-
-
 def push_api_monitor_xposed(adb: ADB, package_name: str, dir_hook_file: str):
     """
     push file on emulator needed to api monitor
@@ -81,11 +61,6 @@ def push_api_monitor_xposed(adb: ADB, package_name: str, dir_hook_file: str):
     adb.shell(['echo', '"{0}"'.format(package_name), '>', '/data/local/tmp/package.name'])
 
 
-def write_package_name_and_md5(package_name: str, md5: str, path_file_log: str):
-    with open(path_file_log, "a") as file_log:
-        file_log.write("{},{}\n".format(package_name, md5))
-
-
 def pull_api_monitor_xposed(adb: ADB, package_name: str, result_directory: str, md5_app: str = None):
     """
 
@@ -111,13 +86,6 @@ def pull_api_monitor_xposed(adb: ADB, package_name: str, result_directory: str,
                   extracted_log_path)
 
 
-def check_app_already_analyzed_md5(md5_app: str):
-    file_log = os.path.join(os.getcwd(), "logs",
-                            md5_app,
-                            "{}.json".format(md5_app))
-    return os.path.exists(file_log)
-
-
 def check_app_already_analyzed(package_name: str):
     file_log = os.path.join(os.getcwd(), "logs",
                             package_name.replace(".", "_"),
@@ -167,10 +135,26 @@ def start_appium_node(type):
     return type
 
 
-def start_analysis(list_apps: list, timeout_privacy: int, max_actions: int, type: str, emulator_name: str):
+def start_analysis(list_apps: list, timeout_privacy: int, max_actions: int, type: str, emulator_name: str,
+                   static_workers: int = 0, triage: bool = False, triage_workers: int = None, schedule: str = None,
+                   intake: IntakeWatcher = None, api_port: int = None, warm_pool: bool = False,
+                   app_snapshots: bool = False, setup_profile: list = None, api_host: str = DEFAULT_API_HOST):
+    """
+    Analyze the apps on a single emulator. With an intake watcher (daemon mode) the analysis never ends: the new apks
+    of the intake directory are analyzed as they land, with the model and the appium node loaded once. With an API
+    port the apks can be submitted through the job API (listening on api_host) as well.
+    """
     logger.info("Start Analysis of {} apps".format(len(list_apps)))
     start = time.time()
-    stats = Statistic(type)
+    # the jobs of a run interrupted start again
+    ledger = JobLedger()
+    ledger.recover_interrupted()
+    logger.info("Timing spans of run {}".format(spans.start_run()))
+
+    stats_triage, count_triage = None, 0
+    if triage:
+        with spans.span("triage", apps=len(list_apps)):
+            list_apps, stats_triage, count_triage = triage_apps(list_apps, triage_workers, type)
 
     if type == "random":
         type = start_appium_node(type)
@@ -181,272 +165,256 @@ def start_analysis(list_apps: list, timeout_privacy: int, max_actions: int, type
     logger.info("P3detector model uploaded")
 
     # start analysis
-    count = 0
-    tentative = 0
-    num_log = len(glob.glob(os.path.join(os.getcwd(), "logs", "log_analysis_*")))
+    num_log = get_num_log()
+    worker = AnalysisWorker(emulator_name, type, timeout_privacy, max_actions, str(num_log + 1), pdetector=pdetector,
+                            static_workers=static_workers, warm_pool=warm_pool, app_snapshots=app_snapshots,
+                            setup_profile=setup_profile)
+    if stats_triage is not None:
+        worker.stats.merge(stats_triage)
+        worker.count += count_triage
+
+    # the shortest apps first, the apps that failed are analyzed again at the end
+    scheduler = AppScheduler(list_apps, schedule if schedule else ORDER_SJF, ledger)
+    if api_port is not None:
+        start_job_api(scheduler, JobLedger(), port=api_port, workers=1, host=api_host,
+                      apps_dir=intake.dir_app if intake is not None else None)
+    if intake is not None:
+        logger.info("Daemon mode, watching {}".format(intake.dir_app))
+        worker.run(intake.stream(scheduler), on_result=scheduler.task_done)
+    while not scheduler.empty():
+        time.sleep(scheduler.wait_time())
+        worker.run(scheduler, on_result=scheduler.task_done)
 
-    log_analysis_file = os.path.join(os.getcwd(), "logs", "log_analysis_{}.json".format(num_log + 1))
-    log_permission_file = os.path.join(os.getcwd(), "logs", "permissions_stats_{}.json".format(num_log + 1))
-    log_trackers_file = os.path.join(os.getcwd(), "logs", "tracker_stats_{}.json".format(num_log + 1))
+    end = time.time()
+    logger.info("\n\n")
+    logger.info("Execution time: {}, mean: {}".format(end - start, (end - start) / max(worker.count, 1)))
 
-    while count < len(list_apps):
 
-        app = list_apps[count]
-        dict_analysis_app = {}
-        md5_app = md5(app)
+def get_pool_emulators(emulators: str = None, workers: int = None, emulator_name: str = "AndroidEmulator"):
+    """
+    Returns the list of (emulator name, adb serial) used by the pool. Each emulator of --emulators is written as
+    NAME or NAME=SERIAL, --workers N uses N emulators named <emulator-name>-1 ... <emulator-name>-N. When the serial
+    is not given the i-th emulator is expected to forward its adb port on 127.0.0.1:5555 + 2 * i.
+    """
+    if emulators:
+        list_emulators = [emulator.strip() for emulator in emulators.split(",") if emulator.strip()]
+    else:
+        list_emulators = ["{}-{}".format(emulator_name, i + 1) for i in range(workers)]
+
+    pool_emulators = []
+    for i, emulator in enumerate(list_emulators):
+        if "=" in emulator:
+            name, serial = emulator.split("=", 1)
+        else:
+            name, serial = emulator, "{}:{}".format(ADB_HOST_EMULATOR, ADB_BASE_PORT_EMULATOR + 2 * i)
+        pool_emulators.append((name, serial))
+    return pool_emulators
 
-        dir_result = os.path.join(os.getcwd(), "logs", md5_app)
-        if not os.path.exists(dir_result):
-            os.makedirs(dir_result)
 
+def start_worker(queue_apps: multiprocessing.Queue, queue_results: multiprocessing.Queue,
+                 queue_stats: multiprocessing.Queue, emulator_name: str, device_serial: str, type: str,
+                 timeout_privacy: int, max_actions: int, log_id: str, static_workers: int = 0,
+                 warm_pool: bool = False, app_snapshots: bool = False, setup_profile: list = None):
+    """
+    Pool worker, analyze the apps taken from the shared queue until the end of the queue (None) is reached. Every app
+    taken (APP_TAKEN) and the result of every app (False if it has to be analyzed again) are sent back to the
+    scheduler, so the apps of a worker killed without sending their result can be analyzed by the other workers.
+    """
+    worker = None
+    apps_taken = []
+
+    def take_apps():
+        for app in iter(queue_apps.get, None):
+            apps_taken.append(app)
+            queue_results.put((emulator_name, app, APP_TAKEN))
+            yield app
+
+    def send_result(app, done):
+        apps_taken.remove(app)
+        queue_results.put((emulator_name, app, done))
+
+    try:
+        worker = AnalysisWorker(emulator_name, type, timeout_privacy, max_actions, log_id,
+                                device_serial=device_serial, static_workers=static_workers, warm_pool=warm_pool,
+                                app_snapshots=app_snapshots, setup_profile=setup_profile)
+        worker.run(take_apps(), on_result=send_result)
+    except Exception as e:
+        logger.error("Worker of emulator {} stopped, Exception: {}".format(emulator_name, e))
+    finally:
+        # the apps taken and not analyzed go back to the scheduler
+        for app in apps_taken:
+            queue_results.put((emulator_name, app, False))
+        if worker is None:
+            queue_stats.put((emulator_name, None, 0))
+        else:
+            queue_stats.put((emulator_name, worker.stats, worker.count))
+
+
+def recover_apps_taken(scheduler: AppScheduler, processes: dict, apps_taken: dict, stopped: list) -> int:
+    """
+    Give back to the scheduler the apps taken by the stopped workers and never sent back (the worker was killed, e.g.
+    by the OOM killer, before its finally), their jobs go back in the queue of the ledger as well.
+
+    :return: The number of apps given back.
+    """
+    recovered = 0
+    for emulator_name in stopped:
+        if not apps_taken[emulator_name]:
+            continue
+        logger.error("Worker of emulator {} killed (exit code {}), {} apps given back to the scheduler".format(
+            emulator_name, processes[emulator_name].exitcode, len(apps_taken[emulator_name])))
+        for app in apps_taken[emulator_name]:
+            if scheduler.ledger is not None:
+                md5_app = scheduler.ledger.lookup_md5(app)
+                if md5_app is not None and not scheduler.ledger.is_finished(md5_app):
+                    scheduler.ledger.retry_later(md5_app, "Worker of emulator {} killed".format(emulator_name))
+            scheduler.task_done(app, False)
+            recovered += 1
+        apps_taken[emulator_name] = []
+    return recovered
+
+
+def dispatch_apps(scheduler: AppScheduler, queue_apps: multiprocessing.Queue, queue_results: multiprocessing.Queue,
+                  processes: dict, max_in_flight: int, intake: IntakeWatcher = None, autoscaler: Autoscaler = None):
+    """
+    Feed the workers of the pool with the apps of the scheduler, keeping at most max_in_flight apps in the shared
+    queue or in analysis. The apps that failed are given back to the scheduler, that puts them at the end of the queue.
+    With an intake watcher (daemon mode) the new apks of the intake directory are added to the scheduler, until the
+    daemon is interrupted. With an autoscaler the apps in flight are at most the workers it allows, the other
+    workers wait without an emulator running. The apps taken by a worker that died are given back to the scheduler.
+    """
+    in_flight = 0
+    # apps taken by each worker (processes by emulator name) and not analyzed yet
+    apps_taken = {emulator_name: [] for emulator_name in processes}
+    while True:
+        if intake is not None:
+            intake.add_new_apps(scheduler)
+            intake.log_queue_depth(scheduler, in_flight)
+        if autoscaler is not None:
+            max_in_flight = autoscaler.update(len(scheduler))
+        while in_flight < max_in_flight:
+            app = scheduler.get_nowait()
+            if app is None:
+                break
+            queue_apps.put(app)
+            in_flight += 1
+        if in_flight == 0 and scheduler.empty() and intake is None:
+            return
+        # a worker stopped before the queue is found empty has nothing left in the queue
+        stopped = [emulator_name for emulator_name, process in processes.items() if not process.is_alive()]
+        if len(stopped) == len(processes):
+            logger.error("All the workers are stopped, {} apps not analyzed".format(in_flight + len(scheduler)))
+            return
+        try:
+            emulator_name, app, done = queue_results.get(timeout=1 if intake is None else intake.poll_interval)
+        except queue.Empty:
+            in_flight -= recover_apps_taken(scheduler, processes, apps_taken, stopped)
+            continue
+        if done is APP_TAKEN:
+            apps_taken[emulator_name].append(app)
+            continue
+        if app in apps_taken[emulator_name]:
+            apps_taken[emulator_name].remove(app)
+        in_flight -= 1
+        scheduler.task_done(app, done)
+
+
+def stop_emulators_left(emulator_names: list):
+    """
+    Stop the emulators left running by the workers (e.g. the analysis was interrupted), all at the same time.
+    """
+    for emulator_name, response in EmulatorManagerClient().stop_many(emulator_names).items():
+        if isinstance(response, EmulatorManagerError):
+            logger.error("Unable to stop emulator {}: {}".format(emulator_name, response))
+        elif response.ok:
+            logger.info("Emulator {} left running, stopped".format(emulator_name))
+
+
+def start_analysis_pool(list_apps: list, timeout_privacy: int, max_actions: int, type: str, pool_emulators: list,
+                        static_workers: int = 0, triage: bool = False, triage_workers: int = None,
+                        schedule: str = None, intake: IntakeWatcher = None, api_port: int = None,
+                        warm_pool: bool = False, app_snapshots: bool = False, autoscale: bool = False,
+                        min_workers: int = 1, setup_profile: list = None, api_host: str = DEFAULT_API_HOST):
+    logger.info("Start Analysis of {} apps with {} emulators".format(len(list_apps), len(pool_emulators)))
+    start = time.time()
+    # the jobs of a run interrupted start again, before the workers take the first apps
+    ledger = JobLedger()
+    ledger.recover_interrupted()
+    logger.info("Timing spans of run {}".format(spans.start_run()))
+
+    if type == "random":
+        type = start_appium_node(type)
+
+    stats = Statistic(type)
+    count = 0
+    if triage:
+        with spans.span("triage", apps=len(list_apps)):
+            list_apps, stats_triage, count = triage_apps(list_apps, triage_workers, type)
+        stats.merge(stats_triage)
+
+    # the longest apps first balance the load of the emulators, the apps that failed are analyzed again at the end
+    scheduler = AppScheduler(list_apps, schedule if schedule else ORDER_LJF, ledger)
+    if api_port is not None:
+        start_job_api(scheduler, JobLedger(), port=api_port, workers=len(pool_emulators), host=api_host,
+                      apps_dir=intake.dir_app if intake is not None else None)
+
+    num_log = get_num_log() + 1
+    queue_apps = multiprocessing.Queue()
+    queue_results = multiprocessing.Queue()
+    queue_stats = multiprocessing.Queue()
+
+    processes = {}
+    for emulator_name, device_serial in pool_emulators:
+        logger.info("Start worker of emulator {} ({})".format(emulator_name, device_serial))
+        process = multiprocessing.Process(target=start_worker,
+                                          args=(queue_apps, queue_results, queue_stats, emulator_name,
+                                                device_serial, type,
+                                                timeout_privacy, max_actions, "{}_{}".format(num_log, emulator_name),
+                                                static_workers, warm_pool, app_snapshots, setup_profile),
+                                          name="worker_{}".format(emulator_name))
+        process.start()
+        processes[emulator_name] = process
+
+    # each worker takes the next app when it is free, the static pipeline of a worker can take some more apps (not
+    # when autoscaling: every app in flight is an emulator running)
+    autoscaler = Autoscaler(min_workers, len(pool_emulators)) if autoscale else None
+    try:
+        dispatch_apps(scheduler, queue_apps, queue_results, processes, len(pool_emulators) * (static_workers + 2),
+                      intake, autoscaler)
+    except KeyboardInterrupt:
+        logger.info("Analysis interrupted, wait for the workers")
+    for _ in pool_emulators:
+        queue_apps.put(None)
+
+    # merge the stats of all the workers in a single report, a worker killed sends no stats
+    workers_left = set(processes)
+    while workers_left:
+        stopped = [emulator_name for emulator_name in workers_left if not processes[emulator_name].is_alive()]
         try:
+            emulator_name, worker_stats, worker_count = queue_stats.get(timeout=1)
+        except queue.Empty:
+            for emulator_name in stopped:
+                logger.error("Worker of emulator {} killed (exit code {}), its stats are lost".format(
+                    emulator_name, processes[emulator_name].exitcode))
+                workers_left.discard(emulator_name)
+            continue
+        workers_left.discard(emulator_name)
+        if worker_stats is not None:
+            stats.merge(worker_stats)
+        count += worker_count
+    for process in processes.values():
+        process.join()
+    if not warm_pool:
+        stop_emulators_left([emulator_name for emulator_name, _ in pool_emulators])
+
+    log_analysis_file, log_permission_file, log_trackers_file = get_stats_files(str(num_log))
+    stats.write_on_file(log_analysis_file, count)
+    stats.write_stats_permissions(log_permission_file)
+    stats.write_stats_trackers(log_trackers_file)
 
-            dict_analysis_app["md5"] = md5_app
-            apk_object = APK(app)
-            dict_analysis_app["package_name"] = apk_object.get_package()
-
-            if not check_app_already_analyzed_md5(md5_app) or tentative > 0:
-
-                logger.info("3PDroid start Analysis {}".format(app))
-                write_package_name_and_md5(apk_object.get_package(), md5_app,
-                                           os.path.join(os.getcwd(), "logs", "package_md5.txt"))
-                # start emulator
-                r_start_emulator = requests.get("{}/start/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-                # if the emulator star ok
-                if r_start_emulator.status_code == 200:
-                    # get trackers libraries and list permissions
-                    logger.info("Start emulator ok")
-                    logger.info("Get application information")
-                    app_trackers, app_permissions_list, api_to_monitoring_trackers, application, dict_analysis_app = app_analyzer. \
-                        analyze_apk_androguard(app, md5_app, dict_analysis_app)
-                    # get permissions privacy relevant
-                    logger.info("Package name {}".format(application.get_package()))
-                    dict_analysis_app["package_name"] = application.get_package()
-                    logger.info("MD5 {}".format(md5_app))
-
-                    logger.info("Get permission-api mapping")
-                    permissions_api_mapping = app_analyzer.get_api_related_to_permission_privacy_relevant()
-                    logger.info("Creation list api to be monitored during dynamic analysis")
-                    list_api_to_monitoring = app_analyzer.create_list_api_to_monitoring_from_file(
-                        permissions_api_mapping,
-                        app_permissions_list,
-                        app_trackers)
-
-                    # if API == 0 --> app is cleaned
-                    if len(list_api_to_monitoring) == 0:
-                        logger.info("Application does not need privacy policy page, "
-                                    "close the emulator and "
-                                    "pass to the next application")
-                        # write on file
-                        file_name = md5_app
-                        dir_result = os.path.join(os.getcwd(), "logs", file_name)
-                        dict_analysis_app["dynamic_analysis_needed"] = False
-                        with open(os.path.join(dir_result, "{}.json".format(file_name)), "w") as json_file:
-                            json.dump(dict_analysis_app, json_file, indent=4)
-
-                        count += 1
-                        r_stop_emulator = requests.get("{}/stop/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-                        # UPDATE STATS
-                        logger.info("Update stats")
-                        stats.update_stats_permission(app_permissions_list)
-                        stats.update_stats_trackers(app_trackers)
-                        stats.add_app_cleaned()
-                        # STORE INFORMATION
-                        logger.info(stats.stats_trackers)
-                        logger.info(stats.stats_permission)
-                        # write on file
-                        stats.write_on_file(log_analysis_file, count)
-                        stats.write_stats_permissions(log_permission_file)
-                        stats.write_stats_trackers(log_trackers_file)
-                        shutil.move(app, os.path.join(os.getcwd(), "apps_analyzed"))
-                        continue
-
-                    # APP should be analyzed in a dynamic way
-                    logger.info("Number of APIs to monitoring: {}".format(len(list_api_to_monitoring)))
-                    file_name = md5_app
-                    dir_result = os.path.join(os.getcwd(), "logs", file_name)
-                    dict_analysis_app["api_to_monitoring_all"] = len(list_api_to_monitoring)
-                    with open(os.path.join(dir_result, "{}.json".format(file_name)), "w") as json_file:
-                        json.dump(dict_analysis_app, json_file, indent=4)
-                    # disable verify installer and set correct time
-                    time.sleep(5)
-                    logger.info("Set correct time on emulator")
-                    adb = ADB()
-                    adb.kill_server()
-                    adb.connect()
-                    time.sleep(2)
-                    try:
-                        command_settings_verify = ["settings put global verifier_verify_adb_installs 0"]
-                        adb.shell(command_settings_verify)
-                        date_command = ['su 0 date {0}; am broadcast -a android.intent.action.TIME_SET'.
-                                            format(time.strftime('%m%d%H%M%Y.%S'))]
-                        adb.shell(date_command)
-                    except Exception as e:
-                        logger.error("Exception as e {}, restart and re-connect to emulator".format(e))
-                        adb.kill_server()
-                        adb.connect()
-                        command_settings_verify = ["settings put global verifier_verify_adb_installs 0"]
-                        adb.shell(command_settings_verify)
-                        date_command = ['su 0 date {0}; am broadcast -a android.intent.action.TIME_SET'.
-                                            format(time.strftime('%m%d%H%M%Y.%S'))]
-                        adb.shell(date_command)
-
-                    dir_hook_file = os.path.join(os.getcwd(), "hook", md5_app)
-                    logger.info("Creation hook dir frida")
-
-                    if not os.path.exists(dir_hook_file):
-                        os.makedirs(dir_hook_file)
-                    hook_is_created = app_analyzer.create_api_list_frida(list_api_to_monitoring,
-                                                                         os.path.join(dir_hook_file, "frida_api.txt"))
-                    frida_monitoring.push_and_start_frida_server(adb)
-                    frida_monitoring.set_file_log_frida(os.path.join(os.getcwd(), "logs",
-                                                                     md5_app, "monitoring_api_{}.json".format(md5_app)))
-
-                    frida_monitoring.clean_list_json_api_invoked()
-                    signal.signal(signal.SIGALRM, handler_timeout)
-                    signal.alarm(MAX_TIME_ANALYSIS)
-                    result_app, dict_analysis_app = dynamic_testing_environment.start_analysis(type_analysis=type,
-                                                                                               app=app,
-                                                                                               max_actions=max_actions,
-                                                                                               timeout_privacy=timeout_privacy,
-                                                                                               pdetector=pdetector,
-                                                                                               md5_app=md5_app,
-                                                                                               frida_monitoring=frida_monitoring,
-                                                                                               dict_analysis_app=dict_analysis_app)
-
-                    # END DYNAMIC ANALYSIS NOW STORE DATA
-                    result_directory = os.path.join(os.getcwd(), "logs", md5_app)
-                    if not os.path.exists(result_directory):
-                        os.makedirs(result_directory)
-
-                    logger.info("Analysis api invoked during dynamic analysis")
-                    # Get API Invoked
-                    list_json_api_invoked = frida_monitoring.get_list_api_invoked()
-                    # set_list_json_api_invoked = list(set(list_json_api_invoked))
-                    logger.info("Api invoked during dynamic analysis {}".format(len(list_json_api_invoked)))
-
-                    # store on json file the api invoked
-                    if len(list_json_api_invoked) > 0:
-                        file_log_frida = frida_monitoring.get_file_log_frida()
-                        with open(file_log_frida, "w") as outfile_api:
-                            json.dump(list_json_api_invoked, outfile_api, indent=4)
-
-                    # Action not needed
-                    # DETECT IF THE APP IS COMPLIANT OR NOT WITH GOOGLE PLAY STORE
-                    app_is_compliant = result_app.detected and not (result_app.back_button_change_page or
-                                                                    result_app.home_button_change_page or
-                                                                    len(list_json_api_invoked) > 0
-                                                                    )
-
-                    dict_analysis_app["api_invoked_during_dynamic_analysis"] = len(list_json_api_invoked)
-                    if app_is_compliant:
-                        stats.add_app_compliant()
-                    else:
-                        stats.add_app_not_compliant()
-                    dict_analysis_app["app_is_compliant_with_google_play_store"] = app_is_compliant
-                    dict_analysis_app["app_analyzed"] = True
-                    dict_analysis_app["num_tentative"] = tentative + 1
-
-                    write_json_file_log(md5_app, dict_analysis_app)
-
-                    stats.add_api_privacy_relevant_invoked(len(list_json_api_invoked))
-
-                    # r_reset_emulator = requests.get("{}/reset/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-                    r_stop_emulator = requests.get("{}/stop/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-
-                    # UPDATE stats analysis
-                    logger.info("Update stats")
-                    stats.list_max_actions.append(result_app.max_actions)
-                    stats.update_value_dynamic_analysis(result_app)
-                    stats.update_stats_permission(app_permissions_list)
-                    stats.update_stats_trackers(app_trackers)
-
-                    # debug
-                    logger.info(stats.stats_trackers)
-                    logger.info(stats.stats_permission)
-
-                    # write on file
-                    count += 1
-                    tentative = 0
-
-                    stats.write_on_file(log_analysis_file, count)
-                    stats.write_stats_permissions(log_permission_file)
-                    stats.write_stats_trackers(log_trackers_file)
-                    logger.info("End update stats")
-                    logger.info("3PDroid end analysis")
-                    str_end_file = "*" * 20
-                    logger.info("{}\n\n".format(str_end_file))
-                    shutil.move(app, os.path.join(os.getcwd(), "apps_analyzed"))
-                    
-                else:
-
-                    tentative += 1
-                    if tentative < MAX_TENTATIVE:
-                        logger.error("Unable to start emulator, try again this app")
-                        str_end_file = "*" * 20
-                        logger.info("{}\n\n".format(str_end_file))
-                        r_stop_emulator = requests.get("{}/stop/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-                    else:
-                        tentative = 0
-                        count += 1
-                        r_stop_emulator = requests.get("{}/stop/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-                        stats.add_app_not_analyzed()
-                        dict_analysis_app["app_analyzed"] = False
-                        write_json_file_log(md5_app, dict_analysis_app)
-                        logger.error("Unable to start emulator, pass to next app")
-                        str_end_file = "*" * 20
-                        logger.info("{}\n\n".format(str_end_file))
-                        shutil.move(app, os.path.join(os.getcwd(), "apps_analyzed"))
-                        
-
-            else:
-                logger.info("App already analyzed, pass to next app")
-                shutil.move(app, os.path.join(os.getcwd(), "apps_analyzed"))
-                count += 1
-
-        except MyTimeoutExcpetion as e:
-            tentative += 1
-            if tentative < MAX_TENTATIVE:
-                logger.error("Exception stop emulator, Exception: {}".format(e))
-                str_end_file = "*" * 20
-                logger.info("{}\n\n".format(str_end_file))
-                r_stop_emulator = requests.get("{}/stop/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-            else:
-                tentative = 0
-                count += 1
-                r_stop_emulator = requests.get("{}/stop/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-                stats.add_app_not_analyzed()
-                logger.error("Exception stop emulator pass to next apps, Exception: {}".format(e))
-                dict_analysis_app["app_analyzed"] = False
-                write_json_file_log(md5_app, dict_analysis_app)
-                str_end_file = "*" * 20
-                logger.info("{}\n\n".format(str_end_file))
-                shutil.move(app, os.path.join(os.getcwd(), "apps_analyzed"))
-                
-
-        except Exception as e:
-            tentative += 1
-            if tentative < MAX_TENTATIVE:
-                logger.error("Exception stop emulator, Exception: {}".format(e))
-                str_end_file = "*" * 20
-                logger.info("{}\n\n".format(str_end_file))
-                r_stop_emulator = requests.get("{}/stop/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-            else:
-                tentative = 0
-                count += 1
-                r_stop_emulator = requests.get("{}/stop/{}".format(LOCAL_URL_EMULATOR, emulator_name))
-                stats.add_app_not_analyzed()
-                logger.error("Exception stop emulator pass to next apps, Exception: {}".format(e))
-                dict_analysis_app["app_analyzed"] = False
-                write_json_file_log(md5_app, dict_analysis_app)
-                str_end_file = "*" * 20
-                logger.info("{}\n\n".format(str_end_file))
-                shutil.move(app, os.path.join(os.getcwd(), "apps_analyzed"))
-             
     end = time.time()
     logger.info("\n\n")
-    logger.info("Execution time: {}, mean: {}".format(end - start, (end - start) / count))
-   
+    logger.info("Execution time: {}, mean: {}".format(end - start, (end - start) / max(count, 1)))
 
 
 def get_cmd_args(args: list = None):
@@ -467,16 +435,79 @@ def get_cmd_args(args: list = None):
                         help='Maximum actions (in number of events) for the app stimulation')
     parser.add_argument('-d', '--dir-app', type=str, metavar='DIR', default=os.path.join(os.getcwd(), 'apps'),
                         help='The directory where is the apps')
-    parser.add_argument('--type', type=str, metavar='TYPE', default='Droidbot', choices=["random", "Droidbot"],
-                        help="The type of app stimulation ")
+    parser.add_argument('--type', type=str, metavar='TYPE', default='Droidbot',
+                        choices=["random", "Droidbot", TYPE_SIMULATED],
+                        help="The type of app stimulation (simulated: no stimulation, to benchmark the analysis with "
+                             "the fake backend of the emulator manager)")
     parser.add_argument("--emulator-name", type=str, default="AndroidEmulator",
                         help="Name of Android Emulator within Virtual Box")
+    parser.add_argument("--emulators", type=str, metavar="NAME[=SERIAL],...",
+                        help="Comma separated list of emulators analyzing the apps in parallel (one worker each)")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="Number of emulators analyzing the apps in parallel, named <emulator-name>-1 ... "
+                             "<emulator-name>-N")
+    parser.add_argument("--static-workers", type=int, metavar="N", default=0,
+                        help="Number of processes that statically analyze the next apps while the current one is "
+                             "analyzed on the emulator (0 to disable the pipeline)")
+    parser.add_argument("--triage", action="store_true",
+                        help="Statically analyze all the apps in parallel before starting the emulators, only the "
+                             "apps that need the dynamic analysis are analyzed on the emulators")
+    parser.add_argument("--schedule", type=str, choices=ORDERS, default=None,
+                        help="Order of analysis of the apps, by estimated cost: shortest first (sjf, default with one "
+                             "emulator), longest first (ljf, default with more emulators) or directory order (fifo)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run until interrupted, analyzing the new apks as they land in the apps directory "
+                             "(--triage is ignored)")
+    parser.add_argument("--poll-interval", type=float, metavar="SECONDS", default=DEFAULT_POLL_INTERVAL,
+                        help="Seconds between two scans of the apps directory in daemon mode")
+    parser.add_argument("--api", action="store_true",
+                        help="Serve the job API (submit an apk, status of its job and verdict), implies --daemon")
+    parser.add_argument("--api-port", type=int, metavar="PORT", default=job_api_port,
+                        help="Port of the job API")
+    parser.add_argument("--api-host", type=str, metavar="HOST", default=DEFAULT_API_HOST,
+                        help="Address the job API listens on (0.0.0.0 to reach it from other hosts, e.g. from the "
+                             "coordinator)")
+    parser.add_argument("--warm-pool", action="store_true",
+                        help="Take a ready emulator from the warm pool of the emulator manager (started with --pool) "
+                             "for each app, instead of starting and stopping the emulator of the worker")
+    parser.add_argument("--app-snapshots", action="store_true",
+                        help="Snapshot the emulator after the installation of each app, a new tentative of the app "
+                             "restarts from the snapshot (Droidbot only, ignored with --warm-pool)")
+    parser.add_argument("--disable-animations", action="store_true",
+                        help="Disable the animations of the emulator before the analysis of each app")
+    parser.add_argument("--stay-awake", action="store_true",
+                        help="Keep the screen of the emulator on during the analysis")
+    parser.add_argument("--autoscale", action="store_true",
+                        help="Raise or lower the number of workers analyzing apps at the same time (at most one for "
+                             "each emulator) from the cpu load and the free memory of the host")
+    parser.add_argument("--min-workers", type=int, metavar="N", default=1,
+                        help="Minimum number of workers analyzing apps at the same time with --autoscale")
+    parser.add_argument("--triage-workers", type=int, metavar="N", default=None,
+                        help="Number of processes used by the triage (default number of CPUs)")
 
     return parser.parse_args(args)
 
 
 if __name__ == "__main__":
     arguments = get_cmd_args()
-    list_apps = glob.glob(os.path.join(arguments.dir_app, "*.apk"))
-    start_analysis(list_apps, arguments.timeout_privacy, arguments.max_actions,
-                   arguments.type, arguments.emulator_name)
+    api_port = arguments.api_port if arguments.api else None
+    if arguments.daemon or arguments.api:
+        # the apps are taken from the directory as they land
+        list_apps = []
+        intake_watcher = IntakeWatcher(arguments.dir_app, JobLedger(), arguments.poll_interval)
+        arguments.triage = False
+    else:
+        list_apps = glob.glob(os.path.join(arguments.dir_app, "*.apk"))
+        intake_watcher = None
+    setup_profile = get_setup_profile(arguments.disable_animations, arguments.stay_awake)
+    if arguments.emulators or arguments.workers:
+        start_analysis_pool(list_apps, arguments.timeout_privacy, arguments.max_actions, arguments.type,
+                            get_pool_emulators(arguments.emulators, arguments.workers, arguments.emulator_name),
+                            arguments.static_workers, arguments.triage, arguments.triage_workers, arguments.schedule,
+                            intake_watcher, api_port, arguments.warm_pool, arguments.app_snapshots,
+                            arguments.autoscale, arguments.min_workers, setup_profile, arguments.api_host)
+    else:
+        start_analysis(list_apps, arguments.timeout_privacy, arguments.max_actions,
+                       arguments.type, arguments.emulator_name, arguments.static_workers,
+                       arguments.triage, arguments.triage_workers, arguments.schedule, intake_watcher,
+                       api_port, arguments.warm_pool, arguments.app_snapshots, setup_profile, arguments.api_host)
@@ -5,26 +5,47 @@ import logging
 import os
 import re
 import shutil
+import socket
 import subprocess
-import time
 
-from typing import Optional, Union, List
+from typing import Optional, Union, List, Tuple
+
+from adb_client import AdbClient, AdbServerError, AdbServerUnavailable, get_client
+from adb_shell import ShellSession
+from device_properties import DeviceProperties, EVENT_PACKAGES, EVENT_REBOOT, get_device_properties
+
+# The adb commands that restart adbd or the connection to the device: the shell session open is not usable anymore.
+SESSION_RESET_COMMANDS = ['root', 'unroot', 'kill-server', 'reboot', 'connect', 'disconnect']
+# Talk to the adb server through its protocol (shell, push, pull and install) instead of running the adb executable,
+# set ADB_SERVER_PROTOCOL=0 to always use the adb executable.
+USE_SERVER_PROTOCOL = os.environ.get('ADB_SERVER_PROTOCOL', '1') != '0'
 
 
 class ADB(object):
 
-    def __init__(self, device: str = None, debug: bool = False):
+    def __init__(self, device: str = None, debug: bool = False, persistent_shell: bool = True,
+                 use_server_protocol: bool = None):
         """
         Android Debug Bridge (adb) object constructor.
 
         :param device: The name of the Android device (serial number) for which to execute adb commands. Can be
                        omitted if there is only one Android device connected to adb.
         :param debug: When set to True, more debug messages will be shown for each executed operation.
+        :param persistent_shell: When set to True (default), the shell commands run one after another in a single
+                                 long-lived adb shell, instead of a new adb process for each command.
+        :param use_server_protocol: When set to True, the shell commands and the file transfers are sent to the adb
+                                    server through its protocol, the adb executable is used only when the adb server
+                                    is not running. By default True, unless ADB_SERVER_PROTOCOL=0.
         """
 
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
         self._device = device
+        self.persistent_shell = persistent_shell
+        self._shell_session: Optional[ShellSession] = None
+        if use_server_protocol is None:
+            use_server_protocol = USE_SERVER_PROTOCOL
+        self.server_client: Optional[AdbClient] = get_client() if use_server_protocol else None
 
         if debug:
             self.logger.setLevel(logging.DEBUG)
@@ -47,8 +68,56 @@ class ADB(object):
 
     @target_device.setter
     def target_device(self, new_device: str):
+        self.close_shell()
         self._device = new_device
 
+    @property
+    def properties(self) -> DeviceProperties:
+        """
+        The properties of the target device, cached and shared with the other ADB objects of the device.
+        """
+
+        return get_device_properties(self.target_device)
+
+    def get_shell_session(self) -> ShellSession:
+        if self._shell_session is None:
+            adb_command = [self.adb_path]
+            if self.target_device:
+                adb_command.extend(['-s', self.target_device])
+            self._shell_session = ShellSession(adb_command)
+        return self._shell_session
+
+    def close_shell(self) -> None:
+        """
+        Close the shell session (if any), the next shell command opens a new one.
+        """
+
+        if self._shell_session is not None:
+            self._shell_session.close()
+        if self.server_client is not None:
+            self.server_client.forget_device(self.target_device)
+
+    def call_server(self, description: str, operation, *args, timeout: Optional[int] = None):
+        """
+        Run an operation of the adb server client, with the errors of the adb executable.
+
+        :param description: The adb command equivalent to the operation (for the errors).
+        :param operation: The method of the adb server client.
+        :param timeout: The timeout of the operation (for the errors).
+        :return: The result of the operation, None if the adb server is not reachable: the adb executable has to be
+                 used instead (it starts the adb server).
+        """
+
+        try:
+            return operation(*args)
+        except AdbServerUnavailable as e:
+            self.logger.debug('{0}, use the adb executable'.format(e))
+            return None
+        except socket.timeout:
+            raise subprocess.TimeoutExpired(description, timeout)
+        except (AdbServerError, OSError) as e:
+            raise subprocess.CalledProcessError(1, description, str(e).encode())
+
     def is_available(self) -> bool:
         """
         Check if adb executable is available.
@@ -79,6 +148,11 @@ class ADB(object):
         if is_async and timeout:
             raise RuntimeError('The timeout cannot be used when executing the program in background')
 
+        if command and command[0] in SESSION_RESET_COMMANDS:
+            self.close_shell()
+            # The device may have been rebooted or replaced (e.g. an emulator restored from a snapshot).
+            self.properties.notify(EVENT_REBOOT)
+
         try:
             # Use the specified Android device serial number (if any).
             if self.target_device:
@@ -99,9 +173,6 @@ class ADB(object):
                     raise subprocess.CalledProcessError(process.returncode, command, output.encode())
                 self.logger.debug('Command `{0}` successfully returned: {1}'.format(' '.join(command), output))
 
-                # This is needed to make sure the adb command actually terminated before continuing the execution.
-                time.sleep(1)
-
                 return output
         except subprocess.TimeoutExpired as e:
             self.logger.error('Command `{0}` timed out: {1}'.format(
@@ -166,10 +237,93 @@ class ADB(object):
         if not isinstance(command, list) or any(not isinstance(command_token, str) for command_token in command):
             raise TypeError('The command to execute should be passed as a list of strings')
 
+        if not is_async and (self.server_client is not None or self.persistent_shell):
+            return self.execute_shell(command, timeout=timeout)
+
         command.insert(0, 'shell')
 
         return self.execute(command, is_async=is_async, timeout=timeout)
 
+    def run_shell(self, command: List[str], timeout: Optional[int] = None) -> Tuple[str, int]:
+        """
+        Run an adb shell command through the adb server protocol or, if the adb server is not reachable, in the
+        shell session (or with the adb executable).
+
+        :return: The output of the command and its exit code.
+        """
+
+        if self.server_client is not None:
+            result = self.call_server(' '.join(command), self.server_client.shell, self.target_device,
+                                      ' '.join(command), timeout, timeout=timeout)
+            if result is not None:
+                return result
+
+        if self.persistent_shell:
+            return self.get_shell_session().run(command, timeout=timeout)
+
+        try:
+            return self.execute(['shell'] + command, timeout=timeout), 0
+        except subprocess.CalledProcessError as e:
+            return e.output.decode(errors='backslashreplace'), e.returncode
+
+    def execute_shell(self, command: List[str], timeout: Optional[int] = None) -> str:
+        """
+        Execute an adb shell command through the adb server protocol or in the shell session and return the output
+        of the command as a string.
+
+        :param command: The command to execute, formatted as a list of strings.
+        :param timeout: How many seconds to wait for the command to finish execution before throwing an exception.
+        :return: The (string) output of the command.
+        """
+
+        if timeout is not None and (not isinstance(timeout, int) or timeout <= 0):
+            raise ValueError('If a timeout is provided, it must be a positive integer')
+
+        self.logger.debug('Running shell command `{0}` (timeout={1})'.format(' '.join(command), timeout))
+        try:
+            output, exit_code = self.run_shell(command, timeout=timeout)
+            output = output.strip()
+            if exit_code != 0:
+                raise subprocess.CalledProcessError(exit_code, ['shell'] + command, output.encode())
+            self.logger.debug('Shell command `{0}` successfully returned: {1}'.format(' '.join(command), output))
+
+            return output
+        except subprocess.TimeoutExpired as e:
+            self.logger.error('Shell command `{0}` timed out: {1}'.format(
+                ' '.join(command), e.output.decode(errors='backslashreplace') if e.output else e))
+            raise
+        except subprocess.CalledProcessError as e:
+            self.logger.error('Shell command `{0}` exited with error: {1}'.format(
+                ' '.join(command), e.output.decode(errors='backslashreplace') if e.output else e))
+            raise
+        except Exception as e:
+            self.logger.error('Generic error during `{0}` shell command execution: {1}'.format(' '.join(command), e))
+            raise
+
+    def transfer_on_server(self, direction: str, sources: List[str], destination: str,
+                           timeout: Optional[int] = None) -> bool:
+        """
+        Copy the files (push or pull) through the adb server protocol.
+
+        :return: True if the files were copied, False if the adb server is not reachable (or not used).
+        """
+
+        if self.server_client is None:
+            return False
+        operation = self.server_client.push if direction == 'push' else self.server_client.pull
+        for source in sources:
+            description = '{0} {1} {2}'.format(direction, source, destination)
+            self.logger.debug('Running `{0}` through the adb server'.format(description))
+            try:
+                if self.call_server(description, operation, self.target_device, source, destination, timeout,
+                                    timeout=timeout) is None:
+                    return False
+            except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
+                self.logger.error('Command `{0}` failed: {1}'.format(description, e.output.decode(
+                    errors='backslashreplace') if e.output else e))
+                raise
+        return True
+
     def get_property(self, property_name: str, timeout: Optional[int] = None) -> str:
         """
         Get the value of a property on the Android device connected through adb.
@@ -179,6 +333,11 @@ class ADB(object):
         :return: The value of the property.
         """
 
+        if property_name.startswith('ro.'):
+            # Read-only properties, they change only when the device is rebooted.
+            return self.properties.get('prop:{0}'.format(property_name),
+                                       lambda: self.shell(['getprop', property_name], timeout=timeout))
+
         return self.shell(['getprop', property_name], timeout=timeout)
 
     def get_device_sdk_version(self, timeout: Optional[int] = None) -> int:
@@ -281,6 +440,10 @@ class ADB(object):
             raise FileNotFoundError('Cannot copy "{0}" to the Android device: no such file or directory'
                                     .format(host_path))
 
+        host_paths = host_path if isinstance(host_path, list) else [host_path]
+        if self.transfer_on_server('push', host_paths, device_path, timeout):
+            return '{0} file{1} pushed.'.format(len(host_paths), 's' if len(host_paths) > 1 else '')
+
         push_cmd = ['push']
         if isinstance(host_path, list):
             push_cmd.extend(host_path)
@@ -322,6 +485,10 @@ class ADB(object):
             raise NotADirectoryError('The destination host directory "{0}" was not found'
                                      .format(os.path.dirname(host_path)))
 
+        device_paths = device_path if isinstance(device_path, list) else [device_path]
+        if self.transfer_on_server('pull', device_paths, host_path, timeout):
+            return '{0} file{1} pulled.'.format(len(device_paths), 's' if len(device_paths) > 1 else '')
+
         pull_cmd = ['pull']
         if isinstance(device_path, list):
             pull_cmd.extend(device_path)
@@ -367,7 +534,15 @@ class ADB(object):
 
         install_cmd.append(apk_path)
 
-        output = self.execute(install_cmd, timeout=timeout)
+        output = None
+        try:
+            if self.server_client is not None:
+                output = self.call_server(' '.join(install_cmd), self.server_client.install, self.target_device,
+                                          apk_path, install_cmd[1:-1], timeout, timeout=timeout)
+            if output is None:
+                output = self.execute(install_cmd, timeout=timeout)
+        finally:
+            self.properties.notify(EVENT_PACKAGES)
 
         # Make sure the install operation ended successfully. Complete list of error messages:
         # https://android.googlesource.com/platform/frameworks/base/+/lollipop-release/core/java/android/content/pm/PackageManager.java
@@ -388,7 +563,10 @@ class ADB(object):
 
         uninstall_cmd = ['uninstall', package_name]
 
-        output = self.execute(uninstall_cmd, timeout=timeout)
+        try:
+            output = self.execute(uninstall_cmd, timeout=timeout)
+        finally:
+            self.properties.notify(EVENT_PACKAGES)
 
         # Make sure the uninstall operation ended successfully. Complete list of error messages:
         # https://android.googlesource.com/platform/frameworks/base/+/lollipop-release/core/java/android/content/pm/PackageManager.java
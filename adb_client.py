@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import logging
+import os
+import socket
+import stat
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+# Address of the local adb server (the port can be changed as for the adb executable).
+ADB_SERVER_HOST = '127.0.0.1'
+ADB_SERVER_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', 5037))
+# Seconds to connect to the adb server, and to wait for a command run without a timeout.
+CONNECT_TIMEOUT = 5
+DEFAULT_TIMEOUT = 600
+# Idle sync connections kept open for each device, and maximum size of a DATA packet of the sync protocol.
+POOL_SIZE = 4
+SYNC_DATA_MAX = 64 * 1024
+# Packets of the shell protocol (v2): the output of the command, its exit code.
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+
+
+class AdbServerError(RuntimeError):
+    """
+    The adb server refused the request (e.g. device not found or offline) or the connection was closed.
+    """
+    pass
+
+
+class AdbConnectionClosed(AdbServerError):
+    """
+    The adb server closed the connection (e.g. the device was disconnected).
+    """
+    pass
+
+
+class AdbServerUnavailable(AdbServerError):
+    """
+    The adb server is not running (or not reachable): the adb executable has to be used instead.
+    """
+    pass
+
+
+class AdbConnection(object):
+    """
+    A connection to the adb server, speaking its smart-socket protocol: every request is a string prefixed by its
+    length (4 hex digits), the server answers OKAY or FAIL followed by the error message.
+    """
+
+    def __init__(self, host: str = ADB_SERVER_HOST, port: int = ADB_SERVER_PORT):
+        try:
+            self.socket = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+        except OSError as e:
+            raise AdbServerUnavailable('Unable to connect to the adb server on {0}:{1}: {2}'.format(host, port, e))
+
+    def set_timeout(self, timeout: Optional[float]):
+        self.socket.settimeout(timeout)
+
+    def close(self):
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+
+    def send_request(self, request: str):
+        data = request.encode()
+        self.socket.sendall('{0:04x}'.format(len(data)).encode() + data)
+        self.read_status(request)
+
+    def read_status(self, request: str):
+        status = self.read_exactly(4)
+        if status == b'FAIL':
+            raise AdbServerError('Request `{0}` failed: {1}'.format(request, self.read_string()))
+        if status != b'OKAY':
+            raise AdbServerError('Unexpected response to request `{0}`: {1}'.format(request, status))
+
+    def read_string(self) -> str:
+        length = int(self.read_exactly(4), 16)
+        return self.read_exactly(length).decode(errors='backslashreplace')
+
+    def read_exactly(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                raise AdbConnectionClosed('Connection closed by the adb server')
+            data += chunk
+        return data
+
+    def read_all(self) -> bytes:
+        chunks = []
+        while True:
+            chunk = self.socket.recv(SYNC_DATA_MAX)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    # Sync protocol: every packet is an id (4 bytes) and a length (or a value, 32 bit little-endian).
+    def send_sync(self, packet_id: bytes, data: bytes = b'', length: int = None):
+        self.socket.sendall(packet_id + struct.pack('<I', len(data) if length is None else length) + data)
+
+    def read_sync(self) -> Tuple[bytes, int]:
+        header = self.read_exactly(8)
+        return header[:4], struct.unpack('<I', header[4:])[0]
+
+
+class AdbClient(object):
+    """
+    Client of the local adb server, used instead of a new adb process for each command. The shell commands use the
+    shell protocol (v2) when the device supports it, to get the exit code of the command. The sync connections
+    (push, pull, stat) stay open after use, a few for each device, and are taken again by the next transfers: the
+    other services consume their connection.
+    """
+
+    def __init__(self, host: str = ADB_SERVER_HOST, port: int = ADB_SERVER_PORT):
+        self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
+        self.host = host
+        self.port = port
+        self.sync_pool = {}
+        self.features = {}
+        self.lock = threading.Lock()
+
+    def connect(self, serial: Optional[str] = None) -> AdbConnection:
+        """
+        A new connection to the adb server, switched to the device (any device if serial is None).
+        """
+        connection = AdbConnection(self.host, self.port)
+        try:
+            connection.send_request('host:transport:{0}'.format(serial) if serial else 'host:transport-any')
+        except (OSError, AdbServerError):
+            connection.close()
+            raise
+        return connection
+
+    def host_request(self, request: str) -> str:
+        connection = AdbConnection(self.host, self.port)
+        try:
+            connection.send_request(request)
+            return connection.read_string()
+        finally:
+            connection.close()
+
+    def version(self) -> int:
+        return int(self.host_request('host:version'), 16)
+
+    def devices(self) -> List[Tuple[str, str]]:
+        """
+        The serial and the state (device, offline, unauthorized...) of the devices connected to the adb server.
+        """
+        return [tuple(line.split('\t', 1)) for line in self.host_request('host:devices').splitlines() if '\t' in line]
+
+    def get_features(self, serial: Optional[str]) -> List[str]:
+        with self.lock:
+            if serial in self.features:
+                return self.features[serial]
+        request = 'host-serial:{0}:features'.format(serial) if serial else 'host:features'
+        features = self.host_request(request).split(',')
+        with self.lock:
+            self.features[serial] = features
+        return features
+
+    def forget_device(self, serial: Optional[str]):
+        """
+        Close the pooled connections of the device and forget its features (e.g. adbd restarted as root).
+        """
+        with self.lock:
+            self.features.pop(serial, None)
+            connections = self.sync_pool.pop(serial, [])
+        for connection in connections:
+            connection.close()
+
+    def shell(self, serial: Optional[str], command: str, timeout: Optional[float] = None) -> Tuple[str, int]:
+        """
+        Run a shell command on the device.
+
+        :param serial: The serial of the device (any device if None).
+        :param command: The command line to execute.
+        :param timeout: How many seconds to wait for the command to finish execution before throwing an exception.
+        :return: The output (standard output and error) of the command and its exit code.
+        :raise socket.timeout: The command did not finish in time.
+        """
+        deadline = time.time() + (timeout if timeout else DEFAULT_TIMEOUT)
+        shell_v2 = 'shell_v2' in self.get_features(serial)
+        connection = self.connect(serial)
+        try:
+            connection.set_timeout(max(deadline - time.time(), 0.001))
+            if not shell_v2:
+                # the legacy shell service closes the connection at the end, without the exit code
+                connection.send_request('shell:{{ {0}\n}} 2>&1; printf "\\n%d\\n" "$?"'.format(command))
+                output = connection.read_all().decode(errors='backslashreplace').replace('\r\n', '\n')
+                output, _, exit_code = output.rstrip('\n').rpartition('\n')
+                return output, int(exit_code) if exit_code.lstrip('-').isdigit() else 0
+            connection.send_request('shell,v2,raw:{0}'.format(command))
+            output = []
+            while True:
+                connection.set_timeout(max(deadline - time.time(), 0.001))
+                header = connection.read_exactly(5)
+                packet_id, length = header[0], struct.unpack('<I', header[1:])[0]
+                data = connection.read_exactly(length)
+                if packet_id in (SHELL_STDOUT, SHELL_STDERR):
+                    output.append(data)
+                elif packet_id == SHELL_EXIT:
+                    return b''.join(output).decode(errors='backslashreplace'), data[0]
+        finally:
+            connection.close()
+
+    @contextmanager
+    def sync(self, serial: Optional[str], timeout: Optional[float] = None):
+        """
+        A sync connection to the device, taken from the pool (or opened) and given back to the pool after use. The
+        timeout (seconds) bounds every read and write of the connection.
+        """
+        with self.lock:
+            connections = self.sync_pool.get(serial, [])
+            connection = connections.pop() if connections else None
+        if connection is None:
+            connection = self.connect(serial)
+            connection.send_request('sync:')
+        try:
+            connection.set_timeout(timeout if timeout else DEFAULT_TIMEOUT)
+            yield connection
+        except BaseException:
+            # the state of the connection is unknown, it is not used again
+            connection.close()
+            raise
+        with self.lock:
+            connections = self.sync_pool.setdefault(serial, [])
+            if len(connections) < POOL_SIZE:
+                connections.append(connection)
+                connection = None
+        if connection is not None:
+            connection.send_sync(b'QUIT')
+            connection.close()
+
+    def run_sync(self, serial: Optional[str], operation, timeout: Optional[float] = None):
+        """
+        Run the sync operation (a function of the connection): a pooled connection closed in the meantime (e.g. the
+        device was restarted) is replaced by a new one.
+        """
+        try:
+            with self.sync(serial, timeout) as connection:
+                return operation(connection)
+        except (ConnectionError, AdbConnectionClosed) as e:
+            self.logger.debug('Sync connection of {0} lost ({1}), reconnect'.format(serial, e))
+            self.forget_device(serial)
+            with self.sync(serial, timeout) as connection:
+                return operation(connection)
+
+    @staticmethod
+    def read_sync_error(connection: AdbConnection, length: int) -> str:
+        return connection.read_exactly(length).decode(errors='backslashreplace')
+
+    def stat(self, serial: Optional[str], device_path: str) -> Tuple[int, int, int]:
+        """
+        Mode, size and modification time of a file on the device (all 0 if it does not exist).
+        """
+        def stat_file(connection: AdbConnection):
+            connection.send_sync(b'STAT', device_path.encode())
+            packet_id, mode = connection.read_sync()
+            size, mtime = struct.unpack('<II', connection.read_exactly(8))
+            if packet_id != b'STAT':
+                raise AdbServerError('Unexpected response to stat of {0}: {1}'.format(device_path, packet_id))
+            return mode, size, mtime
+
+        return self.run_sync(serial, stat_file)
+
+    def push(self, serial: Optional[str], host_path: str, device_path: str, timeout: Optional[float] = None) -> int:
+        """
+        Copy a file to the device, into device_path if it is a directory. Returns the bytes copied.
+        """
+        if stat.S_ISDIR(self.stat(serial, device_path)[0]):
+            device_path = '{0}/{1}'.format(device_path.rstrip('/'), os.path.basename(host_path))
+        host_stat = os.stat(host_path)
+
+        def push_file(connection: AdbConnection):
+            connection.send_sync(b'SEND', '{0},{1}'.format(device_path, stat.S_IFREG | stat.S_IMODE(
+                host_stat.st_mode)).encode())
+            with open(host_path, 'rb') as host_file:
+                for data in iter(lambda: host_file.read(SYNC_DATA_MAX), b''):
+                    connection.send_sync(b'DATA', data)
+            connection.send_sync(b'DONE', length=int(host_stat.st_mtime))
+            packet_id, length = connection.read_sync()
+            if packet_id == b'FAIL':
+                raise AdbServerError('Push of {0} failed: {1}'.format(host_path, self.read_sync_error(connection,
+                                                                                                       length)))
+            if packet_id != b'OKAY':
+                raise AdbServerError('Unexpected response to push of {0}: {1}'.format(host_path, packet_id))
+            return host_stat.st_size
+
+        return self.run_sync(serial, push_file, timeout)
+
+    def pull(self, serial: Optional[str], device_path: str, host_path: str, timeout: Optional[float] = None) -> int:
+        """
+        Copy a file from the device, into host_path if it is a directory. Returns the bytes copied.
+        """
+        if os.path.isdir(host_path):
+            host_path = os.path.join(host_path, os.path.basename(device_path.rstrip('/')))
+
+        def pull_file(connection: AdbConnection):
+            connection.send_sync(b'RECV', device_path.encode())
+            size = 0
+            with open(host_path, 'wb') as host_file:
+                while True:
+                    packet_id, length = connection.read_sync()
+                    if packet_id == b'DATA':
+                        host_file.write(connection.read_exactly(length))
+                        size += length
+                    elif packet_id == b'DONE':
+                        return size
+                    elif packet_id == b'FAIL':
+                        raise AdbServerError('Pull of {0} failed: {1}'.format(
+                            device_path, self.read_sync_error(connection, length)))
+                    else:
+                        raise AdbServerError('Unexpected response to pull of {0}: {1}'.format(device_path,
+                                                                                              packet_id))
+
+        try:
+            return self.run_sync(serial, pull_file, timeout)
+        except BaseException:
+            if os.path.isfile(host_path):
+                os.remove(host_path)
+            raise
+
+    def install(self, serial: Optional[str], apk_path: str, install_options: List[str] = None,
+                timeout: Optional[float] = None) -> str:
+        """
+        Install an app as the adb executable does on the old devices: the apk is copied in /data/local/tmp and
+        installed by the package manager. Returns the output of the package manager.
+        """
+        device_path = '/data/local/tmp/{0}'.format(os.path.basename(apk_path).replace(' ', '_'))
+        self.push(serial, apk_path, device_path, timeout)
+        try:
+            output, _ = self.shell(serial, ' '.join(['pm', 'install'] + (install_options or []) +
+                                                    ["'{0}'".format(device_path)]), timeout=timeout)
+        finally:
+            self.shell(serial, "rm -f '{0}'".format(device_path))
+        return output.strip()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(host: str = ADB_SERVER_HOST, port: int = ADB_SERVER_PORT) -> AdbClient:
+    """
+    The client of the adb server shared by all the ADB objects of the process (and their pooled connections).
+    """
+    with _clients_lock:
+        if (host, port) not in _clients:
+            _clients[(host, port)] = AdbClient(host, port)
+        return _clients[(host, port)]
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import logging
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+# Seconds to wait for a command run without a timeout: the shell never answers (e.g. a quote left open swallows
+# the end marker), the session is closed instead of blocking forever.
+DEFAULT_TIMEOUT = 600
+# Size of the chunks read from the output of the shell.
+READ_SIZE = 65536
+
+
+class ShellSessionError(ConnectionError):
+    """
+    The shell session was closed (e.g. adbd restarted or the emulator was stopped) while running a command.
+    """
+    pass
+
+
+class ShellSession(object):
+    """
+    A long-lived `adb shell` running the shell commands one after another, instead of a new adb process for each
+    command. Every command is followed by an end marker with its exit code, so its output is read up to the marker
+    without waiting for the process to terminate. A session closed (or timed out) is started again by the next
+    command.
+    """
+
+    def __init__(self, adb_command: List[str]):
+        """
+        :param adb_command: The adb executable and its options (e.g. ['adb', '-s', 'emulator-5554']).
+        """
+        self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
+        self.adb_command = list(adb_command)
+        self.token = uuid.uuid4().hex[:12]
+        self.count = 0
+        self.process = None
+        self.output = None
+        self.lock = threading.Lock()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def open(self):
+        self.close()
+        self.logger.debug('Open shell session `{0}`'.format(' '.join(self.adb_command + ['shell'])))
+        self.process = subprocess.Popen(self.adb_command + ['shell'], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.output = queue.Queue()
+        threading.Thread(target=self.read_output, args=(self.process, self.output), daemon=True).start()
+
+    @staticmethod
+    def read_output(process: subprocess.Popen, output: queue.Queue):
+        # a thread for each session, so a command can wait for its output with a timeout on every platform
+        fd = process.stdout.fileno()
+        while True:
+            try:
+                chunk = os.read(fd, READ_SIZE)
+            except OSError:
+                chunk = b''
+            if not chunk:
+                # closed here and not by close(): the number of a descriptor closed while this thread is still
+                # reading it can be given to the pipe of the next session, whose output would be read here
+                process.stdout.close()
+                output.put(None)
+                return
+            output.put(chunk)
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        if self.process.poll() is None:
+            self.process.kill()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        self.process = None
+
+    def send(self, command: str, marker: str):
+        # the group reads from /dev/null, a command reading its input does not take the next commands
+        self.process.stdin.write('{{ {0}\n}} </dev/null 2>&1; printf "\\n%s %d\\n" {1} "$?"\n'
+                                 .format(command, marker).encode())
+        self.process.stdin.flush()
+
+    def run(self, command: List[str], timeout: Optional[float] = None) -> Tuple[str, int]:
+        """
+        Run a shell command in the session (started if needed).
+
+        :param command: The command to execute, formatted as a list of strings (joined with spaces, as adb shell
+                        does).
+        :param timeout: How many seconds to wait for the command to finish execution before throwing an exception.
+        :return: The (string) output of the command and its exit code.
+        :raise subprocess.TimeoutExpired: The command did not finish in time, the session is closed.
+        :raise ShellSessionError: The session was closed while running the command.
+        """
+        command_line = ' '.join(command)
+        timeout = timeout if timeout else DEFAULT_TIMEOUT
+        with self.lock:
+            self.count += 1
+            marker = '__ADB_SHELL_{0}_{1}__'.format(self.token, self.count)
+            # a shell without the shell protocol v2 runs in a pty, that ends the lines with \r\n
+            end_re = re.compile(b'\r?\n' + marker.encode() + b' (-?\\d+)\r?\n')
+            try:
+                if not self.is_alive():
+                    self.open()
+                self.send(command_line, marker)
+            except OSError:
+                # the session was closed before the command was sent, a new session can run it
+                self.logger.warning('Shell session closed, reconnect')
+                self.open()
+                self.send(command_line, marker)
+
+            deadline = time.time() + timeout
+            buffer = b''
+            while True:
+                try:
+                    chunk = self.output.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    self.close()
+                    raise subprocess.TimeoutExpired(command_line, timeout, output=buffer)
+                if chunk is None:
+                    self.close()
+                    raise ShellSessionError('Shell session closed while running `{0}`: {1}'.format(
+                        command_line, buffer.decode(errors='backslashreplace')))
+                start = max(len(buffer) - len(marker) - 32, 0)
+                buffer += chunk
+                match = end_re.search(buffer, start)
+                if match:
+                    return buffer[:match.start()].decode(errors='backslashreplace'), int(match.group(1))
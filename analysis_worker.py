@@ -0,0 +1,554 @@
+import dynamic_testing_environment
+import app_analyzer
+import spans
+import glob
+import os
+import re
+import logging
+from stats import Statistic
+import time
+from adb import ADB
+from frida_monitoring import FridaMonitoring
+from static_pipeline import StaticAnalysisPipeline
+from parsed_apk import ParsedApk
+from job_ledger import JobLedger, STATE_DYNAMIC, STATE_FAILED, STATE_DONE
+from deadline import Watchdog
+from device_setup import prepare_device, DEFAULT_PROFILE, RESUME_PROFILE
+from emulator_client import EmulatorManagerClient, EmulatorManagerError
+from emulator_backend import APP_SNAPSHOT_PREFIX
+from host_resources import vm_memory_mb, wait_for_headroom, HeadroomError
+from p3detector.prediction_model import PredictionModel
+import json
+import hashlib
+import sys
+
+
+# Seconds to wait for an emulator of the warm pool of the emulator manager.
+ACQUIRE_TIMEOUT = 600
+# Seconds to wait for the emulator started to be ready (boot completed, package manager and network available).
+READY_TIMEOUT = 90
+MAX_TENTATIVE = 2
+# Budget (in seconds) of each phase of the dynamic analysis, the compliance check of the timeout mechanism waits for
+# timeout_privacy seconds more. The whole dynamic analysis is bounded by MAX_TIME_ANALYSIS.
+MAX_TIME_ANALYSIS = 900
+PHASE_BUDGETS = {
+    "analysis": MAX_TIME_ANALYSIS,
+    # the setup installs the app as well (Droidbot), while the frida server is pushed and started
+    "setup": 300,
+    "install": 180,
+    "frida_attach": 60,
+    "exploration": 300,
+    "timeout_check": 60,
+    "home_check": 60,
+    "back_check": 90
+}
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+
+def md5(fname):
+    hash_md5 = hashlib.md5()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            hash_md5.update(chunk)
+    return hash_md5.hexdigest()
+
+
+def write_json_file_log(md5_app: str, dict_analysis_app: dict):
+    dir_result = os.path.join(os.getcwd(), "logs", md5_app)
+    if not os.path.exists(dir_result):
+        os.makedirs(dir_result)
+    with open(os.path.join(dir_result, "{}.json".format(md5_app)), "w") as json_file:
+        json.dump(dict_analysis_app, json_file, indent=4)
+
+
+def get_num_log():
+    """
+    Number of analysis already stored within logs dir (the per-emulator logs of a pool are not counted).
+    """
+    log_analysis_re = re.compile(r'log_analysis_\d+\.json$')
+    return len([log_file for log_file in glob.glob(os.path.join(os.getcwd(), "logs", "log_analysis_*"))
+                if log_analysis_re.search(log_file)])
+
+
+def get_stats_files(log_id: str):
+    """
+    Returns the paths of the analysis, permissions and trackers stats files with the given id
+    """
+    return (os.path.join(os.getcwd(), "logs", "log_analysis_{}.json".format(log_id)),
+            os.path.join(os.getcwd(), "logs", "permissions_stats_{}.json".format(log_id)),
+            os.path.join(os.getcwd(), "logs", "tracker_stats_{}.json".format(log_id)))
+
+
+def update_dict_static_result(dict_analysis_app: dict, static_result: dict):
+    dict_analysis_app["package_name"] = static_result["package_name"]
+    dict_analysis_app["permission_requested"] = static_result["permission_requested"]
+    dict_analysis_app["trackers_inside"] = static_result["trackers_inside"]
+    dict_analysis_app["execution_time_app_analyzer"] = static_result["execution_time_app_analyzer"]
+
+
+def store_app_cleaned(md5_app: str, dict_analysis_app: dict, static_result: dict, stats: Statistic,
+                      ledger: JobLedger):
+    """
+    Write the verdict of an app that does not need the dynamic analysis (no API to monitoring) and update the stats
+    """
+    dict_analysis_app["dynamic_analysis_needed"] = False
+    write_json_file_log(md5_app, dict_analysis_app)
+    ledger.finish(md5_app, dict_analysis_app, STATE_DONE, static_time=static_result["execution_time_app_analyzer"])
+    logger.info("Update stats")
+    stats.update_stats_permission(static_result["permission_requested"])
+    stats.update_stats_trackers(static_result["trackers_inside"])
+    stats.add_app_cleaned()
+
+
+class AnalysisWorker(object):
+    """
+    Analyze apps one at a time on a single emulator. Every worker owns its adb serial, frida session and stats
+    files, so more workers (one for each emulator) can run side by side. The state of every app is kept in the job
+    ledger, shared by all the workers.
+    """
+
+    def __init__(self, emulator_name: str, type_analysis: str, timeout_privacy: int, max_actions: int,
+                 log_id: str, device_serial: str = None, pdetector: PredictionModel = None, static_workers: int = 0,
+                 ledger_path: str = None, warm_pool: bool = False, app_snapshots: bool = False,
+                 setup_profile: list = None):
+        self.emulator_name = emulator_name
+        self.device_serial = device_serial
+        self.type_analysis = type_analysis
+        self.timeout_privacy = timeout_privacy
+        self.max_actions = max_actions
+        self.pdetector = pdetector
+        self.static_workers = static_workers
+        # take a ready emulator from the warm pool of the emulator manager for each app, instead of starting one
+        self.warm_pool = warm_pool
+        self.emulator_acquired = None
+        self.emulator_client = EmulatorManagerClient()
+        # snapshot the emulator after the installation of the app, the next tentative restarts from the snapshot
+        # (only with DroidBot and an emulator of its own: with the warm pool the tentatives run on any emulator)
+        self.app_snapshots = app_snapshots and not warm_pool and type_analysis == "Droidbot"
+        # steps of the preparation of the emulator before each app (see device_setup)
+        self.setup_profile = setup_profile if setup_profile is not None else DEFAULT_PROFILE
+
+        self.stats = Statistic(type_analysis)
+        self.count = 0
+        self.frida_monitoring = FridaMonitoring(device_serial)
+        self.ledger_path = ledger_path
+        self.ledger = JobLedger(ledger_path)
+
+        budgets = dict(PHASE_BUDGETS)
+        budgets["timeout_check"] += timeout_privacy
+        budgets["analysis"] += timeout_privacy
+        self.watchdog = Watchdog(budgets, on_abort=self.abort_phase, on_phase=self.set_phase)
+        # md5 of the app in analysis
+        self.md5_app = None
+        self.log_analysis_file, self.log_permission_file, self.log_trackers_file = get_stats_files(log_id)
+
+    def load_model(self):
+        if self.pdetector is None:
+            logger.info("Upload model p3 detector")
+            self.pdetector = PredictionModel()
+            logger.info("P3detector model uploaded")
+
+    def start_emulator(self):
+        if self.warm_pool:
+            return self.acquire_emulator()
+        # a new virtual machine is started only when the memory of the host can hold it
+        if not wait_for_headroom(vm_memory_mb(), "emulator {}".format(self.emulator_name)):
+            raise HeadroomError("Not enough memory to start emulator {}".format(self.emulator_name))
+        with spans.span("emulator_start", emulator=self.emulator_name):
+            return self.emulator_client.start(self.emulator_name)
+
+    def stop_emulator(self, failed: bool = False):
+        """
+        Stop (or give back) the emulator, failed tells the emulator manager that the analysis failed on it.
+        """
+        if self.warm_pool:
+            return self.release_emulator(failed)
+        with spans.span("emulator_stop", emulator=self.emulator_name):
+            response = self.emulator_client.stop(self.emulator_name, failed)
+        if response.status_code not in (200, 409):
+            # 409: the emulator was already stopped (e.g. by the watchdog)
+            logger.warning("Unable to stop emulator {}: {}".format(self.emulator_name, response.message))
+        return response
+
+    def acquire_emulator(self):
+        """
+        Take an emulator of the warm pool, already restored and started: the adb serial of the worker is the one of
+        the emulator acquired.
+        """
+        with spans.span("emulator_acquire") as record:
+            response = self.emulator_client.acquire(ACQUIRE_TIMEOUT)
+            if response.ok:
+                self.emulator_acquired = response.data["emulator"]
+                self.device_serial = response.data["serial"]
+                self.frida_monitoring.device_serial = self.device_serial
+                record["emulator"] = self.emulator_acquired
+                spans.set_context(emulator=self.emulator_acquired)
+                logger.info("Emulator {} ({}) acquired".format(self.emulator_acquired, self.device_serial))
+            return response
+
+    def release_emulator(self, failed: bool = False):
+        """
+        Give back the emulator to the warm pool, that restores and starts it again in background.
+        """
+        emulator_name, self.emulator_acquired = self.emulator_acquired, None
+        if emulator_name is None:
+            return None
+        with spans.span("emulator_release", emulator=emulator_name):
+            response = self.emulator_client.release(emulator_name, failed)
+        if not response.ok:
+            logger.warning("Unable to release emulator {}: {}".format(emulator_name, response.message))
+        return response
+
+    def abort_phase(self, phase: str):
+        """
+        Called by the watchdog when a phase is stuck: the emulator is stopped, so the adb and frida calls of the
+        phase fail and the emulator is free for the next app.
+        """
+        logger.error("Phase {} of the analysis is stuck on emulator {}, stop it".format(phase, self.emulator_name))
+        self.stop_emulator(failed=True)
+
+    def set_phase(self, phase: str):
+        """
+        Store in the job ledger the phase of the app in analysis.
+        """
+        if self.md5_app is not None:
+            self.ledger.set_phase(self.md5_app, phase)
+
+    def connect_adb(self) -> ADB:
+        adb = ADB(device=self.device_serial)
+        self.frida_monitoring.reconnect_adb(adb)
+        return adb
+
+    def wait_ready(self):
+        """
+        Wait until the emulator started is ready to be used, the emulator manager polls it through adb.
+        """
+        emulator_name = self.emulator_acquired if self.emulator_acquired is not None else self.emulator_name
+        with spans.span("emulator_ready", emulator=emulator_name) as record:
+            response = self.emulator_client.wait_ready(emulator_name, READY_TIMEOUT, self.device_serial)
+            if not response.ok:
+                raise RuntimeError("Emulator {} not ready: {}".format(emulator_name, response.message))
+            record["polls"] = response.data["polls"]
+
+    def take_app_snapshot(self, md5_app: str):
+        """
+        Snapshot the emulator with the app installed and the frida server started, restored by the next tentative.
+        A failure does not stop the analysis, the next tentative starts from scratch.
+        """
+        snapshot_name = APP_SNAPSHOT_PREFIX + md5_app
+        try:
+            with spans.span("app_snapshot", emulator=self.emulator_name):
+                response = self.emulator_client.take_snapshot(self.emulator_name, snapshot_name)
+            if response.ok:
+                self.ledger.set_snapshot(md5_app, "{}:{}".format(self.emulator_name, snapshot_name))
+            else:
+                logger.warning("Unable to snapshot emulator {}: {}".format(self.emulator_name, response.message))
+        except Exception as e:
+            logger.warning("Unable to snapshot emulator {}: {}".format(self.emulator_name, e))
+
+    def restore_app_snapshot(self, snapshot: str) -> bool:
+        """
+        Restore the snapshot taken by a previous tentative, False if it is not available on the emulator.
+        """
+        emulator_name, snapshot_name = snapshot.split(":", 1)
+        if not self.app_snapshots or emulator_name != self.emulator_name:
+            return False
+        with spans.span("app_snapshot_restore", emulator=self.emulator_name):
+            response = self.emulator_client.restore(emulator_name, snapshot_name)
+        if not response.ok:
+            logger.warning("Unable to restore snapshot {}: {}".format(snapshot, response.message))
+            return False
+        logger.info("Snapshot {} restored, the app is already installed".format(snapshot))
+        return True
+
+    def delete_app_snapshots(self, md5_app: str, snapshot: str = None):
+        """
+        Delete the snapshots of an app analyzed: the one of a previous tentative (emulator:snapshot) and the one
+        taken by this tentative, if any.
+        """
+        if not self.app_snapshots:
+            return
+        snapshots = {"{}:{}".format(self.emulator_name, APP_SNAPSHOT_PREFIX + md5_app)}
+        if snapshot is not None:
+            snapshots.add(snapshot)
+        for snapshot in snapshots:
+            emulator_name, snapshot_name = snapshot.split(":", 1)
+            try:
+                self.emulator_client.delete_snapshot(emulator_name, snapshot_name)
+            except Exception as e:
+                logger.warning("Unable to delete snapshot {}: {}".format(snapshot, e))
+
+    def resume_device(self) -> ADB:
+        """
+        Set up the emulator restored from the snapshot of the app: the settings, the app and the frida server are
+        already there, only the time has to be set again.
+        """
+        self.wait_ready()
+        adb = self.connect_adb()
+        with spans.span("device_setup"):
+            prepare_device(adb, self.device_serial, RESUME_PROFILE)
+        return adb
+
+    def set_up_device(self, apk_path: str = None) -> ADB:
+        """
+        Prepare the emulator with the steps of the setup profile (verification of the apps installed disabled,
+        correct time, frida server started...), run in a single shell script, and install the app of apk_path at the
+        same time as the frida server is pushed and started.
+        """
+        self.wait_ready()
+        adb = self.connect_adb()
+        with spans.span("device_setup"):
+            try:
+                prepare_device(adb, self.device_serial, self.setup_profile, apk_path)
+            except Exception as e:
+                logger.error("Exception as e {}, restart and re-connect to emulator".format(e))
+                self.frida_monitoring.reconnect_adb(adb)
+                prepare_device(adb, self.device_serial, self.setup_profile, apk_path)
+        return adb
+
+    def write_stats(self):
+        self.stats.write_on_file(self.log_analysis_file, self.count)
+        self.stats.write_stats_permissions(self.log_permission_file)
+        self.stats.write_stats_trackers(self.log_trackers_file)
+
+    def run(self, list_apps, on_result=None):
+        """
+        Analyze all the apps of the list (any iterable of apk paths, e.g. an AppScheduler). With static_workers > 0
+        the static analysis of the next apps runs in background while the current app is analyzed on the emulator.
+        on_result(app, done) is called after each app, done is False when the app has to be analyzed again. The list
+        can be an endless stream of apps (see intake), None means that no app is ready yet.
+        """
+        self.load_model()
+        self.watchdog.start()
+        try:
+            if self.static_workers > 0:
+                iter_apps = StaticAnalysisPipeline(list_apps, max_workers=self.static_workers,
+                                                   ledger_path=self.ledger_path)
+            else:
+                iter_apps = ((app, None) for app in list_apps)
+            for app, static_result in iter_apps:
+                if app is None:
+                    continue
+                done = self.analyze_app(app, static_result)
+                if on_result is not None:
+                    on_result(app, done)
+        finally:
+            self.watchdog.stop()
+            logger.info("Emulator manager latencies: {}".format(json.dumps(self.emulator_client.latency_stats())))
+        return self.stats
+
+    def analyze_app(self, app: str, static_result: dict = None) -> bool:
+        """
+        Execute a tentative of analysis of the app. The result of the static analysis can be given when it was
+        already computed (see static_pipeline). The tentatives are counted in the job ledger, so the ones of an
+        interrupted run are counted as well.
+
+        Returns False if the tentative failed and the app has to be analyzed again (see scheduler), True otherwise
+        """
+        job = self.ledger.register_app(app)
+        md5_app = job["md5"]
+
+        dir_result = os.path.join(os.getcwd(), "logs", md5_app)
+        if not os.path.exists(dir_result):
+            os.makedirs(dir_result)
+
+        if self.ledger.is_finished(md5_app):
+            logger.info("App already analyzed, pass to next app")
+            self.count += 1
+            return True
+
+        tentative = job["attempts"]
+        dict_analysis_app = {"md5": md5_app}
+        if tentative >= MAX_TENTATIVE:
+            self.store_app_not_analyzed(md5_app, dict_analysis_app, job["error"])
+            return True
+
+        self.ledger.start_attempt(md5_app)
+        spans.set_context(md5=md5_app, emulator=self.emulator_name)
+        self.md5_app = md5_app
+        try:
+            with spans.span("app", attempt=tentative + 1):
+                # the app is parsed once (or loaded from its cache) and shared by all the tentatives and stages
+                parsed_apk = ParsedApk(app, md5_app)
+                self.analyze_app_tentative(app, md5_app, tentative, dict_analysis_app, static_result, parsed_apk,
+                                           job["snapshot"])
+            self.delete_app_snapshots(md5_app, job["snapshot"])
+            return True
+        except HeadroomError as e:
+            # the host is loaded (no emulator started yet), the app is analyzed again without losing a tentative
+            logger.warning("Tentative of app {} not started: {}".format(md5_app, e))
+            self.ledger.cancel_attempt(md5_app, str(e))
+            return False
+        except Exception as e:
+            logger.error("Exception stop emulator, Exception: {}".format(e))
+            str_end_file = "*" * 20
+            logger.info("{}\n\n".format(str_end_file))
+            try:
+                self.stop_emulator(failed=True)
+            except EmulatorManagerError as manager_error:
+                logger.error("Unable to stop emulator {}: {}".format(self.emulator_name, manager_error))
+            if tentative + 1 < MAX_TENTATIVE:
+                self.ledger.retry_later(md5_app, str(e))
+                return False
+            self.store_app_not_analyzed(md5_app, dict_analysis_app, str(e))
+            self.delete_app_snapshots(md5_app, job["snapshot"])
+            return True
+        finally:
+            spans.set_context(md5=None, emulator=None)
+            self.md5_app = None
+
+    def store_app_not_analyzed(self, md5_app: str, dict_analysis_app: dict, error: str = None):
+        self.count += 1
+        self.stats.add_app_not_analyzed()
+        logger.error("Exception stop emulator pass to next apps")
+        dict_analysis_app["app_analyzed"] = False
+        write_json_file_log(md5_app, dict_analysis_app)
+        self.ledger.finish(md5_app, dict_analysis_app, STATE_FAILED, error)
+
+    def analyze_app_tentative(self, app: str, md5_app: str, tentative: int, dict_analysis_app: dict,
+                              static_result: dict = None, parsed_apk: ParsedApk = None, app_snapshot: str = None):
+        # get trackers libraries and list permissions
+        if static_result is None or static_result["md5"] != md5_app:
+            logger.info("Get application information")
+            self.set_phase("static_analysis")
+            static_result = app_analyzer.static_analysis(app, md5_app, parsed_apk)
+        else:
+            logger.info("Application information already available")
+        app_trackers = static_result["trackers_inside"]
+        app_permissions_list = static_result["permission_requested"]
+        list_api_to_monitoring = static_result["api_to_monitoring"]
+        update_dict_static_result(dict_analysis_app, static_result)
+
+        logger.info("3PDroid start Analysis {}".format(app))
+        logger.info("Package name {}".format(static_result["package_name"]))
+        logger.info("MD5 {}".format(md5_app))
+
+        # if API == 0 --> app is cleaned, the emulator is not needed
+        if len(list_api_to_monitoring) == 0:
+            logger.info("Application does not need privacy policy page, "
+                        "pass to the next application")
+            store_app_cleaned(md5_app, dict_analysis_app, static_result, self.stats, self.ledger)
+            self.count += 1
+            # STORE INFORMATION
+            logger.info(self.stats.stats_trackers)
+            logger.info(self.stats.stats_permission)
+            # write on file
+            self.write_stats()
+            return
+
+        self.ledger.set_state(md5_app, STATE_DYNAMIC, package_name=static_result["package_name"],
+                              static_time=static_result["execution_time_app_analyzer"])
+
+        # start emulator, from the snapshot with the app installed taken by the previous tentative if any
+        self.set_phase("emulator_start")
+        resumed = app_snapshot is not None and self.restore_app_snapshot(app_snapshot)
+        if not resumed:
+            r_start_emulator = self.start_emulator()
+            # if the emulator star ok
+            if r_start_emulator.status_code != 200:
+                raise RuntimeError("Unable to start emulator {}".format(self.emulator_name))
+        logger.info("Start emulator ok")
+
+        # APP should be analyzed in a dynamic way
+        logger.info("Number of APIs to monitoring: {}".format(len(list_api_to_monitoring)))
+        dict_analysis_app["api_to_monitoring_all"] = len(list_api_to_monitoring)
+        write_json_file_log(md5_app, dict_analysis_app)
+        # with Droidbot the app is installed by the setup, DroidBot finds it already installed
+        preinstalled = self.type_analysis == "Droidbot" and not resumed
+        with self.watchdog.phase("setup"):
+            if self.type_analysis == dynamic_testing_environment.TYPE_SIMULATED:
+                # the emulator is simulated as well (fake backend of the emulator manager)
+                self.wait_ready()
+            elif resumed:
+                self.resume_device()
+            else:
+                self.set_up_device(app if preinstalled else None)
+        self.frida_monitoring.set_file_log_frida(os.path.join(os.getcwd(), "logs",
+                                                              md5_app, "monitoring_api_{}.json".format(md5_app)))
+
+        self.frida_monitoring.clean_list_json_api_invoked()
+        start_dynamic = time.time()
+        # every phase (install, frida attach, exploration, compliance checks) has its own deadline
+        with self.watchdog.phase("analysis"):
+            result_app, dict_analysis_app = dynamic_testing_environment.start_analysis(
+                type_analysis=self.type_analysis,
+                app=app,
+                max_actions=self.max_actions,
+                timeout_privacy=self.timeout_privacy,
+                pdetector=self.pdetector,
+                md5_app=md5_app,
+                frida_monitoring=self.frida_monitoring,
+                dict_analysis_app=dict_analysis_app,
+                device_serial=self.device_serial,
+                parsed_apk=parsed_apk,
+                watchdog=self.watchdog,
+                on_installed=(lambda: self.take_app_snapshot(md5_app)) if self.app_snapshots and not resumed else None,
+                app_installed=resumed or preinstalled)
+        dynamic_time = time.time() - start_dynamic
+
+        # END DYNAMIC ANALYSIS NOW STORE DATA
+        result_directory = os.path.join(os.getcwd(), "logs", md5_app)
+        if not os.path.exists(result_directory):
+            os.makedirs(result_directory)
+
+        logger.info("Analysis api invoked during dynamic analysis")
+        # Get API Invoked
+        list_json_api_invoked = self.frida_monitoring.get_list_api_invoked()
+        logger.info("Api invoked during dynamic analysis {}".format(len(list_json_api_invoked)))
+
+        # store on json file the api invoked
+        if len(list_json_api_invoked) > 0:
+            file_log_frida = self.frida_monitoring.get_file_log_frida()
+            with open(file_log_frida, "w") as outfile_api:
+                json.dump(list_json_api_invoked, outfile_api, indent=4)
+
+        # DETECT IF THE APP IS COMPLIANT OR NOT WITH GOOGLE PLAY STORE
+        app_is_compliant = result_app.detected and not (result_app.back_button_change_page or
+                                                        result_app.home_button_change_page or
+                                                        len(list_json_api_invoked) > 0
+                                                        )
+
+        dict_analysis_app["api_invoked_during_dynamic_analysis"] = len(list_json_api_invoked)
+        if app_is_compliant:
+            self.stats.add_app_compliant()
+        else:
+            self.stats.add_app_not_compliant()
+        dict_analysis_app["app_is_compliant_with_google_play_store"] = app_is_compliant
+        dict_analysis_app["app_analyzed"] = True
+        dict_analysis_app["num_tentative"] = tentative + 1
+
+        write_json_file_log(md5_app, dict_analysis_app)
+        self.ledger.finish(md5_app, dict_analysis_app, STATE_DONE, dynamic_time=dynamic_time)
+
+        self.stats.add_api_privacy_relevant_invoked(len(list_json_api_invoked))
+
+        self.stop_emulator()
+
+        # UPDATE stats analysis
+        logger.info("Update stats")
+        self.stats.list_max_actions.append(result_app.max_actions)
+        self.stats.update_value_dynamic_analysis(result_app)
+        self.stats.update_stats_permission(app_permissions_list)
+        self.stats.update_stats_trackers(app_trackers)
+
+        # debug
+        logger.info(self.stats.stats_trackers)
+        logger.info(self.stats.stats_permission)
+
+        # write on file
+        self.count += 1
+
+        self.write_stats()
+        logger.info("End update stats")
+        logger.info("3PDroid end analysis")
+        str_end_file = "*" * 20
+        logger.info("{}\n\n".format(str_end_file))
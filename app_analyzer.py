@@ -1,6 +1,7 @@
 import sys
 import time
-from androguard.misc import AnalyzeAPK
+from parsed_apk import ParsedApk, analyze_apk
+import spans
 import os
 import logging
 import json
@@ -165,12 +166,17 @@ def create_api_list_frida(list_api_to_monitoring: list, output_name_file: str):
         return False
 
 
-def analyze_apk_androguard(apk_file: str, md5_app: str = None, dict_analysis_apk: dict = None):
+def analyze_apk_androguard(apk_file: str, md5_app: str = None, dict_analysis_apk: dict = None,
+                           write_result: bool = True, parsed_apk: ParsedApk = None):
     """
 
     Parameters
     ----------
     apk_file
+    md5_app
+    dict_analysis_apk
+    write_result, if False the result is not written on the json log of the app
+    parsed_apk, if given its androguard analysis is used instead of parsing the apk again
 
     Returns
     -------
@@ -179,7 +185,11 @@ def analyze_apk_androguard(apk_file: str, md5_app: str = None, dict_analysis_apk
     tracker_name_package = {}  # package name analytics to monitoring
     logger.info("Start App Analyzer")
     start = time.time()
-    application, dalvik, analysis = AnalyzeAPK(apk_file)
+    with spans.span("androguard_analysis", md5=md5_app):
+        if parsed_apk is not None:
+            application, dalvik, analysis = parsed_apk.get_analysis()
+        else:
+            application, dalvik, analysis = analyze_apk(apk_file)
 
     # read all trackers package name inside app
     with open(os.path.join(os.getcwd(), "resources", "package_name_trackers_most_used.txt"), "r") as file:
@@ -204,26 +214,27 @@ def analyze_apk_androguard(apk_file: str, md5_app: str = None, dict_analysis_apk
     n_method = 0
     list_tracker_inside_app = []
     trackers_api_to_monitoring = {}  # dict api to monitoring during dynamic analysis
-    for key, list_package_name in tracker_name_package.items():
-        for package_name in list_package_name:
-            methods = list(analysis.find_methods(package_name))  # find all methods that satisfy regular expression
-
-            if len(methods) > 0:
-                trackers_api_to_monitoring[package_name] = []
-                list_tracker_inside_app.append(key)
-
-            # add each method to list for monitoring during dynamic analysis
-            for method in methods:
-                n_method = n_method + 1
-                trackers_api_to_monitoring[package_name].append((
-                    method.get_method().get_class_name().
-                        replace("L", "", 1).replace("/", ".").replace(";", ""),
-                    method.get_method().get_name()
-                ))
-
-            if len(methods) > 0:
-                # remove duplicate
-                trackers_api_to_monitoring[package_name] = list(set(trackers_api_to_monitoring[package_name]))
+    with spans.span("trackers_search", md5=md5_app):
+        for key, list_package_name in tracker_name_package.items():
+            for package_name in list_package_name:
+                methods = list(analysis.find_methods(package_name))  # find all methods that satisfy regular expression
+
+                if len(methods) > 0:
+                    trackers_api_to_monitoring[package_name] = []
+                    list_tracker_inside_app.append(key)
+
+                # add each method to list for monitoring during dynamic analysis
+                for method in methods:
+                    n_method = n_method + 1
+                    trackers_api_to_monitoring[package_name].append((
+                        method.get_method().get_class_name().
+                            replace("L", "", 1).replace("/", ".").replace(";", ""),
+                        method.get_method().get_name()
+                    ))
+
+                if len(methods) > 0:
+                    # remove duplicate
+                    trackers_api_to_monitoring[package_name] = list(set(trackers_api_to_monitoring[package_name]))
 
     list_tracker_inside_app = list(set(list_tracker_inside_app))
     list_permissions_app = application.get_permissions()
@@ -238,7 +249,61 @@ def analyze_apk_androguard(apk_file: str, md5_app: str = None, dict_analysis_apk
     dict_analysis_apk["execution_time_app_analyzer"] = end - start
     # dict_analysis_apk["api_to_monitoring_trackers"] = n_method
 
-    write_result_md5_app(md5_app, list_tracker_inside_app, list_permissions_app, end - start, dict_analysis_apk)
+    if write_result:
+        write_result_md5_app(md5_app, list_tracker_inside_app, list_permissions_app, end - start, dict_analysis_apk)
     logger.info("End App Analyzer")
 
     return list_tracker_inside_app, list_permissions_app, trackers_api_to_monitoring, application, dict_analysis_apk
+
+
+def static_analysis(apk_file: str, md5_app: str, parsed_apk: ParsedApk = None):
+    """
+    Static part of the analysis of an app: trackers, permissions, list of API to monitoring and frida hook file.
+    Nothing is written on the json log of the app, so it can run ahead of the dynamic analysis (also in another
+    process). The result is stored in the cache of the parsed app, a new analysis of the same app reuses it.
+
+    Parameters
+    ----------
+    apk_file
+    md5_app
+    parsed_apk, the parsed app shared with the other stages (created if not given)
+
+    Returns a dict with md5, package name, permissions, trackers, execution time and the API to monitoring
+    -------
+
+    """
+    if parsed_apk is None:
+        parsed_apk = ParsedApk(apk_file, md5_app)
+
+    with spans.span("static_analysis", md5=md5_app) as record:
+        static_result = parsed_apk.get_static_result()
+        record["cached"] = static_result is not None
+        if static_result is not None:
+            logger.info("Static analysis of {} loaded from cache".format(md5_app))
+        else:
+            list_tracker_inside_app, list_permissions_app, _, application, dict_analysis_apk = \
+                analyze_apk_androguard(apk_file, md5_app, {}, write_result=False, parsed_apk=parsed_apk)
+
+            permissions_api_mapping = get_api_related_to_permission_privacy_relevant()
+            list_api_to_monitoring = create_list_api_to_monitoring_from_file(permissions_api_mapping,
+                                                                             list_permissions_app,
+                                                                             list_tracker_inside_app)
+            static_result = {
+                "md5": md5_app,
+                "package_name": parsed_apk.package_name,
+                "permission_requested": dict_analysis_apk["permission_requested"],
+                "trackers_inside": dict_analysis_apk["trackers_inside"],
+                "execution_time_app_analyzer": dict_analysis_apk["execution_time_app_analyzer"],
+                "api_to_monitoring": list_api_to_monitoring
+            }
+            parsed_apk.set_static_result(static_result)
+            # the dex analysis is no longer needed by the next stages
+            parsed_apk.release_analysis()
+
+    if len(static_result["api_to_monitoring"]) > 0:
+        dir_hook_file = os.path.join(os.getcwd(), "hook", md5_app)
+        if not os.path.exists(dir_hook_file):
+            os.makedirs(dir_hook_file)
+        create_api_list_frida(static_result["api_to_monitoring"], os.path.join(dir_hook_file, "frida_api.txt"))
+
+    return static_result
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import asyncio
+import functools
+import weakref
+from concurrent.futures import Executor
+from typing import List, Optional, Union
+
+from adb import ADB
+
+# Operations running at the same time on a device, the other ones wait for their turn.
+MAX_DEVICE_OPERATIONS = 3
+
+# Semaphores of the devices, for each event loop (an asyncio semaphore belongs to the loop it was created in).
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_device_semaphore(device: Optional[str], max_operations: int = MAX_DEVICE_OPERATIONS) -> asyncio.Semaphore:
+    """
+    The semaphore limiting the operations running at the same time on the device, shared by the AsyncADB objects of
+    the device in the running event loop.
+    """
+    loop = asyncio.get_event_loop()
+    semaphores = _semaphores.setdefault(loop, {})
+    if device not in semaphores:
+        semaphores[device] = asyncio.Semaphore(max_operations)
+    return semaphores[device]
+
+
+class AsyncADB(object):
+    """
+    Asyncio interface of an ADB object: the adb operations run in a thread pool, so independent operations on the
+    device (e.g. the push of the frida server while the app is installed) can be awaited together with
+    asyncio.gather. At most max_operations operations run at the same time on the same device.
+    """
+
+    def __init__(self, adb: ADB, max_operations: int = MAX_DEVICE_OPERATIONS, executor: Executor = None):
+        """
+        :param adb: The ADB object of the device.
+        :param max_operations: Operations running at the same time on the device.
+        :param executor: The executor running the adb operations (the default executor of the loop if None).
+        """
+
+        self.adb = adb
+        self.max_operations = max_operations
+        self.executor = executor
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Run a blocking function of the ADB object in the executor, when the device has a free slot.
+        """
+
+        async with get_device_semaphore(self.adb.target_device, self.max_operations):
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    async def execute(self, command: List[str], timeout: Optional[int] = None) -> str:
+        return await self.run(self.adb.execute, list(command), timeout=timeout)
+
+    async def shell(self, command: List[str], timeout: Optional[int] = None) -> str:
+        return await self.run(self.adb.shell, list(command), timeout=timeout)
+
+    async def push(self, host_path: Union[str, List[str]], device_path: str, timeout: Optional[int] = None) -> str:
+        return await self.run(self.adb.push_file, host_path, device_path, timeout=timeout)
+
+    async def pull(self, device_path: Union[str, List[str]], host_path: str, timeout: Optional[int] = None) -> str:
+        return await self.run(self.adb.pull_file, device_path, host_path, timeout=timeout)
+
+    async def install(self, apk_path: str, replace_existing: bool = False, grant_permissions: bool = False,
+                      timeout: Optional[int] = None) -> str:
+        return await self.run(self.adb.install_app, apk_path, replace_existing=replace_existing,
+                              grant_permissions=grant_permissions, timeout=timeout)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import requests
+
+from job_api import job_api_port
+from job_ledger import JobLedger, STATE_DONE, STATE_FAILED
+from scheduler import AppScheduler, ORDER_LJF, ORDERS
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+LOGS_DIR = os.path.join(os.getcwd(), "logs")
+# Job ledger of the coordinator, not the one of an analysis daemon (logs/ledger.sqlite) running on the same machine.
+COORDINATOR_LEDGER_PATH = os.path.join(LOGS_DIR, "coordinator.sqlite")
+# Seconds between two polls of the jobs of an analysis host.
+DEFAULT_POLL_INTERVAL = 5
+# Seconds to wait before contacting again a host not reachable.
+HOST_RETRY_TIME = 30
+# Seconds a host can be not reachable before its jobs are dispatched to the other hosts.
+HOST_LOST_TIME = 300
+# Timeouts (seconds) of the requests to the job API of the hosts, the upload of an apk can take longer.
+REQUEST_TIMEOUT = 30
+UPLOAD_TIMEOUT = 600
+# Size (in bytes) of the chunks of the logs archives downloaded.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# An app dispatched this many times (e.g. its hosts were lost) is not analyzed.
+MAX_DISPATCH = 3
+
+# States of a job on an analysis host, besides the ones of the job ledger of the host.
+JOB_UPLOADING = "uploading"
+JOB_STEALING = "stealing"
+
+
+def extract_logs(archive, md5_app: str, logs_dir: str = LOGS_DIR):
+    """
+    Extract the archive of the logs of an app (see GET /jobs/<id>/logs) in the logs dir, the archive can contain only
+    the <md5> directory.
+    """
+    with tarfile.open(fileobj=archive, mode="r:gz") as tar:
+        members = tar.getmembers()
+        for member in members:
+            name = os.path.normpath(member.name)
+            if (name != md5_app and not name.startswith(md5_app + os.sep)) or not (member.isfile() or member.isdir()):
+                raise ValueError('Unexpected entry "{}" in the logs of app {}'.format(member.name, md5_app))
+        tar.extractall(logs_dir, members)
+
+
+class AnalysisHost(object):
+    """
+    Analysis host running the daemon with the job API (python 3PDroid.py --api) next to its emulator manager. At most
+    capacity apps are submitted to the host at the same time, by default the number of its workers.
+    """
+
+    def __init__(self, url: str, capacity: int = None):
+        self.url = url.rstrip("/")
+        self.capacity = capacity
+        self.session = requests.Session()
+        # jobs submitted to the host: md5 -> app, state on the host and position in its queue
+        self.jobs = {}
+        self.unreachable_since = None
+        self.completed = 0
+
+    def request(self, method: str, path: str, timeout: float = REQUEST_TIMEOUT, **kwargs) -> requests.Response:
+        return self.session.request(method, "{}{}".format(self.url, path), timeout=timeout, **kwargs)
+
+    def query_capacity(self) -> int:
+        response = self.request("GET", "/jobs")
+        response.raise_for_status()
+        workers = response.json().get("workers")
+        return workers if workers else 1
+
+    def free_slots(self) -> int:
+        return max(self.capacity - len(self.jobs), 0) if self.capacity is not None else 0
+
+    def backlog(self) -> list:
+        """
+        The jobs waiting in the queue of the host, the last one first (they can be taken by another host).
+        """
+        waiting = [(job["position"], md5_app) for md5_app, job in self.jobs.items() if job["position"] is not None]
+        return [md5_app for _, md5_app in sorted(waiting, reverse=True)]
+
+    def __str__(self):
+        return self.url
+
+
+class Coordinator(object):
+    """
+    Dispatch the apps to more analysis hosts, each one with its emulators, and collect their results in the logs dir
+    and in the job ledger of the coordinator. Every host takes a new app from the shared queue as soon as it has a
+    free slot; when the queue is empty an idle host takes the last app waiting in the queue of the busiest host (work
+    stealing), so the slowest host does not hold the end of the run.
+    """
+
+    def __init__(self, hosts: list, list_apps: list, ledger: JobLedger = None, order: str = ORDER_LJF,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.hosts = hosts
+        self.ledger = ledger if ledger is not None else JobLedger(COORDINATOR_LEDGER_PATH)
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.md5_apps = {}
+        list_apps_pending = []
+        for app in list_apps:
+            md5_app = self.ledger.register_app(app)["md5"]
+            if self.ledger.is_finished(md5_app):
+                logger.info("App {} already analyzed".format(app))
+                continue
+            self.md5_apps[app] = md5_app
+            list_apps_pending.append(app)
+        self.scheduler = AppScheduler(list_apps_pending, order, self.ledger)
+
+    def finished(self) -> bool:
+        with self.lock:
+            return self.scheduler.empty() and not any(host.jobs for host in self.hosts)
+
+    def run(self):
+        logger.info("Dispatch {} apps to {} hosts".format(len(self.scheduler), len(self.hosts)))
+        start = time.time()
+        threads = [threading.Thread(target=self.serve_host, args=(host,), name="host_{}".format(host), daemon=True)
+                   for host in self.hosts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for host in self.hosts:
+            logger.info("Host {}: {} apps analyzed".format(host, host.completed))
+        logger.info("Execution time: {}, jobs: {}".format(time.time() - start, self.ledger.count_by_state()))
+
+    def serve_host(self, host: AnalysisHost):
+        while not self.finished():
+            try:
+                if host.capacity is None:
+                    host.capacity = host.query_capacity()
+                    logger.info("Host {} analyzes {} apps at the same time".format(host, host.capacity))
+                self.poll_jobs(host)
+                self.fill_host(host)
+                host.unreachable_since = None
+            except requests.RequestException as e:
+                self.host_unreachable(host, e)
+                time.sleep(HOST_RETRY_TIME)
+                continue
+            time.sleep(self.poll_interval)
+
+    def host_unreachable(self, host: AnalysisHost, error: Exception):
+        logger.warning("Host {} not reachable, Exception: {}".format(host, error))
+        if host.unreachable_since is None:
+            host.unreachable_since = time.time()
+        if time.time() - host.unreachable_since < HOST_LOST_TIME:
+            return
+        with self.lock:
+            lost = [job["app"] for job in host.jobs.values()]
+            host.jobs.clear()
+        for app in lost:
+            logger.info("App {} of host {} dispatched again".format(app, host))
+            self.scheduler.retry(app)
+
+    def poll_jobs(self, host: AnalysisHost):
+        """
+        Update the state of the jobs of the host, the results of the finished ones are collected.
+        """
+        with self.lock:
+            md5_apps = [md5_app for md5_app, job in host.jobs.items() if job["state"] not in
+                        (JOB_UPLOADING, JOB_STEALING)]
+        for md5_app in md5_apps:
+            response = host.request("GET", "/jobs/{}".format(md5_app))
+            if response.status_code == 404:
+                # e.g. the ledger of the host was removed
+                with self.lock:
+                    job = host.jobs.pop(md5_app, None)
+                if job is not None:
+                    self.scheduler.retry(job["app"])
+                continue
+            response.raise_for_status()
+            status = response.json()
+            with self.lock:
+                job = host.jobs.get(md5_app)
+                if job is None or job["state"] == JOB_STEALING:
+                    continue
+                job["state"], job["position"] = status["state"], status["position"]
+            self.ledger.set_phase(md5_app, "{} {}".format(host, status["phase"] or status["state"]))
+            if status["verdict_available"]:
+                self.collect(host, md5_app, status)
+
+    def collect(self, host: AnalysisHost, md5_app: str, status: dict):
+        """
+        Copy the logs of the app from the host in the logs dir and store its verdict in the ledger.
+        """
+        with tempfile.TemporaryFile() as archive:
+            with host.request("GET", "/jobs/{}/logs".format(md5_app), stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    archive.write(chunk)
+            archive.seek(0)
+            try:
+                extract_logs(archive, md5_app)
+            except (tarfile.TarError, ValueError) as e:
+                logger.error("Logs of app {} from host {} not stored, Exception: {}".format(md5_app, host, e))
+        response = host.request("GET", "/jobs/{}/verdict".format(md5_app))
+        if response.status_code == 404:
+            dict_analysis_app = {"md5": md5_app, "app_analyzed": status["state"] == STATE_DONE}
+        else:
+            response.raise_for_status()
+            dict_analysis_app = response.json()
+        self.ledger.finish(md5_app, dict_analysis_app, STATE_FAILED if status["state"] == STATE_FAILED else STATE_DONE,
+                           status["error"])
+        with self.lock:
+            host.jobs.pop(md5_app, None)
+            host.completed += 1
+        logger.info("App {} analyzed by host {}".format(md5_app, host))
+
+    def fill_host(self, host: AnalysisHost):
+        while host.free_slots() > 0:
+            with self.lock:
+                # the app is taken from the queue and added to the jobs of the host at once, see finished
+                app = self.scheduler.get_nowait()
+                if app is not None:
+                    host.jobs[self.md5_apps[app]] = {"app": app, "state": JOB_UPLOADING, "position": None}
+            if app is None:
+                app = self.steal(host)
+            if app is None:
+                return
+            self.submit(host, app)
+
+    def steal(self, host: AnalysisHost) -> Optional[str]:
+        """
+        Take back the last app waiting in the queue of the host with the longest queue, None if no host has apps
+        waiting.
+        """
+        with self.lock:
+            victims = [other for other in self.hosts if other is not host and other.backlog()]
+            if not victims:
+                return None
+            victim = max(victims, key=lambda other: len(other.backlog()))
+            md5_app = victim.backlog()[0]
+            job = victim.jobs[md5_app]
+            job["state"] = JOB_STEALING
+        try:
+            response = victim.request("DELETE", "/jobs/{}".format(md5_app))
+        except requests.RequestException as e:
+            logger.warning("Host {} not reachable, Exception: {}".format(victim, e))
+            response = None
+        with self.lock:
+            if response is None or response.status_code != 200:
+                # the analysis of the app is already started, its state is updated by the next poll
+                job["state"], job["position"] = None, None
+                return None
+            victim.jobs.pop(md5_app, None)
+            host.jobs[md5_app] = {"app": job["app"], "state": JOB_UPLOADING, "position": None}
+        logger.info("App {} taken from the queue of host {} by host {}".format(job["app"], victim, host))
+        return job["app"]
+
+    def submit(self, host: AnalysisHost, app: str):
+        """
+        Upload the app to the host, already in the jobs of the host.
+        """
+        md5_app = self.md5_apps[app]
+        if self.ledger.get_job(md5_app)["attempts"] >= MAX_DISPATCH:
+            logger.error("App {} dispatched {} times, not analyzed".format(app, MAX_DISPATCH))
+            self.ledger.finish(md5_app, {"md5": md5_app, "app_analyzed": False}, STATE_FAILED,
+                               "Dispatched {} times".format(MAX_DISPATCH))
+            with self.lock:
+                host.jobs.pop(md5_app, None)
+            return
+        self.ledger.start_attempt(md5_app)
+        self.ledger.set_phase(md5_app, "{} {}".format(host, JOB_UPLOADING))
+        try:
+            with open(app, "rb") as apk_file:
+                response = host.request("POST", "/jobs", timeout=UPLOAD_TIMEOUT,
+                                        files={"apk": ("{}.apk".format(md5_app), apk_file)})
+        except requests.RequestException:
+            with self.lock:
+                host.jobs.pop(md5_app, None)
+            self.scheduler.retry(app)
+            raise
+        if response.status_code not in (200, 201):
+            logger.error("Host {} refused app {}: {}".format(host, app, response.text))
+            with self.lock:
+                host.jobs.pop(md5_app, None)
+            self.scheduler.retry(app)
+            return
+        status = response.json()
+        with self.lock:
+            host.jobs[md5_app].update(state=status["state"], position=status["position"])
+        logger.info("App {} submitted to host {}".format(app, host))
+
+
+def get_hosts(hosts: str) -> list:
+    """
+    Analysis hosts from a comma separated list of HOST[:PORT][=CAPACITY] (default port of the job API, default
+    capacity the number of workers of the host).
+    """
+    list_hosts = []
+    for host in hosts.split(","):
+        capacity = None
+        if "=" in host:
+            host, capacity = host.rsplit("=", 1)
+            capacity = int(capacity)
+        if "://" not in host:
+            host = "http://{}".format(host)
+        if host.count(":") == 1:
+            host = "{}:{}".format(host, job_api_port)
+        list_hosts.append(AnalysisHost(host, capacity))
+    return list_hosts
+
+
+def get_cmd_args(args: list = None):
+    """
+    Parse and return the command line parameters needed for the script execution.
+    :param args: List of arguments to be parsed (by default sys.argv is used).
+    :return: The command line needed parameters.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='python coordinator.py',
+        description='Dispatch the apps to more analysis hosts (python 3PDroid.py --api on each host) and collect '
+                    'their results in the logs dir'
+    )
+
+    parser.add_argument('--hosts', type=str, metavar='HOST[:PORT][=CAPACITY],...', required=True,
+                        help='The job APIs of the analysis hosts, with the number of apps to submit to each of them '
+                             'at the same time (default the number of workers of the host)')
+    parser.add_argument('-d', '--dir-app', type=str, metavar='DIR', default=os.path.join(os.getcwd(), 'apps'),
+                        help='The directory where is the apps')
+    parser.add_argument('--schedule', type=str, default=ORDER_LJF, choices=ORDERS,
+                        help='Order of the apps dispatched')
+    parser.add_argument('--poll-interval', type=float, metavar='SECONDS', default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between two polls of the jobs of a host')
+    parser.add_argument('--ledger', type=str, metavar='LEDGER', default=COORDINATOR_LEDGER_PATH,
+                        help='The job ledger of the coordinator (default logs/coordinator.sqlite)')
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    arguments = get_cmd_args()
+    coordinator = Coordinator(get_hosts(arguments.hosts), glob.glob(os.path.join(arguments.dir_app, "*.apk")),
+                              ledger=JobLedger(arguments.ledger), order=arguments.schedule,
+                              poll_interval=arguments.poll_interval)
+    coordinator.run()
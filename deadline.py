@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+import spans
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+# Seconds given to a phase stopped gracefully (on_expire) to end, before it is aborted.
+DEFAULT_GRACE_PERIOD = 30
+# Max seconds between two checks of the watchdog thread.
+WATCHDOG_INTERVAL = 1
+
+
+class PhaseTimeoutError(Exception):
+    """
+    Raised by the worker when a phase of the analysis exceeded its budget.
+    """
+
+    def __init__(self, phase: str, budget: float):
+        super().__init__('Phase "{0}" exceeded its budget of {1} seconds'.format(phase, budget))
+        self.phase = phase
+        self.budget = budget
+
+
+class Deadline(object):
+    """
+    Budget of a single phase. When the budget is exceeded the watchdog calls on_expire (that should stop the phase
+    gracefully, e.g. stop sending events); if on_expire is not given, or the phase does not end within the grace
+    period, the phase is aborted.
+    """
+
+    def __init__(self, phase: str, budget: float, on_expire: Callable = None, strict: bool = True):
+        self.phase = phase
+        self.budget = budget
+        self.on_expire = on_expire
+        self.strict = strict
+        self.started_at = time.time()
+        self.expires_at = self.started_at + budget
+        self.expired = False
+        self.aborted = False
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.time(), 0)
+
+    def check(self):
+        """
+        Cancellation point, to be called within the long loops of a phase.
+        """
+        if self.expired:
+            raise PhaseTimeoutError(self.phase, self.budget)
+
+
+class Watchdog(object):
+    """
+    Deadlines of the phases of an analysis (install, frida attach, exploration, compliance checks, ...), each with its
+    own budget in seconds. A background thread checks the deadlines of the running phases: the stuck phase is stopped
+    (see Deadline) and, when it has to be aborted, on_abort is called (e.g. stop the emulator, so the adb and frida
+    calls blocked on it fail immediately and the emulator is free for the next app). Unlike SIGALRM the watchdog
+    works when the analysis runs on any thread and never interrupts the worker at an arbitrary point: the phase
+    raises PhaseTimeoutError when it returns. The phases without a budget are not watched.
+    """
+
+    def __init__(self, budgets: Dict[str, float] = None, on_abort: Callable[[str], None] = None,
+                 grace_period: float = DEFAULT_GRACE_PERIOD, on_phase: Callable[[str], None] = None):
+        self.budgets = dict(budgets) if budgets else {}
+        self.on_abort = on_abort
+        # called (by the thread of the analysis) when a phase starts, e.g. to show it in the job API
+        self.on_phase = on_phase
+        self.grace_period = grace_period
+
+        self.deadlines = []
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name="watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def set_budget(self, phase: str, budget: float):
+        self.budgets[phase] = budget
+
+    @contextmanager
+    def phase(self, name: str, on_expire: Callable = None, strict: bool = True):
+        """
+        Watch the code executed within the context, the phase is timed as well (see spans).
+
+        :param name: The name of the phase, its budget is taken from the budgets of the watchdog.
+        :param on_expire: Called by the watchdog thread when the budget is exceeded, to stop the phase gracefully.
+        :param strict: If False a phase stopped gracefully in time ends normally, otherwise PhaseTimeoutError is
+                       raised when the phase returns.
+        """
+        if self.on_phase is not None:
+            self.call(self.on_phase, name)
+        with spans.span(name) as record:
+            with self.watch(name, on_expire, strict) as deadline:
+                yield deadline
+            record["expired"] = deadline is not None and deadline.expired
+
+    @contextmanager
+    def watch(self, name: str, on_expire: Callable = None, strict: bool = True):
+        budget = self.budgets.get(name)
+        if budget is None:
+            yield None
+            return
+
+        deadline = Deadline(name, budget, on_expire, strict)
+        with self.condition:
+            self.deadlines.append(deadline)
+            self.condition.notify_all()
+        try:
+            yield deadline
+        except PhaseTimeoutError:
+            raise
+        except Exception as e:
+            # the phase failed because it was aborted
+            if deadline.expired:
+                raise PhaseTimeoutError(name, budget) from e
+            raise
+        finally:
+            with self.condition:
+                self.deadlines.remove(deadline)
+        if deadline.aborted or (deadline.expired and deadline.strict):
+            raise PhaseTimeoutError(name, budget)
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                now = time.time()
+                expired = [deadline for deadline in self.deadlines
+                           if not deadline.expired and now >= deadline.expires_at]
+                for deadline in expired:
+                    deadline.expired = True
+                stuck = [deadline for deadline in self.deadlines
+                         if deadline.expired and not deadline.aborted
+                         and (deadline.on_expire is None or now >= deadline.expires_at + self.grace_period)]
+                for deadline in stuck:
+                    deadline.aborted = True
+                next_check = [deadline.expires_at if not deadline.expired
+                              else deadline.expires_at + self.grace_period
+                              for deadline in self.deadlines if not deadline.aborted]
+
+            # the callbacks are called without the lock, they can take time
+            for deadline in expired:
+                logger.warning('Phase "{0}" exceeded its budget of {1} seconds'.format(deadline.phase,
+                                                                                      deadline.budget))
+                if deadline.on_expire is not None:
+                    self.call(deadline.on_expire)
+            for deadline in stuck:
+                logger.warning('Abort phase "{0}"'.format(deadline.phase))
+                if self.on_abort is not None:
+                    self.call(self.on_abort, deadline.phase)
+
+            with self.condition:
+                if self.running:
+                    timeout = min(next_check) - time.time() if next_check else WATCHDOG_INTERVAL
+                    self.condition.wait(min(max(timeout, 0), WATCHDOG_INTERVAL))
+
+    @staticmethod
+    def call(callback: Callable, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error('Error in watchdog callback: {0}'.format(e))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import logging
+import threading
+from typing import Callable, Optional
+
+# Events that change the properties of a device: the screen was rotated, an app was installed or uninstalled, the
+# device was rebooted (or adbd restarted, or the emulator restored from a snapshot). Each event invalidates only the
+# properties listed (all of them on reboot), the read-only system properties (ro.*) change only on reboot.
+EVENT_ROTATION = 'rotation'
+EVENT_PACKAGES = 'packages'
+EVENT_REBOOT = 'reboot'
+INVALIDATED_BY = {
+    EVENT_ROTATION: ['display_info'],
+    EVENT_PACKAGES: ['installed_apps', 'accessibility_services'],
+    EVENT_REBOOT: None
+}
+
+
+class DeviceProperties(object):
+    """
+    Properties of a device read through adb (sdk version, display, installed apps...), kept until an event that
+    changes them: the ADB objects of the device (of 3PDroid and of DroidBot) share them, so reading a property again
+    does not cost an adb round trip.
+    """
+
+    def __init__(self, serial: Optional[str]):
+        self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
+        self.serial = serial
+        self.values = {}
+        # incremented by every event, a value read while an event invalidated it is not kept
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, name: str, loader: Callable):
+        """
+        The value of the property, read with loader if it is not known.
+        """
+        with self.lock:
+            if name in self.values:
+                self.hits += 1
+                return self.values[name]
+            self.misses += 1
+            generation = self.generation
+        value = loader()
+        with self.lock:
+            if self.generation == generation:
+                self.values[name] = value
+        return value
+
+    def invalidate(self, *names: str):
+        with self.lock:
+            self.generation += 1
+            for name in names:
+                self.values.pop(name, None)
+
+    def notify(self, event: str):
+        """
+        Invalidate the properties changed by the event.
+        """
+        names = INVALIDATED_BY[event]
+        self.logger.debug('Event "{0}" on device {1}'.format(event, self.serial))
+        with self.lock:
+            self.generation += 1
+            if names is None:
+                self.values.clear()
+            else:
+                for name in names:
+                    self.values.pop(name, None)
+
+
+_devices = {}
+_devices_lock = threading.Lock()
+
+
+def get_device_properties(serial: Optional[str]) -> DeviceProperties:
+    """
+    The properties of the device with the serial (None for the only device connected), shared by the process.
+    """
+    with _devices_lock:
+        if serial not in _devices:
+            _devices[serial] = DeviceProperties(serial)
+        return _devices[serial]
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import List, NamedTuple, Optional
+
+from adb import ADB
+from async_adb import AsyncADB
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+# Directory of the device where the frida server and the setup scripts are pushed.
+DEVICE_DIR = "/data/local/tmp"
+SETUP_SCRIPT_PREFIX = "3pdroid_setup"
+FRIDA_SERVER = os.path.join(os.getcwd(), "resources", "frida-server", "frida-server")
+# Line written by the setup script after each step, followed by the name of the step and its exit code.
+STEP_MARKER = "__3PDROID_SETUP_STEP__"
+# Seconds to wait for the adb commands, for the setup script and for the installation of the app.
+ADB_TIMEOUT = 60
+SCRIPT_TIMEOUT = 120
+INSTALL_TIMEOUT = 180
+# Name of the result of the installation of the app, when the app is installed with the setup.
+STEP_INSTALL = "install_app"
+
+
+class SetupStep(NamedTuple):
+    """
+    A step of the preparation of the device: a shell command run by the setup script, a file of the host pushed in
+    DEVICE_DIR (its command runs once the file is pushed), or adbd restarted as root. A required step that failed
+    fails the setup.
+    """
+    name: str
+    command: Optional[str] = None
+    push: Optional[str] = None
+    root: bool = False
+    required: bool = True
+
+
+class StepResult(NamedTuple):
+    name: str
+    status: int
+    output: str
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 0
+
+
+STEP_ROOT = SetupStep("root", root=True, required=False)
+STEP_DISABLE_VERIFIER = SetupStep("disable_verifier", "settings put global verifier_verify_adb_installs 0")
+# $SETUP_DATE is set by the script to the time of the host when the script is compiled
+STEP_SET_TIME = SetupStep("set_time", "su 0 date $SETUP_DATE; am broadcast -a android.intent.action.TIME_SET")
+STEP_FRIDA_SERVER = SetupStep("frida_server",
+                              "chmod 755 {0}/frida-server; pidof frida-server >/dev/null || "
+                              "(cd {0} && nohup ./frida-server >/dev/null 2>&1 &); sleep 1; "
+                              "pidof frida-server >/dev/null".format(DEVICE_DIR), push=FRIDA_SERVER)
+STEP_DISABLE_ANIMATIONS = SetupStep("disable_animations",
+                                    "settings put global window_animation_scale 0; "
+                                    "settings put global transition_animation_scale 0; "
+                                    "settings put global animator_duration_scale 0", required=False)
+STEP_STAY_AWAKE = SetupStep("stay_awake", "svc power stayon true", required=False)
+
+# Preparation of a new emulator, and of an emulator restored from the snapshot of an app (only the time is set).
+DEFAULT_PROFILE = [STEP_ROOT, STEP_DISABLE_VERIFIER, STEP_SET_TIME, STEP_FRIDA_SERVER]
+RESUME_PROFILE = [STEP_SET_TIME]
+
+
+def get_setup_profile(disable_animations: bool = False, stay_awake: bool = False) -> List[SetupStep]:
+    profile = list(DEFAULT_PROFILE)
+    if disable_animations:
+        profile.append(STEP_DISABLE_ANIMATIONS)
+    if stay_awake:
+        profile.append(STEP_STAY_AWAKE)
+    return profile
+
+
+def compile_script(profile: List[SetupStep]) -> str:
+    """
+    The shell script running the commands of the steps one after another, each followed by its exit code.
+    """
+    lines = ["SETUP_DATE={}".format(time.strftime('%m%d%H%M%Y.%S'))]
+    for step in profile:
+        if step.command is None:
+            continue
+        lines.append("{{ {0}\n}} </dev/null 2>&1".format(step.command))
+        lines.append('printf "\\n%s %s %d\\n" {0} {1} "$?"'.format(STEP_MARKER, step.name))
+    lines.append("exit 0")
+    return "\n".join(lines) + "\n"
+
+
+def parse_script_output(output: str) -> List[StepResult]:
+    results = []
+    step_output = []
+    for line in output.splitlines():
+        if line.startswith(STEP_MARKER):
+            _, name, status = line.split()
+            results.append(StepResult(name, int(status), "\n".join(step_output).strip()))
+            step_output = []
+        else:
+            step_output.append(line)
+    return results
+
+
+def restart_as_root(adb: ADB, device_serial: Optional[str]):
+    """
+    Restart adbd as root and connect again to the device (adbd restarted drops the connection).
+    """
+    adb.execute(['root'], timeout=ADB_TIMEOUT)
+    adb.connect(host=device_serial, timeout=ADB_TIMEOUT)
+    adb.wait_for_device(timeout=ADB_TIMEOUT)
+
+
+async def push_and_run(async_adb: AsyncADB, step: SetupStep) -> StepResult:
+    """
+    Push the file of the step and run its command right after (e.g. start the frida server pushed).
+    """
+    try:
+        await async_adb.push(step.push, DEVICE_DIR, timeout=ADB_TIMEOUT)
+    except Exception as e:
+        # the file may already be on the device (e.g. the frida server of the previous app)
+        logger.warning("Push of {} failed: {}".format(step.push, e))
+    if step.command is None:
+        return StepResult(step.name, 0, "")
+    return (await run_script(async_adb, [step]))[0]
+
+
+async def run_script(async_adb: AsyncADB, steps: List[SetupStep]) -> List[StepResult]:
+    """
+    Push the script of the steps and run it in a single round trip.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".sh", delete=False) as script_file:
+        script_file.write(compile_script(steps))
+    script_path = "{}/{}_{}.sh".format(DEVICE_DIR, SETUP_SCRIPT_PREFIX, steps[0].name)
+    try:
+        await async_adb.push(script_file.name, script_path, timeout=ADB_TIMEOUT)
+    finally:
+        os.remove(script_file.name)
+    results = parse_script_output(await async_adb.shell(["sh", script_path], timeout=SCRIPT_TIMEOUT))
+    run = {result.name for result in results}
+    return results + [StepResult(step.name, -1, "not run") for step in steps if step.name not in run]
+
+
+async def install_app(async_adb: AsyncADB, apk_path: str) -> StepResult:
+    try:
+        output = await async_adb.install(apk_path, replace_existing=True, grant_permissions=True,
+                                         timeout=INSTALL_TIMEOUT)
+        return StepResult(STEP_INSTALL, 0, output)
+    except Exception as e:
+        return StepResult(STEP_INSTALL, 1, str(e))
+
+
+async def prepare_device_async(adb: ADB, profile: List[SetupStep], apk_path: Optional[str]) -> List[StepResult]:
+    """
+    The steps that do not depend on each other run at the same time: every file pushed (and its command), and the
+    script of the other steps followed by the installation of the app (the verification of the apps is disabled
+    first).
+    """
+    async_adb = AsyncADB(adb)
+    script_steps = [step for step in profile if step.command is not None and step.push is None]
+
+    async def script_and_install() -> List[StepResult]:
+        results = await run_script(async_adb, script_steps) if script_steps else []
+        if apk_path is not None:
+            results.append(await install_app(async_adb, apk_path))
+        return results
+
+    push_results = asyncio.gather(*[push_and_run(async_adb, step) for step in profile if step.push is not None])
+    pushed, script_results = await asyncio.gather(push_results, script_and_install())
+    return list(pushed) + script_results
+
+
+def prepare_device(adb: ADB, device_serial: Optional[str], profile: List[SetupStep] = None,
+                   apk_path: str = None) -> List[StepResult]:
+    """
+    Prepare the device with the steps of the profile: adbd is restarted as root, then the commands run in a single
+    round trip as one shell script pushed on the device, while the files are pushed. With apk_path the app is
+    installed as well, after the script.
+
+    :return: The result of every step.
+    :raise RuntimeError: A required step failed.
+    """
+    profile = DEFAULT_PROFILE if profile is None else profile
+    results = []
+    if any(step.root for step in profile):
+        try:
+            restart_as_root(adb, device_serial)
+            results.append(StepResult(STEP_ROOT.name, 0, ""))
+        except Exception as e:
+            if device_serial is None:
+                adb.kill_server()
+            results.append(StepResult(STEP_ROOT.name, 1, str(e)))
+
+    results.extend(asyncio.run(prepare_device_async(adb, [step for step in profile if not step.root], apk_path)))
+
+    logger.info("Device prepared: {}".format(", ".join("{} {}".format(result.name, "ok" if result.ok else
+                                                                      "failed ({})".format(result.status))
+                                                       for result in results)))
+    required = {step.name for step in profile if step.required} | {STEP_INSTALL}
+    failed = [result for result in results if result.name in required and not result.ok]
+    if failed:
+        raise RuntimeError("Device setup failed: {}".format(
+            "; ".join("{}: {}".format(result.name, result.output or result.status) for result in failed)))
+    return results
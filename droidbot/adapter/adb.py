@@ -6,6 +6,10 @@ import re
 import subprocess
 from typing import List
 
+from adb import USE_SERVER_PROTOCOL
+from adb_client import AdbServerError, AdbServerUnavailable, get_client
+from adb_shell import ShellSession
+from device_properties import EVENT_PACKAGES, EVENT_REBOOT, get_device_properties
 from .adapter import Adapter
 
 
@@ -16,6 +20,10 @@ class ADB(Adapter):
 
     VERSION_SDK_PROPERTY = 'ro.build.version.sdk'
 
+    # The adb commands that change the apps installed, or restart the device.
+    PACKAGE_COMMANDS = ['install', 'install-multiple', 'uninstall']
+    REBOOT_COMMANDS = ['reboot', 'root', 'unroot']
+
     def __init__(self, device):
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
@@ -23,6 +31,15 @@ class ADB(Adapter):
 
         self.cmd_prefix = ['adb', '-s', device.serial]
 
+        # The shell commands are sent to the adb server through its protocol or, if the adb server is not reachable,
+        # run one after another in a single long-lived adb shell.
+        self.server_client = get_client() if USE_SERVER_PROTOCOL else None
+        self.shell_session = ShellSession(self.cmd_prefix)
+
+        # The properties of the device (display, sdk version, apps installed...) are read once and shared with the
+        # other ADB objects of the device, until an event changes them.
+        self.properties = get_device_properties(device.serial)
+
     def connect(self):
         """
         Connect adb.
@@ -33,6 +50,7 @@ class ADB(Adapter):
         """
         Disconnect adb.
         """
+        self.shell_session.close()
         self.logger.info('{0} disconnected'.format(self.__class__.__name__))
 
     def check_connectivity(self):
@@ -62,7 +80,13 @@ class ADB(Adapter):
 
         complete_cmd = self.cmd_prefix + cmd_as_list
         self.logger.debug('Running command "{0}"'.format(complete_cmd))
-        output = subprocess.check_output(complete_cmd, stderr=subprocess.STDOUT).strip().decode()
+        try:
+            output = subprocess.check_output(complete_cmd, stderr=subprocess.STDOUT).strip().decode()
+        finally:
+            if cmd_as_list and cmd_as_list[0] in ADB.PACKAGE_COMMANDS:
+                self.properties.notify(EVENT_PACKAGES)
+            elif cmd_as_list and cmd_as_list[0] in ADB.REBOOT_COMMANDS:
+                self.properties.notify(EVENT_REBOOT)
         self.logger.debug('Command "{0}" returned: {1}'.format(complete_cmd, output))
 
         return output
@@ -77,9 +101,30 @@ class ADB(Adapter):
         if not isinstance(cmd_as_list, list):
             raise TypeError('The commands should be passed as a list of strings')
 
-        shell_cmd = ['shell'] + cmd_as_list
+        self.logger.debug('Running shell command "{0}"'.format(cmd_as_list))
+        output, exit_code = self.run_shell(cmd_as_list)
+        output = output.strip()
+        if exit_code != 0:
+            raise subprocess.CalledProcessError(exit_code, self.cmd_prefix + ['shell'] + cmd_as_list, output.encode())
+        self.logger.debug('Shell command "{0}" returned: {1}'.format(cmd_as_list, output))
+
+        return output
 
-        return self.run_cmd(shell_cmd)
+    def run_shell(self, cmd_as_list: List[str]):
+        """
+        Run adb shell command through the adb server protocol or in the shell session.
+
+        :param cmd_as_list: The command to execute formatted as a list of strings.
+        :return: The output of the command and its exit code.
+        """
+        if self.server_client is not None:
+            try:
+                return self.server_client.shell(self.device.serial, ' '.join(cmd_as_list))
+            except AdbServerUnavailable as e:
+                self.logger.debug('{0}, use the shell session'.format(e))
+            except AdbServerError as e:
+                raise subprocess.CalledProcessError(1, self.cmd_prefix + ['shell'] + cmd_as_list, str(e).encode())
+        return self.shell_session.run(cmd_as_list)
 
     def get_property(self, property_name) -> str:
         """
@@ -88,6 +133,10 @@ class ADB(Adapter):
         :param property_name: The name of the property.
         :return: The value of the property.
         """
+        if property_name.startswith('ro.'):
+            # Read-only properties, they change only when the device is rebooted.
+            return self.properties.get('prop:{0}'.format(property_name),
+                                       lambda: self.shell(['getprop', property_name]))
         return self.shell(['getprop', property_name])
 
     def get_sdk_version(self) -> int:
@@ -100,7 +149,17 @@ class ADB(Adapter):
 
     # The following methods are taken from AndroidViewClient project.
     # https://github.com/dtmilano/AndroidViewClient.
-    def get_display_info(self) -> dict:
+    def get_display_info(self, refresh: bool = False) -> dict:
+        """
+        Get display dimensions, orientation and density (read again after a rotation of the screen).
+
+        :param refresh: If set to True, read the display info again instead of using the cached values.
+        """
+        if refresh:
+            self.properties.invalidate('display_info')
+        return self.properties.get('display_info', self.read_display_info)
+
+    def read_display_info(self) -> dict:
         """
         This is a method to obtain display dimensions and density.
         """
@@ -169,10 +228,12 @@ class ADB(Adapter):
 
         :return: A list with the enabled service names, using the format <package_name>/<service_name>.
         """
-        pass
-        output = self.shell(['settings', 'get', 'secure', 'enabled_accessibility_services'])
-        output = re.sub(r'(?m)^WARNING:.*\n?', '', output)
-        return output.strip().split(':') if output.strip() else []
+        def read_accessibility_services():
+            output = self.shell(['settings', 'get', 'secure', 'enabled_accessibility_services'])
+            output = re.sub(r'(?m)^WARNING:.*\n?', '', output)
+            return output.strip().split(':') if output.strip() else []
+
+        return self.properties.get('accessibility_services', read_accessibility_services)
 
     def get_installed_apps(self) -> dict:
         """
@@ -180,14 +241,17 @@ class ADB(Adapter):
 
         :return: A dictionary, each key is a package name and each value is the path to the apk file.
         """
-        app_lines = self.shell(['pm', 'list', 'packages', '-f']).splitlines()
-        app_line_re = re.compile('package:(?P<apk_path>.+)=(?P<package>[^=]+)')
-        package_to_path = {}
-        for app_line in app_lines:
-            m = app_line_re.match(app_line)
-            if m:
-                package_to_path[m.group('package')] = m.group('apk_path')
-        return package_to_path
+        def read_installed_apps():
+            app_lines = self.shell(['pm', 'list', 'packages', '-f']).splitlines()
+            app_line_re = re.compile('package:(?P<apk_path>.+)=(?P<package>[^=]+)')
+            package_to_path = {}
+            for app_line in app_lines:
+                m = app_line_re.match(app_line)
+                if m:
+                    package_to_path[m.group('package')] = m.group('apk_path')
+            return package_to_path
+
+        return self.properties.get('installed_apps', read_installed_apps)
 
     def get_orientation(self):
         """
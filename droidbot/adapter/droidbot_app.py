@@ -11,6 +11,7 @@ import threading
 import time
 from typing import Optional, List
 
+from device_properties import EVENT_ROTATION
 from .adapter import Adapter
 
 DROIDBOT_APP_PACKAGE = 'io.github.ylimit.droidbotapp'
@@ -145,6 +146,8 @@ class DroidBotApp(Adapter):
         if rotation_idx >= 0:
             if rotation_idx > 0:
                 self.logger.warning('Invalid data before packet header: {0}'.format(message[:rotation_idx]))
+            # The display info (width, height and orientation) changed.
+            self.device.adb.properties.notify(EVENT_ROTATION)
             return
 
         raise IOError('Unexpected message from DroidBot app: {0}'.format(message))
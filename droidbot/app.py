@@ -1,13 +1,13 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import hashlib
 import logging
 import os
 from typing import List, Set
 
 from androguard.core.bytecodes.apk import APK
 
+from parsed_apk import ParsedApk
 from .intent import Intent
 
 
@@ -16,7 +16,7 @@ class App(object):
     The class representing the application to be analyzed.
     """
 
-    def __init__(self, apk_path: str):
+    def __init__(self, apk_path: str, parsed_apk: ParsedApk = None):
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
         if not os.path.isfile(apk_path):
@@ -24,38 +24,26 @@ class App(object):
 
         self.apk_path = apk_path
 
-        self.apk = APK(self.apk_path)
+        # The manifest information comes from the app already parsed by the previous stages (or from its cache).
+        self.parsed_apk = parsed_apk if parsed_apk is not None else ParsedApk(self.apk_path)
 
-        self.hashes = self.get_hashes()
+        self.hashes = self.parsed_apk.hashes
 
-        self.package_name = self.apk.get_package()
-        self.main_activities = self.apk.get_main_activities()
+        self.package_name = self.parsed_apk.package_name
+        self.main_activities = self.parsed_apk.main_activities
 
         # This is the variable that holds the list of intents that should be used to start the app. Every
         # time an intent is used to start the app, the code should check if the intent is valid (it starts
         # an existing activity), if it's not valid then the intent should be removed from this list.
         self.start_intents = self.get_start_intents()
 
-        self.permissions = self.apk.get_permissions()
-        self.activities = self.apk.get_activities()
+        self.permissions = self.parsed_apk.permissions
+        self.activities = self.parsed_apk.activities
         self.possible_broadcasts = self.get_possible_broadcasts()
 
-    def get_hashes(self, block_size=65536) -> List[str]:
-        """
-        Calculate MD5, SHA1 and SHA256 hashes of the input application file.
-
-        :param block_size: The size of the block used for the hash functions.
-        :return: A list containing the MD5, SHA1 and SHA256 hashes of the input application file.
-        """
-        md5_hash = hashlib.md5()
-        sha1_hash = hashlib.sha1()
-        sha256_hash = hashlib.sha256()
-        with open(self.apk_path, 'rb') as filename:
-            for chunk in iter(lambda: filename.read(block_size), b''):
-                md5_hash.update(chunk)
-                sha1_hash.update(chunk)
-                sha256_hash.update(chunk)
-        return [md5_hash.hexdigest(), sha1_hash.hexdigest(), sha256_hash.hexdigest()]
+    @property
+    def apk(self) -> APK:
+        return self.parsed_apk.apk
 
     def get_package_name(self) -> str:
         """
@@ -103,11 +91,9 @@ class App(object):
         :return: A set with the intents to trigger the broadcast receivers in the current application.
         """
         possible_broadcasts = set()
-        for receiver in self.apk.get_receivers():
-            intent_filters = self.apk.get_intent_filters('receiver', receiver)
-            actions = intent_filters['action'] if 'action' in intent_filters else []
-            categories = intent_filters['category'] if 'category' in intent_filters else []
-            categories.append(None)
+        for receiver, intent_filters in self.parsed_apk.receivers.items():
+            actions = intent_filters['action']
+            categories = intent_filters['category'] + [None]
             for action in actions:
                 for category in categories:
                     intent = Intent(prefix='broadcast', action=action, category=category)
@@ -54,7 +54,7 @@ class Device(object):
         self.smart_input_generator = None
         if smart_input and not replay:
             try:
-                self.smart_input_generator = SmartInput(self.app.apk_path)
+                self.smart_input_generator = SmartInput(self.app.apk_path, self.app.parsed_apk)
             except Exception:
                 self.logger.warning('Smart input generation unavailable')
 
@@ -133,6 +133,8 @@ class Device(object):
         Set up connections on this device.
         """
         self.wait_for_device()
+        # Read the display info once, the exploration then uses the cached values until the screen is rotated.
+        self.get_display_info()
         for adapter in self.adapters:
             adapter_enabled = self.adapters[adapter]
             if not adapter_enabled:
@@ -198,14 +200,14 @@ class Device(object):
             self.sdk_version = self.adb.get_sdk_version()
         return self.sdk_version
 
-    def get_display_info(self, refresh=True) -> dict:
+    def get_display_info(self, refresh=False) -> dict:
         """
-        Get device display information, including width, height and density.
+        Get device display information, including width, height and density. The display info is cached by adb
+        until the screen is rotated.
 
         :param refresh: If set to True, refresh the display info instead of using the old values.
         """
-        if not self.display_info or refresh:
-            self.display_info = self.adb.get_display_info()
+        self.display_info = self.adb.get_display_info(refresh=refresh)
         return self.display_info
 
     def get_width(self, refresh=False):
@@ -225,7 +227,7 @@ class Device(object):
         if 'height' in display_info:
             height = display_info['height']
         elif not refresh:
-            height = self.get_width(refresh=True)
+            height = self.get_height(refresh=True)
         else:
             self.logger.warning('Height not found in display info')
         return height
@@ -331,11 +333,13 @@ class Device(object):
                 services.append('{0}/{1}'.format(package, service))
         return services
 
-    def install_app(self, app):
+    def install_app(self, app, skip_installed: bool = False):
         """
         Install an app to device.
 
         :param app: App instance to install.
+        :param skip_installed: Don't install the app again if it is already installed (e.g. the device was restored
+                               from a snapshot taken after the installation).
         """
         if not isinstance(app, App):
             raise TypeError('The app to install has to be an instance of App object')
@@ -348,16 +352,19 @@ class Device(object):
             install_cmd.append('-g')
         install_cmd.append(app.apk_path)
 
-        self.logger.info('Installing application into device')
-        install_output = self.adb.run_cmd(install_cmd)
+        if skip_installed and package_name in self.adb.get_installed_apps():
+            self.logger.info('Application already installed into device')
+        else:
+            self.logger.info('Installing application into device')
+            install_output = self.adb.run_cmd(install_cmd)
 
-        try:
-            install_result = install_output.splitlines()[-1]
-        except Exception:
-            install_result = None
+            try:
+                install_result = install_output.splitlines()[-1]
+            except Exception:
+                install_result = None
 
-        if not install_result or install_result.lower().strip() != 'success':
-            raise RuntimeError('Unable to install app: {0}'.format(install_result))
+            if not install_result or install_result.lower().strip() != 'success':
+                raise RuntimeError('Unable to install app: {0}'.format(install_result))
 
         dumpsys_lines = []
         dumpsys_result = self.adb.shell(['dumpsys', 'package', package_name])
@@ -8,6 +8,7 @@ import time
 from .input_event import EventLog, InputEvent, ExitEvent
 from .input_policy import UtgGreedySearchPolicy, UtgReplayPolicy
 from p3detector.prediction_model import PredictionModel
+from deadline import Watchdog
 
 if 'DEFAULT_EVENT_INTERVAL' in os.environ:
     DEFAULT_EVENT_INTERVAL = os.environ['DEFAULT_EVENT_INTERVAL']
@@ -21,7 +22,7 @@ class InputManager(object):
     """
 
     def __init__(self, device, app, replay: bool = False, max_actions: int = 30, timeout_privacy: int = 60,
-                 pdetector: PredictionModel = None, md5_app=None):
+                 pdetector: PredictionModel = None, md5_app=None, watchdog: Watchdog = None):
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
         self.device = device
@@ -39,10 +40,10 @@ class InputManager(object):
 
         if self.replay:
             self.policy = UtgReplayPolicy(self.device, self.app, self.max_actions, self.timeout_privacy,
-                                          self.pdetector, self.md5_app, self.device.output_dir)
+                                          self.pdetector, self.md5_app, self.device.output_dir, watchdog)
         else:
             self.policy = UtgGreedySearchPolicy(self.device, self.app, self.max_actions, self.timeout_privacy,
-                                                self.pdetector, self.md5_app)
+                                                self.pdetector, self.md5_app, watchdog)
 
     def add_event(self, event: InputEvent):
         """
@@ -11,6 +11,8 @@ from p3detector.prediction_model import PredictionModel
 import shutil
 from .input_event import InputEvent, KeyEvent, SetTextEvent, IntentEvent, ExitEvent, NopEvent
 from .utg import UTG
+from deadline import Watchdog
+import spans
 import lxml.etree as etree
 
 # This is needed in order to have reproducible results.
@@ -41,7 +43,8 @@ class InputPolicy(ABC):
     The class responsible for generating events to stimulate app behaviour.
     """
 
-    def __init__(self, device, app, max_actions, timeout_privacy, pdetector: PredictionModel, md5_app=None):
+    def __init__(self, device, app, max_actions, timeout_privacy, pdetector: PredictionModel, md5_app=None,
+                 watchdog: Watchdog = None):
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
         self.device = device
@@ -59,6 +62,8 @@ class InputPolicy(ABC):
         self.pdetector = pdetector
         self.md5_app = md5_app
         self.content_privacy_policy_page = None
+        # deadlines of the exploration and of the compliance checks (not watched by default)
+        self.watchdog = watchdog if watchdog is not None else Watchdog()
 
     def start(self, input_manager):
         """
@@ -74,90 +79,94 @@ class InputPolicy(ABC):
         if not os.path.exists(dir_app_complete):
             os.makedirs(dir_app_complete)
 
-        while input_manager.enabled \
-                and not self.detected \
-                and len(self.list_event) < self.max_actions:
+        with self.watchdog.phase("exploration", on_expire=input_manager.stop, strict=False):
+            while input_manager.enabled \
+                    and not self.detected \
+                    and len(self.list_event) < self.max_actions:
 
-            # Start the stimulation by going to the home screen and then start the app.
-            if count == 0:
-                event = KeyEvent(name='HOME')
-                self.device.send_event(event)
-                count += 1
-                continue
+                # Start the stimulation by going to the home screen and then start the app.
+                if count == 0:
+                    event = KeyEvent(name='HOME')
+                    self.device.send_event(event)
+                    count += 1
+                    continue
 
-            if count == 1:
-                event = IntentEvent(intent=self.app.start_intents[0])
-            else:
-                event = self.generate_event()
-
-            input_manager.add_event(event)  # send event to device
-            count += 1  # add event, if the count == 2 --> start app first time
-            if count == 2:  # waiting open first app page
-                time.sleep(2)
-            self.logger.info("Add event to list_event")
-            self.list_event.append(event)
-
-            # if the analysis go out from app's surface we do not analyze the content of the page
-            if self.device.is_foreground(self.app.get_package_name()):
-                if self.device.get_current_state().state_str not in self.list_page_visited:
-
-                    self.logger.info("New page Found --> we need detect if it contains policy page or not")
-                    self.list_page_visited.append(
-                        self.device.get_current_state().state_str)  # add md5 to list_page visited
-                    self.device.adb.shell(['uiautomator dump'])
-                    try:
-                        md5_page = self.device.get_current_state().state_str
-                        xml_name_file = os.path.join(dir_app_complete,
-                                                     "{0}.xml".format(md5_page))
-                        # mCurrentFocus=Window{1316822 u0 com.android.browser/com.android.browser.BrowserActivity}
+                if count == 1:
+                    event = IntentEvent(intent=self.app.start_intents[0])
+                else:
+                    event = self.generate_event()
+
+                input_manager.add_event(event)  # send event to device
+                count += 1  # add event, if the count == 2 --> start app first time
+                if count == 2:  # waiting open first app page
+                    time.sleep(2)
+                self.logger.info("Add event to list_event")
+                self.list_event.append(event)
+
+                # if the analysis go out from app's surface we do not analyze the content of the page
+                if self.device.is_foreground(self.app.get_package_name()):
+                    if self.device.get_current_state().state_str not in self.list_page_visited:
+
+                        self.logger.info("New page Found --> we need detect if it contains policy page or not")
+                        self.list_page_visited.append(
+                            self.device.get_current_state().state_str)  # add md5 to list_page visited
+                        self.device.adb.shell(['uiautomator dump'])
                         try:
-                            self.device.pull_file("/sdcard/window_dump.xml", xml_name_file)  # dump xml page on host dir
-
-                        except Exception as e:
-                            self.logger.error("Error occured when try to dump screenshot image {}".format(e))
-
-                        # etree.tostring(file, pretty_print=True)
-
-                        prepr_text = self.pdetector.preprocess_data(xml_name_file)
-                        if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
-
-                            self.logger.info("Page with more than {} words, check if it is privacy policy page or not "
-                                             .format(MEAN_WORD_POLICY))
-                            self.logger.info("Content page: {}".format(prepr_text))
-                            probability_privacy_policy = float(self.pdetector.predict(prepr_text))
-
-                            self.logger.info("The current page is privacy policy page with {0:.2f}% of probability "
-                                             .format((1 - probability_privacy_policy) * 100))
+                            md5_page = self.device.get_current_state().state_str
+                            xml_name_file = os.path.join(dir_app_complete,
+                                                         "{0}.xml".format(md5_page))
+                            # mCurrentFocus=Window{1316822 u0 com.android.browser/com.android.browser.BrowserActivity}
+                            try:
+                                self.device.pull_file("/sdcard/window_dump.xml", xml_name_file)  # dump xml page on host dir
+
+                            except Exception as e:
+                                self.logger.error("Error occured when try to dump screenshot image {}".format(e))
+
+                            # etree.tostring(file, pretty_print=True)
+
+                            with spans.span("page_classification"):
+                                prepr_text = self.pdetector.preprocess_data(xml_name_file)
+                                probability_privacy_policy = None
+                                if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
+                                    probability_privacy_policy = float(self.pdetector.predict(prepr_text))
+                            if probability_privacy_policy is not None:
+
+                                self.logger.info("Page with more than {} words, check if it is privacy policy page or not "
+                                                 .format(MEAN_WORD_POLICY))
+                                self.logger.info("Content page: {}".format(prepr_text))
+
+                                self.logger.info("The current page is privacy policy page with {0:.2f}% of probability "
+                                                 .format((1 - probability_privacy_policy) * 100))
+
+                                self.detected = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
+                                if self.detected:
+                                    self.content_privacy_policy_page = prepr_text[0]
+                                    try:
+                                        self.device.adb.shell(["screencap -p /sdcard/screen.png"])
+
+                                        self.device.pull_file("/sdcard/screen.png",
+                                                          os.path.join(os.getcwd(), "screenshot_pages",
+                                                                       "{}.png".format(
+                                                                           md5_page)))
+                                    except Exception as e:
+                                        self.logger.error("Error occured when try to dump screenshot image {}".format(e))
+                            else:
+                                self.logger.info(
+                                    "The current page has less than {} word, so it is not probably a privacy policy page ".
+                                    format(MEAN_WORD_POLICY))
+                                self.detected = False
 
-                            self.detected = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
                             if self.detected:
-                                self.content_privacy_policy_page = prepr_text[0]
-                                try:
-                                    self.device.adb.shell(["screencap -p /sdcard/screen.png"])
-
-                                    self.device.pull_file("/sdcard/screen.png",
-                                                      os.path.join(os.getcwd(), "screenshot_pages",
-                                                                   "{}.png".format(
-                                                                       md5_page)))
-                                except Exception as e:
-                                    self.logger.error("Error occured when try to dump screenshot image {}".format(e))
-                        else:
-                            self.logger.info(
-                                "The current page has less than {} word, so it is not probably a privacy policy page ".
-                                format(MEAN_WORD_POLICY))
-                            self.detected = False
-
-                        if self.detected:
-                            self.md5_privacy_policy_page = md5_page
+                                self.md5_privacy_policy_page = md5_page
 
-                    except Exception as e:
-                        self.logger.error("Exception as {}".format(e))
+                        except Exception as e:
+                            self.logger.error("Exception as {}".format(e))
 
 
+                    else:
+                        self.logger.info("Old page, we have already analyzed it")
                 else:
-                    self.logger.info("Old page, we have already analyzed it")
-            else:
-                self.logger.info("We are outside from the app")
+                    self.logger.info("We are outside from the app")
 
         if not input_manager.enabled and not self.detected:
             # we reach timeout
@@ -181,92 +190,95 @@ class InputPolicy(ABC):
             # ToDo
 
             ##################################### TIMEOUT MECHANISM #####################################
-            self.logger.info("Check if the app has a timeout mechanism for the privacy policy")
-            time.sleep(self.timeout_privacy)
-            self.device.adb.shell(['uiautomator dump'])
-            xml_name_file_temp = os.path.join(dir_app_complete,"{0}.xml".format("temp"))
-            try:
-                self.device.pull_file("/sdcard/window_dump.xml", xml_name_file_temp)  # dump xml page on host dir
-            except Exception as e:
-                self.logger.error("Error occured when try to dump screenshot image {}".format(e))
-
-            detected = False
-            prepr_text = self.pdetector.preprocess_data(xml_name_file_temp)
-            if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
-                probability_privacy_policy = float(self.pdetector.predict(prepr_text))
-                detected = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
-            # current_state = self.device.get_current_state().state_str
-            if not detected:
-                self.logger.info("The app has a timeout mechanism")
-                self.timeout_reached = True
-            else:
-                self.logger.info("The privacy policy is still there")
+            with self.watchdog.phase("timeout_check"):
+                self.logger.info("Check if the app has a timeout mechanism for the privacy policy")
+                with spans.span("timeout_privacy_wait"):
+                    time.sleep(self.timeout_privacy)
+                self.device.adb.shell(['uiautomator dump'])
+                xml_name_file_temp = os.path.join(dir_app_complete,"{0}.xml".format("temp"))
+                try:
+                    self.device.pull_file("/sdcard/window_dump.xml", xml_name_file_temp)  # dump xml page on host dir
+                except Exception as e:
+                    self.logger.error("Error occured when try to dump screenshot image {}".format(e))
+
+                detected = False
+                prepr_text = self.pdetector.preprocess_data(xml_name_file_temp)
+                if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
+                    probability_privacy_policy = float(self.pdetector.predict(prepr_text))
+                    detected = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
+                # current_state = self.device.get_current_state().state_str
+                if not detected:
+                    self.logger.info("The app has a timeout mechanism")
+                    self.timeout_reached = True
+                else:
+                    self.logger.info("The privacy policy is still there")
 
             ##################################### CHECK HOME BUTTONS MECHANISM #####################################
-            self.logger.info("Check if the pressing of the HOME button changes the privacy policy page")
-            event = KeyEvent(name='HOME')
-            input_manager.add_event(event)
-            # open app again
-            event = IntentEvent(intent=self.app.start_intents[0])
-            input_manager.add_event(event)
-            time.sleep(3)
-
-            self.device.adb.shell(['uiautomator dump'])
-            xml_name_file_temp = os.path.join(dir_app_complete, "{0}.xml".format("temp"))
-            try:
-                self.device.pull_file("/sdcard/window_dump.xml", xml_name_file_temp)  # dump xml page on host dir
-            except Exception as e:
-                self.logger.error("Error occured when try to dump screenshot image {}".format(e))
-            detected = False
-            prepr_text = self.pdetector.preprocess_data(xml_name_file_temp)
-            if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
-                probability_privacy_policy = float(self.pdetector.predict(prepr_text))
-                detected = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
-
-            # current_state = self.device.get_current_state().state_str
-            if not detected:
-                self.logger.info("Home button change the privacy policy page")
-                self.home_button_change_page = True
+            with self.watchdog.phase("home_check"):
+                self.logger.info("Check if the pressing of the HOME button changes the privacy policy page")
+                event = KeyEvent(name='HOME')
+                input_manager.add_event(event)
+                # open app again
+                event = IntentEvent(intent=self.app.start_intents[0])
+                input_manager.add_event(event)
+                time.sleep(3)
+
+                self.device.adb.shell(['uiautomator dump'])
+                xml_name_file_temp = os.path.join(dir_app_complete, "{0}.xml".format("temp"))
+                try:
+                    self.device.pull_file("/sdcard/window_dump.xml", xml_name_file_temp)  # dump xml page on host dir
+                except Exception as e:
+                    self.logger.error("Error occured when try to dump screenshot image {}".format(e))
+                detected = False
+                prepr_text = self.pdetector.preprocess_data(xml_name_file_temp)
+                if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
+                    probability_privacy_policy = float(self.pdetector.predict(prepr_text))
+                    detected = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
+
+                # current_state = self.device.get_current_state().state_str
+                if not detected:
+                    self.logger.info("Home button change the privacy policy page")
+                    self.home_button_change_page = True
 
             ##################################### CHECK BACK BUTTONS MECHANISM #####################################
-
-            self.logger.info("Check if the pressing of the BACK button changes the privacy policy page")
-            event = KeyEvent(name='BACK')
-            input_manager.add_event(event)
-            # open app again
-            event = IntentEvent(intent=self.app.start_intents[0])
-            input_manager.add_event(event)
-            time.sleep(3)
-            self.device.adb.shell(['uiautomator dump'])
-            xml_name_file_temp = os.path.join(dir_app_complete, "{0}.xml".format("temp"))
-            try:
-                self.device.pull_file("/sdcard/window_dump.xml", xml_name_file_temp)  # dump xml page on host dir
-            except Exception as e:
-                self.logger.error("Error occured when try to dump screenshot image {}".format(e))
-            detected_1 = False
-            prepr_text = self.pdetector.preprocess_data(xml_name_file_temp)
-            if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
-                probability_privacy_policy = float(self.pdetector.predict(prepr_text))
-                detected_1 = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
-
-            event = self.list_event[-1]
-            input_manager.add_event(event)
-            time.sleep(3)
-            self.device.adb.shell(['uiautomator dump'])
-            xml_name_file_temp = os.path.join(dir_app_complete, "{0}.xml".format("temp"))
-            try:
-                self.device.pull_file("/sdcard/window_dump.xml", xml_name_file_temp)  # dump xml page on host dir
-            except Exception as e:
-                self.logger.error("Error occured when try to dump screenshot image {}".format(e))
-            detected_2 = False
-            prepr_text = self.pdetector.preprocess_data(xml_name_file_temp)
-            if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
-                probability_privacy_policy = float(self.pdetector.predict(prepr_text))
-                detected_2 = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
-
-            if not detected_1 and not detected_2:
-                self.logger.info("Back button change the privacy policy page")
-                self.back_button_change_page = True
+            with self.watchdog.phase("back_check"):
+                self.logger.info("Check if the pressing of the BACK button changes the privacy policy page")
+                event = KeyEvent(name='BACK')
+                input_manager.add_event(event)
+                # open app again
+                event = IntentEvent(intent=self.app.start_intents[0])
+                input_manager.add_event(event)
+                time.sleep(3)
+                self.device.adb.shell(['uiautomator dump'])
+                xml_name_file_temp = os.path.join(dir_app_complete, "{0}.xml".format("temp"))
+                try:
+                    self.device.pull_file("/sdcard/window_dump.xml", xml_name_file_temp)  # dump xml page on host dir
+                except Exception as e:
+                    self.logger.error("Error occured when try to dump screenshot image {}".format(e))
+                detected_1 = False
+                prepr_text = self.pdetector.preprocess_data(xml_name_file_temp)
+                if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
+                    probability_privacy_policy = float(self.pdetector.predict(prepr_text))
+                    detected_1 = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
+
+                event = self.list_event[-1]
+                input_manager.add_event(event)
+                time.sleep(3)
+                self.device.adb.shell(['uiautomator dump'])
+                xml_name_file_temp = os.path.join(dir_app_complete, "{0}.xml".format("temp"))
+                try:
+                    self.device.pull_file("/sdcard/window_dump.xml", xml_name_file_temp)  # dump xml page on host dir
+                except Exception as e:
+                    self.logger.error("Error occured when try to dump screenshot image {}".format(e))
+                detected_2 = False
+                prepr_text = self.pdetector.preprocess_data(xml_name_file_temp)
+                if len(prepr_text[0].split(" ")) > MEAN_WORD_POLICY:
+                    probability_privacy_policy = float(self.pdetector.predict(prepr_text))
+                    detected_2 = True if probability_privacy_policy < TRESHOLD_PROBABILITY_PP else False
+
+                if not detected_1 and not detected_2:
+                    self.logger.info("Back button change the privacy policy page")
+                    self.back_button_change_page = True
 
     @abstractmethod
     def generate_event(self):
@@ -278,8 +290,9 @@ class UtgBasedInputPolicy(InputPolicy):
     State-based input policy.
     """
 
-    def __init__(self, device, app, max_actions, timeout_privacy, pdetector: PredictionModel, md5_app: str):
-        super().__init__(device, app, max_actions, timeout_privacy, pdetector, md5_app)
+    def __init__(self, device, app, max_actions, timeout_privacy, pdetector: PredictionModel, md5_app: str,
+                 watchdog: Watchdog = None):
+        super().__init__(device, app, max_actions, timeout_privacy, pdetector, md5_app, watchdog)
 
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
@@ -315,8 +328,9 @@ class UtgGreedySearchPolicy(UtgBasedInputPolicy):
     Depth first strategy to explore UI.
     """
 
-    def __init__(self, device, app, max_actions, timeout_privacy, pdetector: PredictionModel, md5_app: str):
-        super().__init__(device, app, max_actions, timeout_privacy, pdetector, md5_app)
+    def __init__(self, device, app, max_actions, timeout_privacy, pdetector: PredictionModel, md5_app: str,
+                 watchdog: Watchdog = None):
+        super().__init__(device, app, max_actions, timeout_privacy, pdetector, md5_app, watchdog)
 
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
@@ -498,8 +512,9 @@ class UtgReplayPolicy(InputPolicy):
     Replay an exploration generated by an UTG policy.
     """
 
-    def __init__(self, device, app, max_actions, timeout_privacy, pdetector: PredictionModel, md5_app: str, output_dir):
-        super().__init__(device, app, max_actions, timeout_privacy, pdetector, md5_app)
+    def __init__(self, device, app, max_actions, timeout_privacy, pdetector: PredictionModel, md5_app: str, output_dir,
+                 watchdog: Watchdog = None):
+        super().__init__(device, app, max_actions, timeout_privacy, pdetector, md5_app, watchdog)
 
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
@@ -158,7 +158,7 @@ class SmartInput(object):
         'TYPE_DATETIME_VARIATION_TIME': '000000'
     }
 
-    def __init__(self, apk_path: str):
+    def __init__(self, apk_path: str, parsed_apk=None):
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
         self.logger.info('Smart input generation')
@@ -168,7 +168,19 @@ class SmartInput(object):
         self.apk: APK = None
         self.dx: Analysis = None
 
-        self.apk, _, self.dx = AnalyzeAPK(apk_path)
+        # The text fields found by a previous tentative (or run) on the same app are cached by the parsed app, the
+        # dex analysis is not needed to use them.
+        if parsed_apk is not None and parsed_apk.get_smart_inputs() is not None:
+            for key, fields in parsed_apk.get_smart_inputs().items():
+                self.smart_inputs[key] = [TextField(field_id, field_name, field_type, None, is_password=is_password)
+                                          for field_id, field_name, field_type, is_password in fields]
+            self.logger.debug('{0} text fields loaded from the cache'.format(len(self.smart_inputs)))
+            return
+
+        if parsed_apk is not None:
+            self.apk, _, self.dx = parsed_apk.get_analysis()
+        else:
+            self.apk, _, self.dx = AnalyzeAPK(apk_path)
 
         tmp_edit_text_classes = self.get_subclass_names('Landroid/widget/EditText;')
 
@@ -196,6 +208,11 @@ class SmartInput(object):
             self.logger.error('Error during smart input generation: {0}'.format(e))
             raise
 
+        if parsed_apk is not None:
+            parsed_apk.set_smart_inputs({key: [[field.id, field.name, field.type, field.is_password]
+                                               for field in fields]
+                                         for key, fields in self.smart_inputs.items()})
+
     def get_subclass_names(self, class_name: str):
         subclass_names = set()
         edit_text_class = self.dx.get_class_analysis(class_name)
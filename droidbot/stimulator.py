@@ -10,6 +10,9 @@ from .app import App
 from .device import Device
 from .input_manager import InputManager
 from p3detector.prediction_model import PredictionModel
+from parsed_apk import ParsedApk
+from deadline import Watchdog
+import spans
 
 class DroidBot(object):
     """
@@ -18,7 +21,8 @@ class DroidBot(object):
 
     def __init__(self, apk_path: str, timeout: int = 0, output_dir: str = None, device_serial: str = None,
                  replay: bool = False, smart_input: bool = False, max_actions: int = 30, timeout_privacy: int = 60,
-                 pdetector: PredictionModel = None, md5_app: str = None):
+                 pdetector: PredictionModel = None, md5_app: str = None, parsed_apk: ParsedApk = None,
+                 watchdog: Watchdog = None, on_installed=None, app_installed: bool = False):
 
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
@@ -58,14 +62,21 @@ class DroidBot(object):
         self.input_manager = None
         self.pdetector = pdetector
         self.md5_app = md5_app
+        # deadlines of the phases of the analysis (install, frida attach, exploration and compliance checks)
+        self.watchdog = watchdog if watchdog is not None else Watchdog()
+        # called after the installation, before frida is attached (e.g. to take a snapshot of the emulator)
+        self.on_installed = on_installed
+        # the app is already installed on the device restored from a snapshot
+        self.app_installed = app_installed
 
         try:
-            self.app = App(self.apk_path)
+            self.app = App(self.apk_path, parsed_apk)
             self.device = Device(app=self.app, output_dir=self.output_dir, device_serial=device_serial,
                                  replay=replay, smart_input=smart_input)
             self.input_manager = InputManager(device=self.device, app=self.app, replay=replay,
                                               max_actions=self.max_actions, timeout_privacy=self.timeout_privacy,
-                                              pdetector=self.pdetector, md5_app=self.md5_app)
+                                              pdetector=self.pdetector, md5_app=self.md5_app,
+                                              watchdog=self.watchdog)
         except Exception as e:
             self.logger.error('Error during DroidBot initialization: {0}'.format(e))
             self.stop()
@@ -83,13 +94,18 @@ class DroidBot(object):
                 self.timer.daemon = True
                 self.timer.start()
 
-            self.device.set_up()
-            self.device.connect()
-            self.device.install_app(self.app)
+            with spans.span("device_connect"):
+                self.device.set_up()
+                self.device.connect()
+            with self.watchdog.phase("install"):
+                self.device.install_app(self.app, skip_installed=self.app_installed)
+            if self.on_installed is not None:
+                self.on_installed()
             if frida_monitoring is not None:
                 path_file_monitoring = os.path.join(os.getcwd(), "hook", self.md5_app,
                                                     "frida_api.txt")
-                frida_monitoring.start(self.app.package_name, 0, path_file_monitoring)
+                with self.watchdog.phase("frida_attach"):
+                    frida_monitoring.start(self.app.package_name, 0, path_file_monitoring)
             self.input_manager.start()
         except KeyboardInterrupt:
             if not self.input_manager.exit_event_received:
@@ -9,8 +9,12 @@ from random_interaction.random_interaction import RandomInteraction
 import subprocess
 import frida_monitoring
 from p3detector.prediction_model import PredictionModel
+from parsed_apk import ParsedApk
+from deadline import Watchdog
 import json
+import random
 import sys
+import time
 
 if 'LOG_LEVEL' in os.environ:
     log_level = os.environ['LOG_LEVEL']
@@ -22,6 +26,38 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
                     datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
 
+TYPE_SIMULATED = "simulated"
+# Mean duration (in seconds) and probability of failure of the simulated analysis.
+SIMULATED_ANALYSIS_TIME = float(os.environ.get('SIMULATED_ANALYSIS_TIME', 30))
+SIMULATED_FAILURE_RATE = float(os.environ.get('SIMULATED_FAILURE_RATE', 0.05))
+
+
+class SimulatedInteraction(object):
+    """
+    Analysis that does not touch the emulator: it lasts a random time around SIMULATED_ANALYSIS_TIME and fails with
+    probability SIMULATED_FAILURE_RATE. With the fake backend of the emulator manager it measures the scheduler, the
+    retries and the throughput of the analysis without virtual machines.
+    """
+
+    def __init__(self, max_actions: int, timeout_privacy: int, watchdog: Watchdog = None):
+        self.max_actions = max_actions
+        self.timeout_privacy = timeout_privacy
+        self.watchdog = watchdog if watchdog is not None else Watchdog()
+        self.md5_privacy_policy_page = ""
+        self.detected = False
+        self.timeout_reached = False
+        self.home_button_change_page = False
+        self.back_button_change_page = False
+        self.list_event = []
+
+    def start(self):
+        with self.watchdog.phase("exploration"):
+            time.sleep(random.uniform(0.5, 1.5) * SIMULATED_ANALYSIS_TIME)
+            if random.random() < SIMULATED_FAILURE_RATE:
+                raise RuntimeError("Simulated failure of the analysis")
+        self.detected = random.random() < 0.5
+        self.list_event = [None] * random.randint(1, self.max_actions)
+
 
 def write_results(result, type_analysis, md5_app, dict_analysis_app):
     file_name = md5_app
@@ -62,18 +98,27 @@ def get_cmd_args(args: list = None):
                         help='Maximum actions (in number of events) for the app stimulation')
     parser.add_argument('-a', '--app', type=str, metavar='APP',
                         help='The directory where is the apps')
-    parser.add_argument('--type', type=str, metavar='TYPE', default='Droidbot', choices=["random", "Droidbot"],
+    parser.add_argument('--type', type=str, metavar='TYPE', default='Droidbot',
+                        choices=["random", "Droidbot", TYPE_SIMULATED],
                         help="The type of app stimulation ")
 
     return parser.parse_args(args)
 
 
 def start_analysis(type_analysis: str, app: str, max_actions: int, timeout_privacy: int, pdetector: PredictionModel,
-                   md5_app: str = None, frida_monitoring=None, dict_analysis_app: dict = None):
+                   md5_app: str = None, frida_monitoring=None, dict_analysis_app: dict = None,
+                   device_serial: str = None, parsed_apk: ParsedApk = None, watchdog: Watchdog = None,
+                   on_installed=None, app_installed: bool = False):
+    """
+    Stimulate the app with DroidBot, random interactions or a simulated analysis. With DroidBot on_installed is called
+    after the installation of the app, and app_installed skips the installation of an app already installed.
+    """
     if type_analysis == "Droidbot":
         logger.info("Start Analysis with Droidbot of {}".format(app))
         droidbot = DroidBot(apk_path=app, timeout=0, max_actions=max_actions,
-                            timeout_privacy=timeout_privacy, pdetector=pdetector, md5_app=md5_app)
+                            timeout_privacy=timeout_privacy, pdetector=pdetector, md5_app=md5_app,
+                            device_serial=device_serial, parsed_apk=parsed_apk, watchdog=watchdog,
+                            on_installed=on_installed, app_installed=app_installed)
         if frida_monitoring is not None:
             droidbot.start(frida_monitoring=frida_monitoring)
         else:
@@ -82,12 +127,22 @@ def start_analysis(type_analysis: str, app: str, max_actions: int, timeout_priva
         logger.info("End Analysis with Droidbot of {}".format(app))
         return droidbot.input_manager.policy, dict_analysis_app
 
+    elif type_analysis == TYPE_SIMULATED:
+        logger.info("Start simulated analysis of {}".format(app))
+        simulated_interaction = SimulatedInteraction(max_actions, timeout_privacy, watchdog)
+        simulated_interaction.start()
+        dict_analysis_app = write_results(simulated_interaction, TYPE_SIMULATED, md5_app, dict_analysis_app)
+        logger.info("End simulated analysis of {}".format(app))
+        return simulated_interaction, dict_analysis_app
+
     else:
         logger.info("Start Analysis with RandomInteraction of {}".format(app))
 
         # starting appium
         random_interaction = RandomInteraction(apk_path=app, max_actions=max_actions,
-                                               timeout_privacy=timeout_privacy, pdetector=pdetector, md5_app=md5_app)
+                                               timeout_privacy=timeout_privacy, pdetector=pdetector, md5_app=md5_app,
+                                               device_serial=device_serial, parsed_apk=parsed_apk,
+                                               watchdog=watchdog)
 
         # push file to push package.name and hook.json
         if frida_monitoring is not None:
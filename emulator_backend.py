@@ -0,0 +1,453 @@
+import logging
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+# Sleep time needed to make sure that a VirtualBox command actually finished (in seconds).
+vbox_finish_command_time = 1
+
+# Readiness of a started emulator: first delay between two checks (doubled at each check, up to the max delay) and
+# deadline (in seconds).
+ready_check_delay = 0.5
+ready_check_max_delay = 5
+ready_timeout = 180
+# Timeout of a single adb command and host pinged to check the network of the emulator.
+adb_command_timeout = 10
+ready_network_host = '8.8.8.8'
+
+# Simulated latencies (mean, in seconds) and probability of failure of the fake backend.
+fake_restore_time = 2
+fake_boot_time = 10
+fake_stop_time = 1
+fake_failure_rate = 0.05
+
+# Prefix of the snapshots taken after the installation of an app (see the app snapshots of analysis_worker): an
+# emulator is started from one of them only when it is asked explicitly, otherwise from its base snapshot.
+APP_SNAPSHOT_PREFIX = 'app-'
+
+# States of an emulator.
+STATUS_RUNNING = 'running'
+STATUS_STOPPED = 'stopped'
+STATUS_MISSING = 'missing'
+
+
+class BackendError(Exception):
+    pass
+
+
+def adb_shell(serial: str, command: str) -> str:
+    adb_command = ['adb'] + (['-s', serial] if serial else []) + ['shell', command]
+    return subprocess.check_output(adb_command, stderr=subprocess.STDOUT, timeout=adb_command_timeout).strip().decode()
+
+
+def wait_emulator_ready(serial: str = None, timeout: float = ready_timeout, network: bool = True) -> dict:
+    """
+    Poll the emulator through adb until the boot is completed, the package manager answers and (optionally) the
+    network is up, with an exponential backoff between two polls. Returns as soon as the emulator is ready or when
+    the deadline is exceeded, with the first check that failed.
+    """
+    checks = [('boot_completed', 'getprop sys.boot_completed', lambda output: output == '1'),
+              ('package_manager', 'pm path android', lambda output: output.startswith('package:'))]
+    if network:
+        checks.append(('network', f'ping -c 1 -W 2 {ready_network_host} > /dev/null && echo ok',
+                       lambda output: output.endswith('ok')))
+
+    start_time = time.time()
+    delay = ready_check_delay
+    polls = 0
+    while True:
+        polls += 1
+        failed_check = None
+        if serial and ':' in serial:
+            # the emulators reached through tcp have to be connected again after every restore
+            subprocess.call(['adb', 'connect', serial], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+                            timeout=adb_command_timeout)
+        for name, command, is_ok in checks:
+            try:
+                output = adb_shell(serial, command)
+            except Exception as e:
+                logger.debug(f'Check "{name}" of {serial}: {e}')
+                output = ''
+            if not is_ok(output):
+                failed_check = name
+                break
+        elapsed = time.time() - start_time
+        if failed_check is None:
+            logger.info(f'Emulator {serial} ready in {elapsed:.1f} seconds')
+            return {'ready': True, 'elapsed': elapsed, 'polls': polls, 'failed_check': None}
+        if elapsed + delay > timeout:
+            logger.warning(f'Emulator {serial} not ready in {elapsed:.1f} seconds, check "{failed_check}" failed')
+            return {'ready': False, 'elapsed': elapsed, 'polls': polls, 'failed_check': failed_check}
+        time.sleep(delay)
+        delay = min(delay * 2, ready_check_max_delay)
+
+
+class EmulatorBackend(object):
+    """
+    Virtual machines of the emulators managed by the emulator manager. Every operation acts on a single emulator
+    and blocks until it is done, the emulator manager takes care of the locking.
+    """
+
+    name = None
+
+    def list_vms(self) -> set:
+        raise NotImplementedError()
+
+    def list_running(self) -> set:
+        raise NotImplementedError()
+
+    def status(self, emulator_name: str) -> str:
+        if emulator_name not in self.list_vms():
+            return STATUS_MISSING
+        return STATUS_RUNNING if emulator_name in self.list_running() else STATUS_STOPPED
+
+    def start(self, emulator_name: str, snapshot_name: str = None):
+        """
+        Restore the given snapshot of the emulator (by default the current one) and power it on.
+        """
+        raise NotImplementedError()
+
+    def stop(self, emulator_name: str):
+        """
+        Power off the emulator.
+        """
+        raise NotImplementedError()
+
+    def reset(self, emulator_name: str):
+        """
+        Power off the emulator and restore its last snapshot (its base snapshot if the last one is an app snapshot).
+        """
+        self.stop(emulator_name)
+        time.sleep(vbox_finish_command_time)
+        self.restore_snapshot(emulator_name, self.base_snapshot(emulator_name))
+
+    def take_snapshot(self, emulator_name: str, snapshot_name: str):
+        raise NotImplementedError()
+
+    def restore_snapshot(self, emulator_name: str, snapshot_name: str = None):
+        """
+        Restore the given snapshot of the emulator, by default the current (last) one.
+        """
+        raise NotImplementedError()
+
+    def delete_snapshot(self, emulator_name: str, snapshot_name: str):
+        raise NotImplementedError()
+
+    def current_snapshot(self, emulator_name: str):
+        """
+        Name of the current snapshot of the emulator (the last one taken or restored), None if it has no snapshots.
+        """
+        raise NotImplementedError()
+
+    def base_snapshot(self, emulator_name: str):
+        """
+        Name of the snapshot the app snapshots of the emulator were taken from (the nearest ancestor of the current
+        snapshot that is not an app snapshot), None if the current snapshot is not an app snapshot. It is read from
+        the snapshots of the emulator, so it survives a restart of the emulator manager.
+
+        :raise BackendError: The current snapshot is an app snapshot without a base snapshot.
+        """
+        raise NotImplementedError()
+
+    def clone(self, emulator_name: str, snapshot_name: str, clone_name: str):
+        """
+        Create and register a linked clone of the snapshot of the emulator, the clone shares the disks of the
+        snapshot and stores only its own changes.
+        """
+        raise NotImplementedError()
+
+    def forward_adb_port(self, emulator_name: str, host_port: int):
+        """
+        Forward the host port to the adb port (5555) of the emulator, the emulator has to be powered off.
+        """
+        raise NotImplementedError()
+
+    def delete_vm(self, emulator_name: str):
+        """
+        Unregister the emulator and delete its files.
+        """
+        raise NotImplementedError()
+
+    def wait_ready(self, serial: str = None, timeout: float = ready_timeout, network: bool = True) -> dict:
+        return wait_emulator_ready(serial, timeout, network)
+
+    def disconnect_adb(self, serial: str):
+        """
+        Drop the adb connection of the emulator (and its forwards), the next wait_ready connects again.
+        """
+        subprocess.call(['adb', 'disconnect', serial], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+                        timeout=adb_command_timeout)
+
+
+class VirtualBoxBackend(EmulatorBackend):
+    """
+    Emulators running as VirtualBox virtual machines, managed through VBoxManage.
+    """
+
+    name = 'virtualbox'
+
+    @staticmethod
+    def run(vbox_command: str) -> str:
+        command_result = subprocess.check_output(vbox_command, shell=True, stderr=subprocess.STDOUT)
+        logger.debug(f'Command `{vbox_command}` returned: {command_result.strip().decode()}')
+        return command_result.strip().decode()
+
+    @staticmethod
+    def call(vbox_command: str):
+        """
+        Run the command again after a failure, a non-zero exit code is only logged.
+        """
+        return_code = subprocess.call(vbox_command, shell=True, stderr=subprocess.STDOUT)
+        if return_code != 0:
+            logger.error(f'Command `{vbox_command}` failed with exit code {return_code}')
+
+    @staticmethod
+    def list_names(vbox_command: str) -> set:
+        virtualbox_output = subprocess.check_output(vbox_command, shell=True).strip().decode()
+        return set(re.findall(r'^"(.*)" \{', virtualbox_output, re.MULTILINE))
+
+    def list_vms(self) -> set:
+        return self.list_names('VBoxManage list vms')
+
+    def list_running(self) -> set:
+        return self.list_names('VBoxManage list runningvms')
+
+    def start(self, emulator_name: str, snapshot_name: str = None):
+        if snapshot_name is not None:
+            # a snapshot given explicitly has to exist, the emulator is not started otherwise
+            logger.info(f'Restoring snapshot "{snapshot_name}" for emulator "{emulator_name}"')
+            self.restore_snapshot(emulator_name, snapshot_name)
+        else:
+            self.restore_current_snapshot(emulator_name)
+
+        # Let the snapshot restore finish gracefully before starting the virtual machine.
+        time.sleep(vbox_finish_command_time)
+
+        # Start the emulator virtual machine.
+        logger.info(f'Starting "{emulator_name}" emulator')
+        emulator_command = f'VBoxManage startvm "{emulator_name}"'
+        try:
+            self.run(emulator_command)
+        except Exception as e:
+            logger.error("Exception as {}".format(e))
+            self.call(emulator_command)
+
+        # Let emulator start command finish gracefully.
+        time.sleep(vbox_finish_command_time)
+
+    def restore_current_snapshot(self, emulator_name: str):
+        # Restore the emulator virtual machine to the last snapshot.
+        logger.info(f'Restoring last snapshot for emulator "{emulator_name}"')
+        snapshot_command = f'VBoxManage snapshot "{emulator_name}" restorecurrent'
+        try:
+            self.run(snapshot_command)
+        except Exception as e:
+            logger.error("Exception as {}".format(e))
+            emulator_command_off = f'VBoxManage controlvm "{emulator_name}" poweroff'
+            self.call(emulator_command_off)
+            self.call(snapshot_command)
+
+    def stop(self, emulator_name: str):
+        # Stop the emulator virtual machine.
+        logger.info(f'Stopping "{emulator_name}" emulator')
+        emulator_command = f'VBoxManage controlvm "{emulator_name}" poweroff'
+        try:
+            self.run(emulator_command)
+            logger.info(f'Emulator "{emulator_name}" successfully stopped')
+        except Exception as e:
+            logger.error("Exception as {}".format(e))
+            self.call(emulator_command)
+
+    def reset(self, emulator_name: str):
+        logger.info(f'Resetting "{emulator_name}" emulator')
+        self.run(f'VBoxManage controlvm "{emulator_name}" poweroff')
+
+        # Let the power off finish gracefully before restoring the last snapshot.
+        time.sleep(vbox_finish_command_time)
+
+        # Restore the emulator virtual machine to the last snapshot (not to an app snapshot).
+        self.restore_snapshot(emulator_name, self.base_snapshot(emulator_name))
+
+    def take_snapshot(self, emulator_name: str, snapshot_name: str):
+        logger.info(f'Taking snapshot "{snapshot_name}" of emulator "{emulator_name}"')
+        self.run(f'VBoxManage snapshot "{emulator_name}" take "{snapshot_name}" --live')
+
+    def restore_snapshot(self, emulator_name: str, snapshot_name: str = None):
+        if snapshot_name is None:
+            self.run(f'VBoxManage snapshot "{emulator_name}" restorecurrent')
+        else:
+            self.run(f'VBoxManage snapshot "{emulator_name}" restore "{snapshot_name}"')
+
+    def delete_snapshot(self, emulator_name: str, snapshot_name: str):
+        self.run(f'VBoxManage snapshot "{emulator_name}" delete "{snapshot_name}"')
+
+    def current_snapshot(self, emulator_name: str):
+        vm_info = self.run(f'VBoxManage showvminfo "{emulator_name}" --machinereadable')
+        match = re.search(r'^CurrentSnapshotName="(.*)"$', vm_info, re.MULTILINE)
+        return match.group(1) if match else None
+
+    def base_snapshot(self, emulator_name: str):
+        try:
+            snapshots_info = self.run(f'VBoxManage snapshot "{emulator_name}" list --machinereadable')
+        except subprocess.CalledProcessError:
+            # the emulator has no snapshots
+            return None
+        # the snapshots are nodes of a tree: SnapshotName, its children SnapshotName-1, SnapshotName-2, ...
+        names = dict(re.findall(r'^(SnapshotName(?:-\d+)*)="(.*)"$', snapshots_info, re.MULTILINE))
+        match = re.search(r'^CurrentSnapshotNode="(.*)"$', snapshots_info, re.MULTILINE)
+        node = match.group(1) if match else None
+        if node not in names or not names[node].startswith(APP_SNAPSHOT_PREFIX):
+            return None
+        while node in names and names[node].startswith(APP_SNAPSHOT_PREFIX):
+            node = node.rsplit('-', 1)[0] if '-' in node else None
+        if node not in names:
+            raise BackendError(f'Snapshot "{self.current_snapshot(emulator_name)}" of emulator "{emulator_name}" '
+                               f'has no base snapshot')
+        return names[node]
+
+    def clone(self, emulator_name: str, snapshot_name: str, clone_name: str):
+        logger.info(f'Cloning snapshot "{snapshot_name}" of emulator "{emulator_name}" as "{clone_name}"')
+        self.run(f'VBoxManage clonevm "{emulator_name}" --snapshot "{snapshot_name}" --options link '
+                 f'--name "{clone_name}" --register')
+        # the clone starts from its own snapshot, restored by start and reset as the one of the other emulators
+        self.run(f'VBoxManage snapshot "{clone_name}" take "{snapshot_name}"')
+
+    def forward_adb_port(self, emulator_name: str, host_port: int):
+        # the rule of the golden emulator (if any) is copied by the clone
+        subprocess.call(f'VBoxManage modifyvm "{emulator_name}" --natpf1 delete adb', shell=True,
+                        stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        self.run(f'VBoxManage modifyvm "{emulator_name}" --natpf1 "adb,tcp,127.0.0.1,{host_port},,5555"')
+
+    def delete_vm(self, emulator_name: str):
+        logger.info(f'Deleting emulator "{emulator_name}"')
+        self.run(f'VBoxManage unregistervm "{emulator_name}" --delete')
+
+
+class FakeBackend(EmulatorBackend):
+    """
+    Emulators simulated in memory: every operation sleeps for a random time around the mean latency and fails with
+    the given probability. It is used to measure the scheduler, the retries and the throughput of the analysis
+    (see the simulated analysis of 3PDroid.py) without VirtualBox.
+    """
+
+    name = 'fake'
+
+    def __init__(self, emulators: list = None, boot_time: float = fake_boot_time,
+                 failure_rate: float = fake_failure_rate, seed: int = None):
+        self.vms = set(emulators) if emulators else {'AndroidEmulator'}
+        self.running = set()
+        self.snapshots = {emulator_name: [] for emulator_name in self.vms}
+        self.boot_time = boot_time
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def add_vm(self, emulator_name: str):
+        with self.lock:
+            self.vms.add(emulator_name)
+            self.snapshots.setdefault(emulator_name, [])
+
+    def simulate(self, emulator_name: str, operation: str, latency: float):
+        with self.lock:
+            if emulator_name not in self.vms:
+                raise BackendError(f'Emulator "{emulator_name}" does not exist')
+            duration = self.random.uniform(0.5, 1.5) * latency
+            failed = self.random.random() < self.failure_rate
+        time.sleep(duration)
+        if failed:
+            raise BackendError(f'Simulated failure of {operation} of emulator "{emulator_name}"')
+
+    def list_vms(self) -> set:
+        with self.lock:
+            return set(self.vms)
+
+    def list_running(self) -> set:
+        with self.lock:
+            return set(self.running)
+
+    def start(self, emulator_name: str, snapshot_name: str = None):
+        if snapshot_name is not None:
+            self.restore_snapshot(emulator_name, snapshot_name)
+        else:
+            self.simulate(emulator_name, 'restore', fake_restore_time)
+        self.simulate(emulator_name, 'start', self.boot_time)
+        with self.lock:
+            self.running.add(emulator_name)
+
+    def stop(self, emulator_name: str):
+        self.simulate(emulator_name, 'stop', fake_stop_time)
+        with self.lock:
+            self.running.discard(emulator_name)
+
+    def take_snapshot(self, emulator_name: str, snapshot_name: str):
+        self.simulate(emulator_name, 'snapshot', fake_restore_time)
+        with self.lock:
+            self.snapshots[emulator_name].append(snapshot_name)
+
+    def restore_snapshot(self, emulator_name: str, snapshot_name: str = None):
+        with self.lock:
+            if snapshot_name is not None and snapshot_name not in self.snapshots.get(emulator_name, []):
+                raise BackendError(f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" does not exist')
+        self.simulate(emulator_name, 'restore', fake_restore_time)
+
+    def delete_snapshot(self, emulator_name: str, snapshot_name: str):
+        with self.lock:
+            if snapshot_name not in self.snapshots.get(emulator_name, []):
+                raise BackendError(f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" does not exist')
+            self.snapshots[emulator_name].remove(snapshot_name)
+
+    def current_snapshot(self, emulator_name: str):
+        with self.lock:
+            snapshots = self.snapshots.get(emulator_name)
+            return snapshots[-1] if snapshots else None
+
+    def base_snapshot(self, emulator_name: str):
+        with self.lock:
+            snapshots = self.snapshots.get(emulator_name)
+            if not snapshots or not snapshots[-1].startswith(APP_SNAPSHOT_PREFIX):
+                return None
+            base_snapshots = [snapshot for snapshot in snapshots if not snapshot.startswith(APP_SNAPSHOT_PREFIX)]
+        if not base_snapshots:
+            raise BackendError(f'Snapshot "{snapshots[-1]}" of emulator "{emulator_name}" has no base snapshot')
+        return base_snapshots[-1]
+
+    def clone(self, emulator_name: str, snapshot_name: str, clone_name: str):
+        self.simulate(emulator_name, 'clone', fake_restore_time)
+        with self.lock:
+            self.vms.add(clone_name)
+            self.snapshots[clone_name] = [snapshot_name]
+
+    def forward_adb_port(self, emulator_name: str, host_port: int):
+        self.simulate(emulator_name, 'port forward', 0)
+
+    def delete_vm(self, emulator_name: str):
+        self.simulate(emulator_name, 'delete', fake_stop_time)
+        with self.lock:
+            self.vms.discard(emulator_name)
+            self.running.discard(emulator_name)
+            self.snapshots.pop(emulator_name, None)
+
+    def wait_ready(self, serial: str = None, timeout: float = ready_timeout, network: bool = True) -> dict:
+        # the boot time is simulated by start
+        return {'ready': True, 'elapsed': 0, 'polls': 1, 'failed_check': None}
+
+    def disconnect_adb(self, serial: str):
+        pass
+
+
+# Backends selected with --backend.
+BACKENDS = {VirtualBoxBackend.name: VirtualBoxBackend, FakeBackend.name: FakeBackend}
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+LOCAL_URL_EMULATOR = "http://127.0.0.1:21212"
+# Seconds to connect to the emulator manager, and to wait for the response of an operation on a virtual machine
+# (start, stop, restore, snapshot). The requests waiting on the emulator manager (acquire, wait_ready) wait for
+# their own timeout plus RESPONSE_MARGIN seconds.
+CONNECT_TIMEOUT = 5
+OPERATION_TIMEOUT = 180
+RESPONSE_MARGIN = 30
+# Attempts of a request whose connection failed (the ones timed out are repeated only if idempotent), with
+# RETRY_BACKOFF seconds between two attempts, doubled each time.
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 1
+# Latencies kept for each operation, and size of the pool of connections (one for each emulator stopped at the same
+# time by stop_many).
+LATENCY_WINDOW = 1000
+POOL_SIZE = 8
+
+
+class EmulatorManagerError(Exception):
+    """
+    The emulator manager was not reachable or did not answer in time.
+    """
+    pass
+
+
+class ManagerResponse(NamedTuple):
+    status_code: int
+    data: dict
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code == 200
+
+    @property
+    def message(self) -> str:
+        return self.data.get("message", self.data.get("error", ""))
+
+
+class EmulatorManagerClient(object):
+    """
+    Client of the emulator manager: the connections are kept alive and shared by the threads of the process, every
+    request has a timeout and the ones that failed are repeated a bounded number of times. The latency of every
+    operation is recorded (see latency_stats).
+    """
+
+    def __init__(self, url: str = LOCAL_URL_EMULATOR, max_attempts: int = MAX_ATTEMPTS):
+        self.url = url.rstrip("/")
+        self.max_attempts = max_attempts
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def request(self, operation: str, method: str, path: str, timeout: float = OPERATION_TIMEOUT,
+                idempotent: bool = False, **kwargs) -> ManagerResponse:
+        """
+        Send the request, repeated when the connection failed (or timed out, if the request is idempotent).
+
+        :param operation: Name of the operation, the latencies are recorded by operation.
+        :param timeout: Seconds to wait for the response.
+        :raise EmulatorManagerError: The emulator manager did not answer after max_attempts attempts.
+        """
+        start = time.time()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = self.session.request(method, "{}{}".format(self.url, path),
+                                                timeout=(CONNECT_TIMEOUT, timeout), **kwargs)
+                break
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # a request timed out may have been executed, it is repeated only if idempotent
+                if not (idempotent or isinstance(e, requests.ConnectionError)) or attempt == self.max_attempts:
+                    self.record(operation, time.time() - start, failed=True)
+                    raise EmulatorManagerError("{} {} failed after {} attempts: {}".format(method, path, attempt, e))
+                logger.warning("{} {} failed (attempt {}), Exception: {}".format(method, path, attempt, e))
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+        elapsed = time.time() - start
+        self.record(operation, elapsed)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"message": response.text}
+        return ManagerResponse(response.status_code, data, elapsed)
+
+    def record(self, operation: str, elapsed: float, failed: bool = False):
+        with self.lock:
+            self.latencies.setdefault(operation, deque(maxlen=LATENCY_WINDOW)).append(elapsed)
+            if failed:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def latency_stats(self) -> dict:
+        """
+        Number of requests, errors and p50/p95/max latency (seconds) of every operation.
+        """
+        with self.lock:
+            stats = {}
+            for operation, latencies in self.latencies.items():
+                ordered = sorted(latencies)
+                stats[operation] = {"requests": len(ordered), "errors": self.errors.get(operation, 0),
+                                    "p50": statistics.median(ordered),
+                                    "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+                                    "max": ordered[-1]}
+            return stats
+
+    def start(self, emulator_name: str) -> ManagerResponse:
+        return self.request("start", "GET", "/start/{}".format(emulator_name))
+
+    def stop(self, emulator_name: str, failed: bool = False) -> ManagerResponse:
+        return self.request("stop", "GET", "/stop/{}".format(emulator_name), idempotent=True,
+                            params={"failed": int(failed)})
+
+    def stop_many(self, emulator_names: list, failed: bool = False) -> dict:
+        """
+        Stop the emulators at the same time, returns the response (or the error) of each emulator.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(min(len(emulator_names), POOL_SIZE), 1)) as executor:
+            futures = {emulator_name: executor.submit(self.stop, emulator_name, failed)
+                       for emulator_name in emulator_names}
+            for emulator_name, future in futures.items():
+                try:
+                    results[emulator_name] = future.result()
+                except EmulatorManagerError as e:
+                    results[emulator_name] = e
+        return results
+
+    def reset(self, emulator_name: str) -> ManagerResponse:
+        return self.request("reset", "GET", "/reset/{}".format(emulator_name), idempotent=True)
+
+    def acquire(self, timeout: float) -> ManagerResponse:
+        return self.request("acquire", "GET", "/acquire", timeout=timeout + RESPONSE_MARGIN,
+                            params={"timeout": timeout})
+
+    def release(self, emulator_name: str, failed: bool = False) -> ManagerResponse:
+        return self.request("release", "GET", "/release/{}".format(emulator_name), params={"failed": int(failed)})
+
+    def wait_ready(self, emulator_name: str, timeout: float, serial: Optional[str] = None) -> ManagerResponse:
+        params = {"timeout": timeout}
+        if serial is not None:
+            params["serial"] = serial
+        return self.request("wait_ready", "GET", "/wait_ready/{}".format(emulator_name),
+                            timeout=timeout + RESPONSE_MARGIN, idempotent=True, params=params)
+
+    def take_snapshot(self, emulator_name: str, snapshot_name: str) -> ManagerResponse:
+        return self.request("take_snapshot", "POST", "/snapshot/{}/{}".format(emulator_name, snapshot_name))
+
+    def restore(self, emulator_name: str, snapshot_name: str) -> ManagerResponse:
+        return self.request("restore", "GET", "/restore/{}/{}".format(emulator_name, snapshot_name))
+
+    def delete_snapshot(self, emulator_name: str, snapshot_name: str) -> ManagerResponse:
+        return self.request("delete_snapshot", "DELETE", "/snapshot/{}/{}".format(emulator_name, snapshot_name),
+                            idempotent=True)
+
+    def pool(self) -> ManagerResponse:
+        return self.request("pool", "GET", "/pool", timeout=CONNECT_TIMEOUT, idempotent=True)
+
+    def health(self) -> ManagerResponse:
+        return self.request("health", "GET", "/health", timeout=CONNECT_TIMEOUT, idempotent=True)
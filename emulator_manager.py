@@ -1,14 +1,24 @@
+import argparse
+import itertools
 import logging
-import subprocess
+import statistics
+import threading
 import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 import os
 from flask import Flask, request
 from flask import jsonify
 from flask import make_response
-from werkzeug.exceptions import NotFound
+from werkzeug.exceptions import NotFound, BadRequest, HTTPException
 import sys
 
+from emulator_backend import EmulatorBackend, VirtualBoxBackend, FakeBackend, BACKENDS, ready_timeout, \
+    vbox_finish_command_time
+from host_resources import vm_memory_mb, wait_for_headroom
+
 if 'LOG_LEVEL' in os.environ:
     log_level = os.environ['LOG_LEVEL']
 else:
@@ -22,8 +32,587 @@ logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s(
 
 logging.getLogger('werkzeug').disabled = True
 
-# Sleep time needed to make sure that a VirtualBox command actually finished (in seconds).
-vbox_finish_command_time = 1
+# Sleep time before preparing again an emulator of the warm pool whose restore failed (in seconds).
+pool_retry_time = 30
+# The i-th emulator of the warm pool without an explicit adb serial forwards its adb port on 127.0.0.1:5555 + 2 * i.
+adb_host_emulator = '127.0.0.1'
+adb_base_port_emulator = 5555
+
+# Seconds between two refreshes of the registry of the VirtualBox virtual machines.
+registry_refresh_time = 2
+# Number of VirtualBox operations (start, stop, reset) executed at the same time by the asynchronous jobs, and
+# number of finished jobs kept.
+job_workers = 8
+max_finished_jobs = 1000
+
+# The clones of the fleet forward their adb port on 127.0.0.1:fleet_base_port, fleet_base_port + 1, ...
+fleet_base_port = 15555
+
+# Health of the emulators of the warm pool: an emulator is recycled (adb connection dropped, clones created again
+# from the golden snapshot) after recycle_after apps. It is quarantined for quarantine_time seconds, and recycled,
+# after max_consecutive_failures failures in a row or when its boot or analysis time (mean of the last health_window
+# ones) is slow_factor times the median of the other emulators.
+recycle_after = 50
+max_consecutive_failures = 3
+slow_factor = 2.0
+health_window = 10
+quarantine_time = 600
+
+# States of the asynchronous jobs.
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# States of the emulators of the warm pool.
+POOL_DIRTY = 'dirty'
+POOL_PREPARING = 'preparing'
+POOL_READY = 'ready'
+POOL_ACQUIRED = 'acquired'
+POOL_QUARANTINED = 'quarantined'
+
+
+class VmRegistry(object):
+    """
+    Cache of the virtual machines and of the running ones, refreshed in background, so the requests do not list
+    them through the backend (e.g. `VBoxManage list`) every time. Every virtual machine has its own lock: the operations on the same
+    emulator are serialized, the ones on different emulators run at the same time.
+    """
+
+    def __init__(self, refresh_time: float = registry_refresh_time):
+        self.refresh_time = refresh_time
+        self.vms = set()
+        self.running = set()
+        self.refreshed_at = 0
+        # time of the last change made by an operation, not overwritten by a refresh started before it
+        self.changed_at = {}
+        self.lock = threading.Lock()
+        self.vm_locks = {}
+
+    def refresh(self):
+        refresh_start = time.time()
+        vms = backend.list_vms()
+        running = backend.list_running()
+        with self.lock:
+            for emulator_name, changed_at in self.changed_at.items():
+                if changed_at > refresh_start:
+                    if emulator_name in self.running:
+                        running.add(emulator_name)
+                    else:
+                        running.discard(emulator_name)
+            self.vms = vms
+            self.running = running
+            self.refreshed_at = time.time()
+
+    def refresh_if_stale(self):
+        if time.time() - self.refreshed_at > self.refresh_time:
+            self.refresh()
+
+    def start(self):
+        threading.Thread(target=self.refresh_loop, name='vm-registry', daemon=True).start()
+
+    def refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f'Unable to refresh the virtual machines: {e}')
+            time.sleep(self.refresh_time)
+
+    def exists(self, emulator_name: str) -> bool:
+        self.refresh_if_stale()
+        with self.lock:
+            if emulator_name in self.vms:
+                return True
+        # the virtual machine could have been created after the last refresh
+        self.refresh()
+        with self.lock:
+            return emulator_name in self.vms
+
+    def is_running(self, emulator_name: str) -> bool:
+        self.refresh_if_stale()
+        with self.lock:
+            return emulator_name in self.running
+
+    def set_running(self, emulator_name: str, running: bool):
+        with self.lock:
+            if running:
+                self.running.add(emulator_name)
+            else:
+                self.running.discard(emulator_name)
+            self.changed_at[emulator_name] = time.time()
+
+    def vm_lock(self, emulator_name: str) -> threading.Lock:
+        with self.lock:
+            return self.vm_locks.setdefault(emulator_name, threading.Lock())
+
+
+class JobStore(object):
+    """
+    Asynchronous VirtualBox operations: the request returns the id of the job immediately, the operation runs in a
+    thread pool and its progress is read through /jobs/<job_id>.
+    """
+
+    def __init__(self, max_workers: int = job_workers):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vm-job')
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, operation: str, emulator_name: str, function) -> dict:
+        job = {'job_id': uuid.uuid4().hex, 'operation': operation, 'emulator': emulator_name, 'state': JOB_PENDING,
+               'status_code': None, 'message': None, 'submitted_at': time.time(), 'started_at': None,
+               'finished_at': None, 'result': None}
+        with self.lock:
+            self.jobs[job['job_id']] = job
+            finished = [job_id for job_id, old_job in self.jobs.items() if old_job['finished_at'] is not None]
+            for job_id in finished[:max(len(finished) - max_finished_jobs, 0)]:
+                del self.jobs[job_id]
+        self.executor.submit(self.run, job, function)
+        return dict(job)
+
+    def run(self, job: dict, function):
+        with self.lock:
+            job['state'] = JOB_RUNNING
+            job['started_at'] = time.time()
+        result = None
+        try:
+            result, status = function(job['emulator'])
+            state, message = JOB_DONE if status == HTTPStatus.OK else JOB_FAILED, result['message']
+        except HTTPException as e:
+            state, status, message = JOB_FAILED, e.code, e.description
+        except Exception as e:
+            logger.error(f'Job {job["operation"]} of emulator "{job["emulator"]}" failed: {e}')
+            state, status, message = JOB_FAILED, HTTPStatus.INTERNAL_SERVER_ERROR, str(e)
+        with self.lock:
+            job['state'] = state
+            job['status_code'] = int(status)
+            job['message'] = message
+            job['result'] = result if state == JOB_DONE else None
+            job['finished_at'] = time.time()
+
+    def get(self, job_id: str):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+
+# The backend of the emulators, selected with --backend.
+backend: EmulatorBackend = VirtualBoxBackend()
+registry = VmRegistry()
+job_store = JobStore()
+
+
+class VmHealth(object):
+    """
+    Health metrics of every emulator: boot times, analysis times, failures in a row and apps analyzed since the last
+    recycle. Long runs degrade the emulators (adb disconnects, frida-server zombies, slow virtual machines), the
+    metrics tell the warm pool when an emulator has to be recycled or quarantined.
+    """
+
+    def __init__(self, window: int = health_window):
+        self.window = window
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def get_metrics(self, emulator_name: str) -> dict:
+        if emulator_name not in self.metrics:
+            self.metrics[emulator_name] = {'boot_times': deque(maxlen=self.window),
+                                           'analysis_times': deque(maxlen=self.window),
+                                           'apps': 0, 'apps_total': 0, 'failures_total': 0,
+                                           'boot_failures': 0, 'analysis_failures': 0, 'recycles': 0, 'quarantines': 0,
+                                           'quarantined_until': None, 'started_at': None}
+        return self.metrics[emulator_name]
+
+    def record_boot(self, emulator_name: str, seconds: float):
+        with self.lock:
+            metrics = self.get_metrics(emulator_name)
+            metrics['boot_times'].append(seconds)
+            metrics['boot_failures'] = 0
+
+    def record_failure(self, emulator_name: str):
+        """
+        The emulator did not start or was not ready.
+        """
+        with self.lock:
+            metrics = self.get_metrics(emulator_name)
+            metrics['failures_total'] += 1
+            metrics['boot_failures'] += 1
+
+    def record_analysis(self, emulator_name: str, seconds: float, failed: bool = False):
+        with self.lock:
+            metrics = self.get_metrics(emulator_name)
+            metrics['apps'] += 1
+            metrics['apps_total'] += 1
+            if failed:
+                metrics['failures_total'] += 1
+                metrics['analysis_failures'] += 1
+            else:
+                metrics['analysis_times'].append(seconds)
+                metrics['analysis_failures'] = 0
+
+    def is_slow(self, emulator_name: str, key: str) -> bool:
+        """
+        True if the mean of the last times of the emulator is slow_factor times the median of the other emulators,
+        once half of the window is filled.
+        """
+        times = self.metrics[emulator_name][key]
+        others = [statistics.mean(metrics[key]) for name, metrics in self.metrics.items()
+                  if name != emulator_name and len(metrics[key]) >= self.window // 2]
+        if len(times) < self.window // 2 or not others:
+            return False
+        return statistics.mean(times) > slow_factor * statistics.median(others)
+
+    def diagnose(self, emulator_name: str):
+        """
+        Reason why the emulator has to be quarantined, None if it is healthy.
+        """
+        with self.lock:
+            metrics = self.get_metrics(emulator_name)
+            if metrics['boot_failures'] >= max_consecutive_failures:
+                return f'{metrics["boot_failures"]} boot failures in a row'
+            if metrics['analysis_failures'] >= max_consecutive_failures:
+                return f'{metrics["analysis_failures"]} analysis failures in a row'
+            if self.is_slow(emulator_name, 'boot_times'):
+                return 'slow boot'
+            if self.is_slow(emulator_name, 'analysis_times'):
+                return 'slow analysis'
+            return None
+
+    def record_start(self, emulator_name: str):
+        """
+        The emulator was started through /start, its analysis time is recorded by record_stop.
+        """
+        with self.lock:
+            self.get_metrics(emulator_name)['started_at'] = time.time()
+
+    def record_stop(self, emulator_name: str, failed: bool = False):
+        with self.lock:
+            started_at = self.get_metrics(emulator_name)['started_at']
+            self.metrics[emulator_name]['started_at'] = None
+        if started_at is not None:
+            self.record_analysis(emulator_name, time.time() - started_at, failed)
+
+    def needs_recycle(self, emulator_name: str) -> bool:
+        with self.lock:
+            return self.get_metrics(emulator_name)['apps'] >= recycle_after
+
+    def quarantine(self, emulator_name: str):
+        with self.lock:
+            metrics = self.get_metrics(emulator_name)
+            metrics['quarantines'] += 1
+            metrics['quarantined_until'] = time.time() + quarantine_time
+
+    def quarantine_remaining(self, emulator_name: str) -> float:
+        with self.lock:
+            quarantined_until = self.get_metrics(emulator_name)['quarantined_until']
+            return max(quarantined_until - time.time(), 0) if quarantined_until is not None else 0
+
+    def recycled(self, emulator_name: str):
+        """
+        The emulator was recycled, its metrics start again.
+        """
+        with self.lock:
+            metrics = self.get_metrics(emulator_name)
+            metrics['boot_times'].clear()
+            metrics['analysis_times'].clear()
+            metrics['apps'] = 0
+            metrics['boot_failures'] = 0
+            metrics['analysis_failures'] = 0
+            metrics['quarantined_until'] = None
+            metrics['recycles'] += 1
+
+    def status(self) -> dict:
+        with self.lock:
+            return {name: {'apps': metrics['apps'], 'apps_total': metrics['apps_total'],
+                           'failures_total': metrics['failures_total'],
+                           'boot_failures': metrics['boot_failures'],
+                           'analysis_failures': metrics['analysis_failures'],
+                           'boot_time': statistics.mean(metrics['boot_times']) if metrics['boot_times'] else None,
+                           'analysis_time': statistics.mean(metrics['analysis_times'])
+                           if metrics['analysis_times'] else None,
+                           'recycles': metrics['recycles'], 'quarantines': metrics['quarantines'],
+                           'quarantined_for': max(metrics['quarantined_until'] - time.time(), 0)
+                           if metrics['quarantined_until'] is not None else None}
+                    for name, metrics in self.metrics.items()}
+
+
+class WarmPool(object):
+    """
+    Emulators restored to their last snapshot and started in background, so an emulator is ready when an analysis
+    acquires it and the restore and boot of the next emulator overlap the analysis of the current app. A released
+    emulator is powered off, restored and started again by its own thread, and recycled or quarantined when its
+    health degrades (see VmHealth).
+    """
+
+    def __init__(self, emulators: list):
+        # (name, adb serial) of the emulators of the pool
+        self.serials = dict(emulators)
+        self.states = {name: POOL_DIRTY for name, _ in emulators}
+        self.acquired_at = {}
+        # emulators to recycle before they are prepared again
+        self.to_recycle = set()
+        self.condition = threading.Condition()
+
+    def start(self):
+        for emulator_name in list(self.states):
+            self.start_prepare_thread(emulator_name)
+
+    def start_prepare_thread(self, emulator_name: str):
+        threading.Thread(target=self.prepare_loop, args=(emulator_name,), name=f'pool-{emulator_name}',
+                         daemon=True).start()
+
+    def add(self, emulator_name: str, serial: str):
+        with self.condition:
+            self.serials[emulator_name] = serial
+            self.states[emulator_name] = POOL_DIRTY
+        self.start_prepare_thread(emulator_name)
+
+    def remove(self, emulator_name: str) -> bool:
+        """
+        Take the emulator out of the pool, only if it is not acquired or being prepared. False otherwise.
+        """
+        with self.condition:
+            if self.states.get(emulator_name) not in [POOL_READY, POOL_DIRTY, POOL_QUARANTINED]:
+                return False
+            del self.states[emulator_name]
+            del self.serials[emulator_name]
+            self.condition.notify_all()
+            return True
+
+    def prepare_loop(self, emulator_name: str):
+        while True:
+            with self.condition:
+                while self.states.get(emulator_name) not in [POOL_DIRTY, POOL_QUARANTINED, None]:
+                    self.condition.wait()
+                if emulator_name not in self.states:
+                    # removed from the pool
+                    return
+                quarantined = self.states[emulator_name] == POOL_QUARANTINED
+                if not quarantined:
+                    self.states[emulator_name] = POOL_PREPARING
+            if quarantined:
+                self.wait_quarantine(emulator_name)
+                continue
+            try:
+                logger.info(f'Preparing emulator "{emulator_name}" of the warm pool')
+                with registry.vm_lock(emulator_name):
+                    if is_emulator_running(emulator_name):
+                        power_off_emulator(emulator_name)
+                        # Let the power off finish gracefully before restoring the last snapshot.
+                        time.sleep(vbox_finish_command_time)
+                    with self.condition:
+                        recycle = emulator_name in self.to_recycle
+                        self.to_recycle.discard(emulator_name)
+                    if recycle:
+                        recycle_emulator(emulator_name, self.serials[emulator_name])
+                    # the emulator is started again only when the memory of the host can hold it
+                    while not wait_for_headroom(vm_memory_mb(), f'emulator "{emulator_name}" of the warm pool'):
+                        logger.warning(f'Emulator "{emulator_name}" of the warm pool still waiting for memory')
+                    boot_start = time.time()
+                    restore_and_start_emulator(emulator_name)
+                readiness = backend.wait_ready(self.serials[emulator_name])
+                if not readiness['ready']:
+                    raise RuntimeError(f'not ready after {readiness["elapsed"]:.1f} seconds, '
+                                       f'check "{readiness["failed_check"]}" failed')
+                health.record_boot(emulator_name, time.time() - boot_start)
+                state = POOL_READY
+                logger.info(f'Emulator "{emulator_name}" of the warm pool ready')
+            except Exception as e:
+                logger.error(f'Unable to prepare emulator "{emulator_name}": {e}')
+                health.record_failure(emulator_name)
+                state = POOL_DIRTY
+            # the boot of the emulator is slow or failed too many times
+            reason = health.diagnose(emulator_name)
+            if reason is not None:
+                state = self.quarantine(emulator_name, reason)
+            elif state == POOL_DIRTY:
+                time.sleep(pool_retry_time)
+            with self.condition:
+                if emulator_name in self.states:
+                    self.states[emulator_name] = state
+                self.condition.notify_all()
+
+    def quarantine(self, emulator_name: str, reason: str) -> str:
+        logger.warning(f'Emulator "{emulator_name}" quarantined for {quarantine_time} seconds: {reason}')
+        health.quarantine(emulator_name)
+        with self.condition:
+            self.to_recycle.add(emulator_name)
+        return POOL_QUARANTINED
+
+    def wait_quarantine(self, emulator_name: str):
+        """
+        Power off the quarantined emulator and wait for the end of the quarantine, then the emulator is recycled and
+        prepared again.
+        """
+        with registry.vm_lock(emulator_name):
+            if is_emulator_running(emulator_name):
+                try:
+                    power_off_emulator(emulator_name)
+                except Exception as e:
+                    logger.error(f'Unable to power off emulator "{emulator_name}": {e}')
+        with self.condition:
+            while self.states.get(emulator_name) == POOL_QUARANTINED and health.quarantine_remaining(emulator_name):
+                self.condition.wait(health.quarantine_remaining(emulator_name))
+            if self.states.get(emulator_name) == POOL_QUARANTINED:
+                logger.info(f'Quarantine of emulator "{emulator_name}" over')
+                self.states[emulator_name] = POOL_DIRTY
+
+    def acquire(self, timeout: float = 0):
+        """
+        Returns the name of a ready emulator, marked as acquired, or None if no emulator is ready within timeout
+        seconds.
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                ready = [name for name, state in self.states.items() if state == POOL_READY]
+                if ready:
+                    self.states[ready[0]] = POOL_ACQUIRED
+                    self.acquired_at[ready[0]] = time.time()
+                    return ready[0]
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    def release(self, emulator_name: str, failed: bool = False) -> bool:
+        """
+        Give back an acquired emulator, it is restored and started again in background (recycled or quarantined if
+        its health degraded). The analysis time is recorded in the health metrics, unless the analysis failed. False
+        if it was not acquired.
+        """
+        with self.condition:
+            if self.states.get(emulator_name) != POOL_ACQUIRED:
+                return False
+            health.record_analysis(emulator_name, time.time() - self.acquired_at.pop(emulator_name), failed)
+            reason = health.diagnose(emulator_name)
+            if reason is not None:
+                self.states[emulator_name] = self.quarantine(emulator_name, reason)
+            else:
+                if health.needs_recycle(emulator_name):
+                    logger.info(f'Emulator "{emulator_name}" analyzed {recycle_after} apps, it will be recycled')
+                    self.to_recycle.add(emulator_name)
+                self.states[emulator_name] = POOL_DIRTY
+            self.condition.notify_all()
+            return True
+
+    def status(self) -> dict:
+        with self.condition:
+            return {name: {'state': state, 'serial': self.serials[name],
+                           'acquired_for': time.time() - self.acquired_at[name] if name in self.acquired_at else None}
+                    for name, state in self.states.items()}
+
+
+class Fleet(object):
+    """
+    Linked clones of the snapshot of a golden emulator (rooted, with the DroidBot app and its accessibility service
+    enabled), each with its own adb port forward and registered with the warm pool. A linked clone shares the disks
+    of the snapshot, so it is created and deleted in seconds: the fleet grows and shrinks with the apps to analyze.
+    """
+
+    def __init__(self):
+        # name of the clone -> golden emulator, snapshot and adb port
+        self.clones = {}
+        self.lock = threading.Lock()
+
+    def reserve_clone(self, golden_name: str, snapshot_name: str) -> tuple:
+        with self.lock:
+            clone_name = next(f'{golden_name}-clone-{i}' for i in itertools.count(1)
+                              if f'{golden_name}-clone-{i}' not in self.clones)
+            used_ports = {clone['port'] for clone in self.clones.values()}
+            port = next(port for port in itertools.count(fleet_base_port) if port not in used_ports)
+            self.clones[clone_name] = {'golden': golden_name, 'snapshot': snapshot_name, 'port': port}
+            return clone_name, port
+
+    def grow(self, golden_name: str, snapshot_name: str, count: int) -> list:
+        """
+        Create count clones of the snapshot of the golden emulator and add them to the warm pool.
+        """
+        created = []
+        for _ in range(count):
+            clone_name, port = self.reserve_clone(golden_name, snapshot_name)
+            try:
+                with registry.vm_lock(golden_name):
+                    backend.clone(golden_name, snapshot_name, clone_name)
+                backend.forward_adb_port(clone_name, port)
+            except Exception as e:
+                logger.error(f'Unable to create clone "{clone_name}": {e}')
+                with self.lock:
+                    del self.clones[clone_name]
+                if clone_name in backend.list_vms():
+                    backend.delete_vm(clone_name)
+                raise
+            registry.refresh()
+            get_warm_pool().add(clone_name, f'{adb_host_emulator}:{port}')
+            logger.info(f'Clone "{clone_name}" added to the fleet (adb port {port})')
+            created.append(clone_name)
+        return created
+
+    def remove(self, clone_name: str) -> bool:
+        """
+        Take the clone out of the warm pool, power it off and delete it. False if the clone is in use.
+        """
+        with self.lock:
+            if clone_name not in self.clones:
+                raise NotFound(f'Clone "{clone_name}" does not exist')
+        if warm_pool is not None and clone_name in warm_pool.serials and not warm_pool.remove(clone_name):
+            return False
+        with registry.vm_lock(clone_name):
+            if is_emulator_running(clone_name):
+                power_off_emulator(clone_name)
+                time.sleep(vbox_finish_command_time)
+            backend.delete_vm(clone_name)
+        registry.refresh()
+        with self.lock:
+            del self.clones[clone_name]
+        logger.info(f'Clone "{clone_name}" removed from the fleet')
+        return True
+
+    def rebuild(self, clone_name: str):
+        """
+        Delete the clone and create it again from the golden snapshot, with the same adb port. The caller holds the
+        lock of the clone, which has to be powered off.
+        """
+        with self.lock:
+            clone = dict(self.clones[clone_name])
+        backend.delete_vm(clone_name)
+        with registry.vm_lock(clone['golden']):
+            backend.clone(clone['golden'], clone['snapshot'], clone_name)
+        backend.forward_adb_port(clone_name, clone['port'])
+        registry.refresh()
+
+    def shrink(self, count: int) -> list:
+        """
+        Delete up to count clones not in use, the last created first.
+        """
+        removed = []
+        with self.lock:
+            clone_names = sorted(self.clones, key=lambda name: -self.clones[name]['port'])
+        for clone_name in clone_names:
+            if len(removed) >= count:
+                break
+            if self.remove(clone_name):
+                removed.append(clone_name)
+        return removed
+
+    def status(self) -> dict:
+        with self.lock:
+            return {name: dict(clone) for name, clone in self.clones.items()}
+
+
+# The warm pool, None if the emulator manager was started without --pool and no fleet was created.
+warm_pool = None
+warm_pool_lock = threading.Lock()
+fleet = Fleet()
+health = VmHealth()
+
+
+def get_warm_pool() -> WarmPool:
+    global warm_pool
+    with warm_pool_lock:
+        if warm_pool is None:
+            warm_pool = WarmPool([])
+        return warm_pool
 
 
 def create_app():
@@ -59,17 +648,88 @@ def internal_error(error):
 
 
 def emulator_exists(emulator_name: str):
-    vbox_command = 'VBoxManage list vms'
-    virtualbox_output = subprocess.check_output(vbox_command, shell=True).strip().decode()
     # True if the emulator is exists, False otherwise.
-    return f'"{emulator_name}"' in virtualbox_output
+    return registry.exists(emulator_name)
 
 
 def is_emulator_running(emulator_name: str):
-    vbox_command = 'VBoxManage list runningvms'
-    virtualbox_output = subprocess.check_output(vbox_command, shell=True).strip().decode()
     # True if the emulator is running, False otherwise.
-    return f'"{emulator_name}"' in virtualbox_output
+    return registry.is_running(emulator_name)
+
+
+def restore_and_start_emulator(emulator_name: str, snapshot_name: str = None):
+    # the emulators with app snapshots are started from the snapshot the app snapshots were taken from, never from the
+    # app snapshot that is the current one (e.g. left by an analysis interrupted before deleting it)
+    if snapshot_name is None:
+        snapshot_name = backend.base_snapshot(emulator_name)
+    backend.start(emulator_name, snapshot_name)
+    registry.set_running(emulator_name, True)
+
+
+def power_off_emulator(emulator_name: str):
+    try:
+        backend.stop(emulator_name)
+    finally:
+        registry.set_running(emulator_name, False)
+
+
+def recycle_emulator(emulator_name: str, serial: str):
+    """
+    Drop the adb connection of the emulator powered off, and create it again if it is a clone of the fleet. The
+    caller holds the lock of the emulator.
+    """
+    logger.info(f'Recycling emulator "{emulator_name}"')
+    backend.disconnect_adb(serial)
+    if emulator_name in fleet.status():
+        fleet.rebuild(emulator_name)
+    health.recycled(emulator_name)
+
+
+def start_operation(emulator_name: str):
+    if not emulator_exists(emulator_name):
+        raise NotFound(f'Emulator "{emulator_name}" does not exist')
+    with registry.vm_lock(emulator_name):
+        if not is_emulator_running(emulator_name):
+            restore_and_start_emulator(emulator_name)
+            health.record_start(emulator_name)
+
+            logger.info(f'Emulator "{emulator_name}" successfully started')
+
+            return {'message': f'Emulator "{emulator_name}" started'}, HTTPStatus.OK
+        else:
+            logger.warning(f'Unable to start "{emulator_name}" emulator, another instance of '
+                           f'the emulator is already running')
+            return {'message': f'Emulator "{emulator_name}" already running'}, HTTPStatus.CONFLICT
+
+
+def stop_operation(emulator_name: str, failed: bool = False):
+    if not emulator_exists(emulator_name):
+        raise NotFound(f'Emulator "{emulator_name}" does not exist')
+    with registry.vm_lock(emulator_name):
+        if is_emulator_running(emulator_name):
+            power_off_emulator(emulator_name)
+            health.record_stop(emulator_name, failed)
+            return {'message': f'Emulator "{emulator_name}" stopped'}, HTTPStatus.OK
+        else:
+            logger.warning(f'Unable to stop "{emulator_name}" emulator, there is no instance of '
+                           f'the emulator currently running')
+            return {'message': f'Emulator "{emulator_name}" not running'}, HTTPStatus.CONFLICT
+
+
+def reset_operation(emulator_name: str):
+    if not emulator_exists(emulator_name):
+        raise NotFound(f'Emulator "{emulator_name}" does not exist')
+    with registry.vm_lock(emulator_name):
+        if is_emulator_running(emulator_name):
+            try:
+                backend.reset(emulator_name)
+            finally:
+                registry.set_running(emulator_name, False)
+    return {'message': f'Emulator "{emulator_name}" reset'}, HTTPStatus.OK
+
+
+# Operations that can be executed as asynchronous jobs.
+operations = {'start': start_operation, 'stop': stop_operation, 'reset': reset_operation}
 
 
 @app.route('/start/<emulator_name>', methods=['GET'], strict_slashes=False)
@@ -107,45 +767,8 @@ def start(emulator_name: str):
               type: object
     """
 
-    if not emulator_exists(emulator_name):
-        raise NotFound(f'Emulator "{emulator_name}" does not exist')
-    if not is_emulator_running(emulator_name):
-        # Restore the emulator virtual machine to the last snapshot.
-        logger.info(f'Restoring last snapshot for emulator "{emulator_name}"')
-        snapshot_command = f'VBoxManage snapshot "{emulator_name}" restorecurrent'
-        try:
-            command_result = subprocess.check_output(snapshot_command, shell=True, stderr=subprocess.STDOUT)
-            logger.debug(f'Command `{snapshot_command}` returned: {command_result.strip().decode()}')
-        except Exception as e:
-            logger.error("Exception as {}".format(e))
-            emulator_command_off = f'VBoxManage controlvm "{emulator_name}" poweroff'
-            command_result_off = subprocess.call(emulator_command_off, shell=True, stderr=subprocess.STDOUT)
-            command_result_snapshot = subprocess.call(snapshot_command, shell=True, stderr=subprocess.STDOUT)
-
-        # Let the snapshot restore finish gracefully before starting the virtual machine.
-        time.sleep(vbox_finish_command_time)
-
-        # Start the emulator virtual machine.
-        logger.info(f'Starting "{emulator_name}" emulator')
-        emulator_command = f'VBoxManage startvm "{emulator_name}"'
-        try:
-            command_result = subprocess.check_output(emulator_command, shell=True, stderr=subprocess.STDOUT)
-            logger.debug(f'Command `{emulator_command}` returned: {command_result.strip().decode()}')
-        except Exception as e:
-            logger.error("Exception as {}".format(e))
-            emulator_command_on = f'VBoxManage startvm "{emulator_name}"'
-            command_result_snapshot = subprocess.call(emulator_command_on, shell=True, stderr=subprocess.STDOUT)
-
-        # Let emulator start command finish gracefully.
-        time.sleep(vbox_finish_command_time)
-
-        logger.info(f'Emulator "{emulator_name}" successfully started')
-
-        return make_response(jsonify({'message': f'Emulator "{emulator_name}" started'}))
-    else:
-        logger.warning(f'Unable to start "{emulator_name}" emulator, another instance of '
-                       f'the emulator is already running')
-        return make_response(jsonify({'message': f'Emulator "{emulator_name}" already running'}), HTTPStatus.CONFLICT)
+    result, status = start_operation(emulator_name)
+    return make_response(jsonify(result), status)
 
 
 @app.route('/stop/<emulator_name>', methods=['GET'], strict_slashes=False)
@@ -165,6 +788,12 @@ def stop(emulator_name: str):
               The name of the emulator for which to issue the command
             required: true
             type: string
+          - name: failed
+            in: query
+            description: |
+              Set to 1 if the analysis on the emulator failed (recorded in the health metrics)
+            required: false
+            type: integer
         responses:
           200:
             description: |
@@ -183,27 +812,8 @@ def stop(emulator_name: str):
               type: object
     """
 
-    if not emulator_exists(emulator_name):
-        raise NotFound(f'Emulator "{emulator_name}" does not exist')
-    if is_emulator_running(emulator_name):
-        # Stop the emulator virtual machine.
-        logger.info(f'Stopping "{emulator_name}" emulator')
-        try:
-            emulator_command = f'VBoxManage controlvm "{emulator_name}" poweroff'
-            command_result = subprocess.check_output(emulator_command, shell=True, stderr=subprocess.STDOUT)
-            logger.debug(f'Command `{emulator_command}` returned: {command_result.strip().decode()}')
-            logger.info(f'Emulator "{emulator_name}" successfully stopped')
-
-        except Exception as e:
-            logger.error("Exception as {}".format(e))
-            emulator_command = f'VBoxManage controlvm "{emulator_name}" poweroff'
-            command_result = subprocess.call(emulator_command, shell=True, stderr=subprocess.STDOUT)
-
-        return make_response(jsonify({'message': f'Emulator "{emulator_name}" stopped'}))
-    else:
-        logger.warning(f'Unable to stop "{emulator_name}" emulator, there is no instance of '
-                       f'the emulator currently running')
-        return make_response(jsonify({'message': f'Emulator "{emulator_name}" not running'}), HTTPStatus.CONFLICT)
+    result, status = stop_operation(emulator_name, request.args.get('failed', default=0, type=int) != 0)
+    return make_response(jsonify(result), status)
 
 
 # This has to be used when the emulator crashes in unexpected ways.
@@ -242,26 +852,707 @@ def reset(emulator_name: str):
               type: object
     """
 
+    result, status = reset_operation(emulator_name)
+    return make_response(jsonify(result), status)
+
+
+@app.route('/<operation>/<emulator_name>', methods=['POST'], strict_slashes=False)
+def submit_job(operation: str, emulator_name: str):
+    """
+        Start, stop or reset the emulator asynchronously
+        This endpoint can be used to issue a command (start, stop or reset) without waiting for it, the id of the job
+        is returned immediately and its progress is read through /jobs/<job_id>.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: operation
+            in: path
+            description: |
+              The command to issue: start, stop or reset
+            required: true
+            type: string
+          - name: emulator_name
+            in: path
+            description: |
+              The name of the emulator for which to issue the command
+            required: true
+            type: string
+        responses:
+          202:
+            description: |
+              The job was submitted
+            schema:
+              type: object
+          404:
+            description: |
+              The specified command or emulator doesn't exist
+            schema:
+              type: object
+    """
+
+    if operation not in operations:
+        raise NotFound(f'Command "{operation}" does not exist')
+    if not emulator_exists(emulator_name):
+        raise NotFound(f'Emulator "{emulator_name}" does not exist')
+    job = job_store.submit(operation, emulator_name, operations[operation])
+    logger.info(f'Job {job["job_id"]}: {operation} emulator "{emulator_name}"')
+    return make_response(jsonify(job), HTTPStatus.ACCEPTED)
+
+
+@app.route('/jobs/<job_id>', methods=['GET'], strict_slashes=False)
+def get_job(job_id: str):
+    """
+        Status of an asynchronous job
+        This endpoint can be used to get the state (pending, running, done or failed) and the result of a job.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: job_id
+            in: path
+            description: |
+              The id of the job
+            required: true
+            type: string
+        responses:
+          200:
+            description: |
+              The status of the job
+            schema:
+              type: object
+          404:
+            description: |
+              The specified job doesn't exist
+            schema:
+              type: object
+    """
+
+    job = job_store.get(job_id)
+    if job is None:
+        raise NotFound(f'Job "{job_id}" does not exist')
+    return make_response(jsonify(job))
+
+
+@app.route('/snapshot/<emulator_name>/<snapshot_name>', methods=['POST'], strict_slashes=False)
+def take_snapshot(emulator_name: str, snapshot_name: str):
+    """
+        Take a snapshot of the emulator
+        This endpoint can be used to take a live snapshot of the running emulator (e.g. after an app was installed),
+        restored by /restore. If the name of the snapshot starts with "app-" the emulator is still started from its
+        previous snapshot by /start.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: emulator_name
+            in: path
+            description: |
+              The name of the emulator for which to issue the command
+            required: true
+            type: string
+          - name: snapshot_name
+            in: path
+            description: |
+              The name of the snapshot
+            required: true
+            type: string
+        responses:
+          200:
+            description: |
+              The snapshot was taken successfully
+            schema:
+              type: object
+          404:
+            description: |
+              The specified emulator doesn't exist
+            schema:
+              type: object
+          409:
+            description: |
+              The emulator is not running
+            schema:
+              type: object
+    """
+
+    if not emulator_exists(emulator_name):
+        raise NotFound(f'Emulator "{emulator_name}" does not exist')
+    with registry.vm_lock(emulator_name):
+        if not is_emulator_running(emulator_name):
+            return make_response(jsonify({'message': f'Emulator "{emulator_name}" not running'}),
+                                 HTTPStatus.CONFLICT)
+        backend.take_snapshot(emulator_name, snapshot_name)
+    logger.info(f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" taken')
+    return make_response(jsonify({'message': f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" taken'}))
+
+
+@app.route('/restore/<emulator_name>/<snapshot_name>', methods=['GET'], strict_slashes=False)
+def restore(emulator_name: str, snapshot_name: str):
+    """
+        Restore a snapshot of the emulator
+        This endpoint can be used to power off the emulator, restore the given snapshot and power on the emulator.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: emulator_name
+            in: path
+            description: |
+              The name of the emulator for which to issue the command
+            required: true
+            type: string
+          - name: snapshot_name
+            in: path
+            description: |
+              The name of the snapshot
+            required: true
+            type: string
+        responses:
+          200:
+            description: |
+              The snapshot was restored successfully
+            schema:
+              type: object
+          404:
+            description: |
+              The specified emulator or snapshot doesn't exist
+            schema:
+              type: object
+    """
+
+    if not emulator_exists(emulator_name):
+        raise NotFound(f'Emulator "{emulator_name}" does not exist')
+    with registry.vm_lock(emulator_name):
+        if is_emulator_running(emulator_name):
+            power_off_emulator(emulator_name)
+            # Let the power off finish gracefully before restoring the snapshot.
+            time.sleep(vbox_finish_command_time)
+        try:
+            restore_and_start_emulator(emulator_name, snapshot_name)
+        except Exception as e:
+            logger.error(f'Unable to restore snapshot "{snapshot_name}" of emulator "{emulator_name}": {e}')
+            raise NotFound(f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" can not be restored')
+    logger.info(f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" restored')
+    return make_response(jsonify({'message': f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" restored'}))
+
+
+@app.route('/snapshot/<emulator_name>/<snapshot_name>', methods=['DELETE'], strict_slashes=False)
+def delete_snapshot(emulator_name: str, snapshot_name: str):
+    """
+        Delete a snapshot of the emulator
+        This endpoint can be used to delete a snapshot taken by /snapshot.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: emulator_name
+            in: path
+            description: |
+              The name of the emulator for which to issue the command
+            required: true
+            type: string
+          - name: snapshot_name
+            in: path
+            description: |
+              The name of the snapshot
+            required: true
+            type: string
+        responses:
+          200:
+            description: |
+              The snapshot was deleted successfully
+            schema:
+              type: object
+          404:
+            description: |
+              The specified emulator or snapshot doesn't exist
+            schema:
+              type: object
+    """
+
+    if not emulator_exists(emulator_name):
+        raise NotFound(f'Emulator "{emulator_name}" does not exist')
+    with registry.vm_lock(emulator_name):
+        if snapshot_name == backend.base_snapshot(emulator_name):
+            return make_response(jsonify({'message': f'Snapshot "{snapshot_name}" is the base snapshot of emulator '
+                                                     f'"{emulator_name}"'}), HTTPStatus.CONFLICT)
+        try:
+            backend.delete_snapshot(emulator_name, snapshot_name)
+        except Exception as e:
+            logger.error(f'Unable to delete snapshot "{snapshot_name}" of emulator "{emulator_name}": {e}')
+            raise NotFound(f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" can not be deleted')
+    logger.info(f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" deleted')
+    return make_response(jsonify({'message': f'Snapshot "{snapshot_name}" of emulator "{emulator_name}" deleted'}))
+
+
+@app.route('/wait_ready/<emulator_name>', methods=['GET'], strict_slashes=False)
+def wait_ready(emulator_name: str):
+    """
+        Wait for the emulator to be ready
+        This endpoint can be used to wait until the emulator started is ready to be used: boot completed, package
+        manager and network available. It returns as soon as the emulator is ready.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: emulator_name
+            in: path
+            description: |
+              The name of the emulator for which to issue the command
+            required: true
+            type: string
+          - name: serial
+            in: query
+            description: |
+              The adb serial of the emulator (by default the one of the warm pool, or the only device connected)
+            required: false
+            type: string
+          - name: timeout
+            in: query
+            description: |
+              Seconds to wait for the emulator to be ready
+            required: false
+            type: number
+          - name: network
+            in: query
+            description: |
+              Set to 0 to skip the network check
+            required: false
+            type: integer
+        responses:
+          200:
+            description: |
+              The emulator is ready
+            schema:
+              type: object
+          404:
+            description: |
+              The specified emulator doesn't exist
+            schema:
+              type: object
+          409:
+            description: |
+              The emulator is not running
+            schema:
+              type: object
+          504:
+            description: |
+              The emulator was not ready before the timeout
+            schema:
+              type: object
+    """
+
     if not emulator_exists(emulator_name):
         raise NotFound(f'Emulator "{emulator_name}" does not exist')
-    if is_emulator_running(emulator_name):
-        logger.info(f'Resetting "{emulator_name}" emulator')
+    if not is_emulator_running(emulator_name):
+        return make_response(jsonify({'message': f'Emulator "{emulator_name}" not running'}), HTTPStatus.CONFLICT)
+    serial = request.args.get('serial')
+    if serial is None and warm_pool is not None:
+        serial = warm_pool.serials.get(emulator_name)
+    readiness = backend.wait_ready(serial, request.args.get('timeout', default=ready_timeout, type=float),
+                                    request.args.get('network', default=1, type=int) != 0)
+    if warm_pool is None or emulator_name not in warm_pool.serials:
+        # the warm pool records the boot of its emulators
+        if readiness['ready']:
+            health.record_boot(emulator_name, readiness['elapsed'])
+        else:
+            health.record_failure(emulator_name)
+    if not readiness['ready']:
+        readiness['message'] = f'Emulator "{emulator_name}" not ready'
+        return make_response(jsonify(readiness), HTTPStatus.GATEWAY_TIMEOUT)
+    readiness['message'] = f'Emulator "{emulator_name}" ready'
+    return make_response(jsonify(readiness))
+
+
+@app.route('/acquire', methods=['GET'], strict_slashes=False)
+def acquire():
+    """
+        Acquire an emulator of the warm pool
+        This endpoint can be used to get an emulator of the warm pool already restored and started, the emulator is
+        reserved until it is released.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: timeout
+            in: query
+            description: |
+              Seconds to wait for an emulator to be ready (default 0)
+            required: false
+            type: number
+        responses:
+          200:
+            description: |
+              The name and the adb serial of the emulator acquired
+            schema:
+              type: object
+          409:
+            description: |
+              The warm pool is not enabled
+            schema:
+              type: object
+          503:
+            description: |
+              No emulator is ready
+            schema:
+              type: object
+    """
+
+    if warm_pool is None:
+        return make_response(jsonify({'message': 'Warm pool not enabled'}), HTTPStatus.CONFLICT)
+    timeout = request.args.get('timeout', default=0, type=float)
+    emulator_name = warm_pool.acquire(timeout)
+    if emulator_name is None:
+        logger.warning(f'No emulator of the warm pool ready within {timeout} seconds')
+        return make_response(jsonify({'message': 'No emulator ready'}), HTTPStatus.SERVICE_UNAVAILABLE)
+    logger.info(f'Emulator "{emulator_name}" acquired')
+    return make_response(jsonify({'emulator': emulator_name, 'serial': warm_pool.serials[emulator_name]}))
+
+
+@app.route('/release/<emulator_name>', methods=['GET'], strict_slashes=False)
+def release(emulator_name: str):
+    """
+        Release an emulator of the warm pool
+        This endpoint can be used to give back an acquired emulator, that is restored and started again in
+        background.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: emulator_name
+            in: path
+            description: |
+              The name of the emulator for which to issue the command
+            required: true
+            type: string
+          - name: failed
+            in: query
+            description: |
+              Set to 1 if the analysis on the emulator failed (recorded in the health metrics)
+            required: false
+            type: integer
+        responses:
+          200:
+            description: |
+              The emulator was released successfully
+            schema:
+              type: object
+          404:
+            description: |
+              The specified emulator is not in the warm pool
+            schema:
+              type: object
+          409:
+            description: |
+              The emulator was not acquired
+            schema:
+              type: object
+    """
+
+    if warm_pool is None or emulator_name not in warm_pool.serials:
+        raise NotFound(f'Emulator "{emulator_name}" is not in the warm pool')
+    if not warm_pool.release(emulator_name, request.args.get('failed', default=0, type=int) != 0):
+        return make_response(jsonify({'message': f'Emulator "{emulator_name}" not acquired'}), HTTPStatus.CONFLICT)
+    logger.info(f'Emulator "{emulator_name}" released')
+    return make_response(jsonify({'message': f'Emulator "{emulator_name}" released'}))
+
+
+@app.route('/pool', methods=['GET'], strict_slashes=False)
+def pool():
+    """
+        Status of the warm pool
+        This endpoint can be used to get the state (dirty, preparing, ready or acquired) of the emulators of the pool.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        responses:
+          200:
+            description: |
+              The state of every emulator of the pool
+            schema:
+              type: object
+    """
+
+    return make_response(jsonify(warm_pool.status() if warm_pool is not None else {}))
+
+
+@app.route('/health', methods=['GET'], strict_slashes=False)
+def health_status():
+    """
+        Health of the emulators
+        This endpoint can be used to get the health metrics of every emulator: apps analyzed, failures, mean boot and
+        analysis time, recycles and quarantines. The emulators of the warm pool are recycled and quarantined
+        automatically, for the other ones the reason of the degradation is only reported.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        responses:
+          200:
+            description: |
+              The health metrics of every emulator
+            schema:
+              type: object
+    """
+
+    status = health.status()
+    for emulator_name in status:
+        status[emulator_name]['degraded'] = health.diagnose(emulator_name)
+    return make_response(jsonify(status))
+
+
+def submit_fleet_growth(golden_name: str, snapshot_name: str, count: int) -> dict:
+    def grow_fleet(emulator_name: str):
+        clones = fleet.grow(emulator_name, snapshot_name, count)
+        return {'message': f'{len(clones)} clones of "{emulator_name}" created', 'clones': clones}, HTTPStatus.OK
+
+    return job_store.submit('grow', golden_name, grow_fleet)
+
+
+@app.route('/fleet', methods=['POST'], strict_slashes=False)
+def grow_fleet():
+    """
+        Grow the fleet
+        This endpoint can be used to create linked clones of a snapshot of the golden emulator, each with its own adb
+        port forward and added to the warm pool. The clones are created asynchronously, the id of the job is
+        returned immediately.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: golden
+            in: query
+            description: |
+              The name of the golden emulator
+            required: true
+            type: string
+          - name: snapshot
+            in: query
+            description: |
+              The snapshot of the golden emulator to clone
+            required: true
+            type: string
+          - name: count
+            in: query
+            description: |
+              The number of clones to create (default 1)
+            required: false
+            type: integer
+        responses:
+          202:
+            description: |
+              The job was submitted
+            schema:
+              type: object
+          400:
+            description: |
+              The golden emulator or the snapshot is missing
+            schema:
+              type: object
+          404:
+            description: |
+              The golden emulator doesn't exist
+            schema:
+              type: object
+    """
+
+    golden_name = request.args.get('golden')
+    snapshot_name = request.args.get('snapshot')
+    count = request.args.get('count', default=1, type=int)
+    if not golden_name or not snapshot_name or count < 1:
+        raise BadRequest('The golden emulator, its snapshot and a positive count are needed')
+    if not emulator_exists(golden_name):
+        raise NotFound(f'Emulator "{golden_name}" does not exist')
+    job = submit_fleet_growth(golden_name, snapshot_name, count)
+    logger.info(f'Job {job["job_id"]}: create {count} clones of "{golden_name}"')
+    return make_response(jsonify(job), HTTPStatus.ACCEPTED)
+
+
+@app.route('/fleet', methods=['DELETE'], strict_slashes=False)
+def shrink_fleet():
+    """
+        Shrink the fleet
+        This endpoint can be used to delete clones not in use, the last created first.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: count
+            in: query
+            description: |
+              The number of clones to delete (default 1)
+            required: false
+            type: integer
+        responses:
+          200:
+            description: |
+              The clones deleted
+            schema:
+              type: object
+    """
+
+    removed = fleet.shrink(request.args.get('count', default=1, type=int))
+    return make_response(jsonify({'message': f'{len(removed)} clones deleted', 'clones': removed}))
+
+
+@app.route('/fleet/<clone_name>', methods=['DELETE'], strict_slashes=False)
+def delete_clone(clone_name: str):
+    """
+        Delete a clone
+        This endpoint can be used to delete a clone of the fleet, that is removed from the warm pool.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: clone_name
+            in: path
+            description: |
+              The name of the clone
+            required: true
+            type: string
+        responses:
+          200:
+            description: |
+              The clone was deleted
+            schema:
+              type: object
+          404:
+            description: |
+              The specified clone doesn't exist
+            schema:
+              type: object
+          409:
+            description: |
+              The clone is in use
+            schema:
+              type: object
+    """
+
+    if not fleet.remove(clone_name):
+        return make_response(jsonify({'message': f'Clone "{clone_name}" in use'}), HTTPStatus.CONFLICT)
+    return make_response(jsonify({'message': f'Clone "{clone_name}" deleted'}))
+
+
+@app.route('/fleet', methods=['GET'], strict_slashes=False)
+def fleet_status():
+    """
+        Status of the fleet
+        This endpoint can be used to get the golden emulator, the snapshot and the adb port of every clone.
+        ---
+        tags:
+          - Emulator Manager Endpoint
+        produces:
+          - application/json
+        responses:
+          200:
+            description: |
+              The clones of the fleet
+            schema:
+              type: object
+    """
+
+    return make_response(jsonify(fleet.status()))
+
+
+def get_pool_emulators(emulators: str) -> list:
+    """
+    Returns the list of (emulator name, adb serial) of the warm pool, each emulator is written as NAME or
+    NAME=SERIAL.
+    """
+    pool_emulators = []
+    list_emulators = [emulator.strip() for emulator in emulators.split(',') if emulator.strip()]
+    for i, emulator in enumerate(list_emulators):
+        if '=' in emulator:
+            name, serial = emulator.split('=', 1)
+        else:
+            name, serial = emulator, f'{adb_host_emulator}:{adb_base_port_emulator + 2 * i}'
+        pool_emulators.append((name, serial))
+    return pool_emulators
+
+
+def get_cmd_args(args: list = None):
+    """
+    Parse and return the command line parameters needed for the script execution.
+    :param args: List of arguments to be parsed (by default sys.argv is used).
+    :return: The command line needed parameters.
+    """
 
-        emulator_command = f'VBoxManage controlvm "{emulator_name}" poweroff'
-        command_result = subprocess.check_output(emulator_command, shell=True, stderr=subprocess.STDOUT)
-        logger.debug(f'Command `{emulator_command}` returned: {command_result.strip().decode()}')
+    parser = argparse.ArgumentParser(
+        prog='python emulator_manager.py',
+        description='Start, stop and reset the VirtualBox emulators through http'
+    )
 
-        # Let the power off finish gracefully before restoring the last snapshot.
-        time.sleep(vbox_finish_command_time)
+    parser.add_argument('-p', '--port', type=int, metavar='PORT', default=emulator_manager_port,
+                        help='The port of the emulator manager')
+    parser.add_argument('--backend', type=str, choices=list(BACKENDS), default=VirtualBoxBackend.name,
+                        help='The backend of the emulators: VirtualBox or fake emulators simulated in memory, to '
+                             'benchmark the analysis without virtual machines')
+    parser.add_argument('--fake-emulators', type=str, metavar='NAME,...', default='AndroidEmulator',
+                        help='Comma separated list of the emulators of the fake backend (the ones of the pool are '
+                             'added)')
+    parser.add_argument('--fake-boot-time', type=float, metavar='SECONDS', default=None,
+                        help='Mean boot time of the emulators of the fake backend')
+    parser.add_argument('--fake-failure-rate', type=float, metavar='RATE', default=None,
+                        help='Probability of failure of every operation of the fake backend')
+    parser.add_argument('--fleet', type=str, metavar='GOLDEN:SNAPSHOT',
+                        help='Create --fleet-size linked clones of the snapshot of the golden emulator at start, '
+                             'added to the warm pool')
+    parser.add_argument('--fleet-size', type=int, metavar='N', default=1,
+                        help='Number of clones created at start')
+    parser.add_argument('--pool', type=str, metavar='NAME[=SERIAL],...',
+                        help='Comma separated list of emulators kept restored and started in background, handed out '
+                             'by /acquire and /release')
+    parser.add_argument('--recycle-after', type=int, metavar='N', default=recycle_after,
+                        help='Recycle an emulator of the warm pool after N apps')
+    parser.add_argument('--quarantine-time', type=float, metavar='SECONDS', default=quarantine_time,
+                        help='Seconds an emulator of the warm pool whose health degraded is kept out of the pool')
 
-        # Restore the emulator virtual machine to the last snapshot.
-        snapshot_command = f'VBoxManage snapshot "{emulator_name}" restorecurrent'
-        command_result = subprocess.check_output(snapshot_command, shell=True, stderr=subprocess.STDOUT)
-        logger.debug(f'Command `{snapshot_command}` returned: {command_result.strip().decode()}')
-    return make_response(jsonify({'message': f'Emulator "{emulator_name}" reset'}))
+    return parser.parse_args(args)
 
 
 if __name__ == '__main__':
+    arguments = get_cmd_args()
+    if arguments.backend == FakeBackend.name:
+        fake_emulators = [emulator.strip() for emulator in arguments.fake_emulators.split(',') if emulator.strip()]
+        if arguments.pool:
+            fake_emulators += [name for name, _ in get_pool_emulators(arguments.pool)]
+        fake_options = {'boot_time': arguments.fake_boot_time, 'failure_rate': arguments.fake_failure_rate}
+        backend = FakeBackend(fake_emulators, **{key: value for key, value in fake_options.items()
+                                                 if value is not None})
+    logger.info(f'Emulator backend: {backend.name}')
+    recycle_after, quarantine_time = arguments.recycle_after, arguments.quarantine_time
+    registry.start()
+    if arguments.pool:
+        warm_pool = WarmPool(get_pool_emulators(arguments.pool))
+        warm_pool.start()
+    if arguments.fleet:
+        golden, snapshot = arguments.fleet.split(':', 1)
+        submit_fleet_growth(golden, snapshot, arguments.fleet_size)
     # It's important to bind the port on all interfaces, this way the emulators can be managed from any
     # network on the host machine (this is useful for Docker containers).
-    app.run(host='0.0.0.0', port=emulator_manager_port)
+    app.run(host='0.0.0.0', port=arguments.port, threaded=True)
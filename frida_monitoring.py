@@ -3,7 +3,9 @@ import os
 import logging
 import sys
 
+import spans
 from adb import ADB
+from device_setup import prepare_device, STEP_ROOT, STEP_FRIDA_SERVER
 
 if 'LOG_LEVEL' in os.environ:
     log_level = os.environ['LOG_LEVEL']
@@ -11,75 +13,121 @@ else:
     log_level = logging.INFO
 
 LOCAL_URL_EMULATOR = "http://127.0.0.1:21212"
+# Seconds to wait for frida to find the emulator with the given adb serial.
+FRIDA_DEVICE_TIMEOUT = 10
 logger = logging.getLogger(__name__)
 logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
                     datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
 
 
-file_log_frida = os.path.join(os.getcwd(), "logs")
-list_json_api_invoked = []
+class FridaMonitoring(object):
+    """
+    Frida session and API log of a single emulator. Every analysis worker owns its own instance, so several
+    emulators can be monitored at the same time without sharing the list of API invoked.
+    """
+
+    def __init__(self, device_serial: str = None):
+        self.device_serial = device_serial
+        self.file_log_frida = os.path.join(os.getcwd(), "logs")
+        self.list_json_api_invoked = []
+
+    def get_file_log_frida(self):
+        return self.file_log_frida
+
+    def set_file_log_frida(self, path_file):
+        if os.path.exists(path_file):
+            os.remove(path_file)
+        self.file_log_frida = path_file
+
+    def clean_list_json_api_invoked(self):
+        self.list_json_api_invoked = []
+
+    def get_list_api_invoked(self):
+        return self.list_json_api_invoked
+
+    def on_message(self, message, data):
+        if message['type'] == 'send':
+            if "Error" not in str(message["payload"]):
+                self.list_json_api_invoked.append(message["payload"])
+
+    def reconnect_adb(self, adb: ADB):
+        """
+        Re-connect adb to the emulator. When the emulator has its own serial the adb server is shared with the
+        other workers, so only this device is re-connected instead of killing the server.
+        """
+        if self.device_serial is None:
+            adb.kill_server()
+            adb.connect()
+        else:
+            adb.connect(host=self.device_serial)
+
+    def push_and_start_frida_server(self, adb: ADB):
+        """
+        Restart adbd as root, push the frida server and start it (if it is not already running).
+        """
+        with spans.span("frida_server_start"):
+            prepare_device(adb, self.device_serial, [STEP_ROOT, STEP_FRIDA_SERVER])
+
+    def get_frida_device(self):
+        if self.device_serial is None:
+            return frida.get_usb_device()
+        return frida.get_device(self.device_serial, timeout=FRIDA_DEVICE_TIMEOUT)
+
+    def start(self, package_name, execution_time, file_api_to_monitoring):
+        list_api_to_monitoring = read_api_to_monitoring(file_api_to_monitoring)
+
+        pid = None
+        device = None
+        session = None
+        with spans.span("frida_spawn"):
+            try:
+                device = self.get_frida_device()
+                pid = device.spawn([package_name])
+                session = device.attach(pid)
+            except Exception as e:
+
+                logger.error("Error {}".format(e))
+
+        logger.info("Succesfully attached frida to app")
+
+        with spans.span("frida_script_load", api_to_monitoring=len(list_api_to_monitoring or [])):
+            script_frida = create_script_frida(list_api_to_monitoring,
+                                               os.path.join(os.getcwd(), "frida_scripts",
+                                                            "frida_script_template.js"))
+
+            script = session.create_script(script_frida.strip().replace("\n", ""))
+            script.on("message", self.on_message)
+            script.load()
+
+            device.resume(pid)
+
+
+# Default instance, used when a single emulator is analyzed through the module level functions.
+default_monitoring = FridaMonitoring()
 
 
 def get_file_log_frida():
-    global file_log_frida
-    return file_log_frida
+    return default_monitoring.get_file_log_frida()
 
 
 def set_file_log_frida(path_file):
-    if os.path.exists(path_file):
-        os.remove(path_file)
-    global file_log_frida
-    file_log_frida = path_file
+    default_monitoring.set_file_log_frida(path_file)
 
 
 def clean_list_json_api_invoked():
-    global list_json_api_invoked
-    list_json_api_invoked = []
+    default_monitoring.clean_list_json_api_invoked()
 
 
 def get_list_api_invoked():
-    global list_json_api_invoked
-    return list_json_api_invoked
+    return default_monitoring.get_list_api_invoked()
 
 
 def on_message(message, data):
-    global list_json_api_invoked
-    if message['type'] == 'send':
-        if "Error" not in str(message["payload"]):
-            list_json_api_invoked.append(message["payload"])
+    default_monitoring.on_message(message, data)
 
 
 def push_and_start_frida_server(adb: ADB):
-    """
-
-    Parameters
-    ----------
-    adb
-
-    Returns
-    -------
-
-    """
-    frida_server = os.path.join(os.getcwd(), "resources", "frida-server", "frida-server")
-    try:
-        adb.execute(['root'])
-        adb.connect()
-    except Exception as e:
-        adb.kill_server()
-        logger.error("Error on adb {}".format(e))
-
-    logger.info("Push frida server")
-    try:
-        adb.push_file(frida_server, "/data/local/tmp")
-    except Exception as e:
-        logger.error("Push frida error as {}".format(e))
-        pass
-    logger.info("Add execution permission to frida-server")
-    chmod_frida = ["chmod 755 /data/local/tmp/frida-server"]
-    adb.shell(chmod_frida)
-    logger.info("Start frida server")
-    start_frida = ["cd /data/local/tmp/ && ./frida-server &"]
-    adb.shell(start_frida, is_async=True)
+    default_monitoring.push_and_start_frida_server(adb)
 
 
 def read_api_to_monitoring(file_api_to_monitoring):
@@ -108,29 +156,7 @@ def create_script_frida(list_api_to_monitoring: list, path_frida_script_template
 
 
 def start(package_name, execution_time, file_api_to_monitoring):
-    list_api_to_monitoring = read_api_to_monitoring(file_api_to_monitoring)
-
-    pid = None
-    device = None
-    session = None
-    try:
-        device = frida.get_usb_device()
-        pid = device.spawn([package_name])
-        session = device.attach(pid)
-    except Exception as e:
-
-        logger.error("Error {}".format(e))
-
-    logger.info("Succesfully attached frida to app")
-
-    script_frida = create_script_frida(list_api_to_monitoring,
-                                       os.path.join(os.getcwd(), "frida_scripts", "frida_script_template.js"))
-
-    script = session.create_script(script_frida.strip().replace("\n", ""))
-    script.on("message", on_message)
-    script.load()
-
-    device.resume(pid)
+    default_monitoring.start(package_name, execution_time, file_api_to_monitoring)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import logging
+import os
+import sys
+import time
+from typing import Optional
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+# Memory (MB) always left free for the host, memory of a virtual machine when none is running to measure it, and
+# memory of the androguard analysis (AnalyzeAPK) of an apk: a minimum plus a multiple of the size of the apk.
+MEMORY_RESERVE_MB = float(os.environ.get('MEMORY_RESERVE_MB', 1024))
+VM_MEMORY_MB = float(os.environ.get('VM_MEMORY_MB', 2048))
+APK_ANALYSIS_MEMORY_MB = float(os.environ.get('APK_ANALYSIS_MEMORY_MB', 512))
+APK_ANALYSIS_MEMORY_FACTOR = 30
+# Seconds between two checks of the free memory while waiting for headroom, and maximum wait.
+HEADROOM_POLL_TIME = 5
+HEADROOM_TIMEOUT = 600
+# Names of the processes of the virtual machines of the emulators.
+VM_PROCESS_NAMES = ['VBoxHeadless', 'VirtualBoxVM', 'qemu-system-x86']
+
+# Autoscaling of the workers: a worker is added when the load of the cpus is below SCALE_UP_CPU_LOAD, one more
+# emulator (measured on the running ones) keeps it below MAX_CPU_LOAD and the memory can hold one more emulator and
+# one more androguard analysis, a worker is removed when the load is above
+# MAX_CPU_LOAD or the free memory is below the reserve. At most one change every SCALE_INTERVAL seconds, so the
+# emulator started (or stopped) is seen by the next measure.
+SCALE_UP_CPU_LOAD = 0.7
+MAX_CPU_LOAD = 0.9
+SCALE_INTERVAL = 60
+
+
+class HeadroomError(MemoryError):
+    """
+    The memory of the host was not freed in time for an emulator or an androguard analysis: the host is loaded, the
+    app is not at fault (the tentative of the app is not counted).
+    """
+    pass
+
+
+def available_memory_mb() -> Optional[float]:
+    """
+    Memory (MB) available for new processes without swapping, None if it can not be measured (no /proc).
+    """
+    try:
+        with open('/proc/meminfo', 'r') as meminfo:
+            fields = dict(line.split(':', 1) for line in meminfo)
+    except (OSError, ValueError):
+        return None
+    if 'MemAvailable' in fields:
+        return int(fields['MemAvailable'].split()[0]) / 1024
+    return sum(int(fields[field].split()[0]) for field in ['MemFree', 'Buffers', 'Cached'] if field in fields) / 1024
+
+
+def cpu_load() -> float:
+    """
+    Load of the last minute divided by the number of cpus (1 means all the cpus busy).
+    """
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0
+
+
+def vm_processes() -> list:
+    """
+    Pids of the running virtual machines of the emulators.
+    """
+    pids = []
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return pids
+    for pid in filter(str.isdigit, entries):
+        try:
+            with open('/proc/{0}/comm'.format(pid), 'r') as comm:
+                name = comm.read().strip()
+        except OSError:
+            continue
+        if any(name.startswith(vm_name[:15]) for vm_name in VM_PROCESS_NAMES):
+            pids.append(int(pid))
+    return pids
+
+
+def process_memory_mb(pid: int) -> float:
+    """
+    Resident memory (MB) of the process, 0 if it is not running anymore.
+    """
+    try:
+        with open('/proc/{0}/status'.format(pid), 'r') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0
+
+
+def process_cpu_time(pid: int) -> float:
+    """
+    Cpu time (seconds, user and system) used by the process since its start, 0 if it is not running anymore.
+    """
+    try:
+        with open('/proc/{0}/stat'.format(pid), 'r') as stat:
+            # the fields after the name of the process, that can contain spaces
+            fields = stat.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def vm_memory_mb() -> float:
+    """
+    Memory (MB) used by a virtual machine: the mean of the ones running, VM_MEMORY_MB if none is running.
+    """
+    memory = [process_memory_mb(pid) for pid in vm_processes()]
+    memory = [vm_memory for vm_memory in memory if vm_memory > 0]
+    return sum(memory) / len(memory) if memory else VM_MEMORY_MB
+
+
+def apk_analysis_memory_mb(apk_path: str) -> float:
+    try:
+        apk_size_mb = os.path.getsize(apk_path) / (1024 * 1024)
+    except OSError:
+        apk_size_mb = 0
+    return max(APK_ANALYSIS_MEMORY_MB, APK_ANALYSIS_MEMORY_FACTOR * apk_size_mb)
+
+
+def has_headroom(required_mb: float) -> bool:
+    """
+    True if required_mb can be used leaving the reserve free (always True if the memory can not be measured).
+    """
+    available = available_memory_mb()
+    return available is None or available - required_mb >= MEMORY_RESERVE_MB
+
+
+def wait_for_headroom(required_mb: float, purpose: str, timeout: float = HEADROOM_TIMEOUT) -> bool:
+    """
+    Wait until required_mb of memory can be used leaving the reserve free, False if the memory is still not enough
+    after timeout seconds.
+    """
+    deadline = time.time() + timeout
+    if has_headroom(required_mb):
+        return True
+    logger.warning('Not enough memory for {0} ({1:.0f} MB needed, {2:.0f} MB available), wait'.format(
+        purpose, required_mb + MEMORY_RESERVE_MB, available_memory_mb()))
+    while time.time() < deadline:
+        time.sleep(HEADROOM_POLL_TIME)
+        if has_headroom(required_mb):
+            logger.info('Memory available for {0}'.format(purpose))
+            return True
+    return False
+
+
+def round_or_none(value: Optional[float], digits: int = None) -> Optional[float]:
+    return None if value is None else round(value, digits)
+
+
+class Autoscaler(object):
+    """
+    Number of workers analyzing apps at the same time, between min_workers and max_workers, raised or lowered by
+    one at a time from the load of the cpus, the free memory and the memory used by the virtual machines.
+    """
+
+    def __init__(self, min_workers: int, max_workers: int, interval: float = SCALE_INTERVAL):
+        self.min_workers = max(min(min_workers, max_workers), 1)
+        self.max_workers = max_workers
+        self.interval = interval
+        self.workers = self.min_workers
+        self.changed_at = time.time()
+        self.vm_cpu_times = {}
+
+    def vm_cpu_usage(self) -> dict:
+        """
+        Cpu usage (1 means a whole cpu) of every virtual machine since the previous measure.
+        """
+        now = time.time()
+        usage = {}
+        cpu_times = {}
+        for pid in vm_processes():
+            cpu_times[pid] = (now, process_cpu_time(pid))
+            if pid in self.vm_cpu_times:
+                then, cpu_time = self.vm_cpu_times[pid]
+                usage[pid] = (cpu_times[pid][1] - cpu_time) / max(now - then, 1e-3)
+        self.vm_cpu_times = cpu_times
+        return usage
+
+    def sample(self) -> dict:
+        vm_cpu = self.vm_cpu_usage()
+        sample = {'cpu_load': cpu_load(), 'available_memory_mb': available_memory_mb(), 'vm_memory_mb': vm_memory_mb(),
+                  'vm_cpu': sum(vm_cpu.values()) / len(vm_cpu) if vm_cpu else None}
+        # load of the cpus with one more virtual machine, as busy as the running ones
+        sample['cpu_load_one_more_vm'] = sample['cpu_load'] + (sample['vm_cpu'] or 0) / (os.cpu_count() or 1)
+        return sample
+
+    def update(self, pending: int) -> int:
+        """
+        The number of workers for the next apps, pending is the number of apps waiting for a worker.
+        """
+        if time.time() - self.changed_at < self.interval:
+            return self.workers
+        sample = self.sample()
+        low_memory = sample['available_memory_mb'] is not None and \
+            sample['available_memory_mb'] < MEMORY_RESERVE_MB
+        workers = self.workers
+        if (low_memory or sample['cpu_load'] > MAX_CPU_LOAD) and workers > self.min_workers:
+            workers -= 1
+        elif pending > 0 and workers < self.max_workers and sample['cpu_load'] < SCALE_UP_CPU_LOAD and \
+                sample['cpu_load_one_more_vm'] <= MAX_CPU_LOAD and \
+                has_headroom(sample['vm_memory_mb'] + APK_ANALYSIS_MEMORY_MB):
+            workers += 1
+        if workers != self.workers:
+            logger.info('Workers {0} -> {1} (cpu load {2:.2f}, available memory {3} MB, memory of a virtual '
+                        'machine {4:.0f} MB, cpu of a virtual machine {5})'.format(
+                            self.workers, workers, sample['cpu_load'], round_or_none(sample['available_memory_mb']),
+                            sample['vm_memory_mb'], round_or_none(sample['vm_cpu'], 2)))
+            self.workers = workers
+            self.changed_at = time.time()
+        return self.workers
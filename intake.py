@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import logging
+import os
+import sys
+import time
+
+from job_ledger import JobLedger
+from scheduler import AppScheduler
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+# Seconds between two scans of the intake directory.
+DEFAULT_POLL_INTERVAL = 5
+# Seconds between two logs of the queue depth when nothing changes.
+STATUS_INTERVAL = 60
+
+
+class IntakeWatcher(object):
+    """
+    Watch the intake directory where the apks are dropped (e.g. by a crawler) and add the new ones to the scheduler.
+    The directory is scanned (os.scandir) every poll_interval seconds. An apk is taken only when its size and
+    modification time did not change between two scans, so the files still being copied are not analyzed. The apks
+    already analyzed (see job ledger) are skipped without reading them.
+    """
+
+    def __init__(self, dir_app: str, ledger: JobLedger = None, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.dir_app = dir_app
+        self.ledger = ledger
+        self.poll_interval = poll_interval
+        # (size, mtime) of the apks seen in the last scan and not taken yet
+        self.candidates = {}
+        # (size, mtime) of the apks taken, an apk replaced by a new file is taken again
+        self.taken = {}
+        self.last_status = 0
+        self.last_depth = None
+
+    def scan(self) -> list:
+        """
+        Returns the new apks ready to be analyzed.
+        """
+        new_apps = []
+        candidates = {}
+        try:
+            entries = list(os.scandir(self.dir_app))
+        except OSError as e:
+            logger.error("Unable to scan {}: {}".format(self.dir_app, e))
+            return new_apps
+        for entry in entries:
+            if not entry.name.endswith(".apk") or not entry.is_file():
+                continue
+            try:
+                entry_stat = entry.stat()
+            except OSError:
+                continue
+            signature = (entry_stat.st_size, entry_stat.st_mtime)
+            if self.taken.get(entry.path) == signature:
+                continue
+            if self.candidates.get(entry.path) != signature:
+                # new or still growing, check again at the next scan
+                candidates[entry.path] = signature
+                continue
+            self.taken[entry.path] = signature
+            md5_app = self.ledger.lookup_md5(entry.path) if self.ledger is not None else None
+            if md5_app is not None and self.ledger.is_finished(md5_app):
+                continue
+            new_apps.append(entry.path)
+        self.candidates = candidates
+        return new_apps
+
+    def add_new_apps(self, scheduler: AppScheduler) -> int:
+        new_apps = self.scan()
+        for app in new_apps:
+            scheduler.put(app)
+        if new_apps:
+            logger.info("{} new apps in {}".format(len(new_apps), self.dir_app))
+        return len(new_apps)
+
+    def log_queue_depth(self, scheduler: AppScheduler, in_analysis: int = None):
+        """
+        Log the number of apps waiting (and in analysis), when it changes or every STATUS_INTERVAL seconds.
+        """
+        depth = (len(scheduler), in_analysis)
+        now = time.time()
+        if depth == self.last_depth and now - self.last_status < STATUS_INTERVAL:
+            return
+        self.last_depth = depth
+        self.last_status = now
+        if in_analysis is None:
+            logger.info("Queue depth: {} apps waiting".format(len(scheduler)))
+        else:
+            logger.info("Queue depth: {} apps waiting, {} in analysis".format(len(scheduler), in_analysis))
+
+    def stream(self, scheduler: AppScheduler):
+        """
+        Endless iterator over the apps of the scheduler, fed with the new apks of the intake directory. When no app
+        is ready None is returned after poll_interval seconds, so the consumer can do something else in the meantime
+        (e.g. the static pipeline returns the apps already analyzed).
+        """
+        while True:
+            self.add_new_apps(scheduler)
+            app = scheduler.get_nowait()
+            self.log_queue_depth(scheduler)
+            if app is None:
+                time.sleep(self.poll_interval)
+            yield app
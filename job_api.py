@@ -0,0 +1,545 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tarfile
+import tempfile
+import threading
+from http import HTTPStatus
+from flask import Flask, request, send_file
+from flask import jsonify
+from flask import make_response
+from werkzeug.exceptions import NotFound, BadRequest, Conflict
+
+from job_ledger import JobLedger, STATE_QUEUED, STATE_DONE, STATE_FAILED, get_md5
+from scheduler import AppScheduler
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+job_api_port = 21213
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+logging.getLogger('werkzeug').disabled = True
+
+# Directory where the uploaded apks are stored, when the API runs next to the analysis loop. When the API runs on
+# its own the apks are stored in the intake directory of the daemon instead (see IntakeWatcher).
+DEFAULT_UPLOAD_DIR = os.path.join(os.getcwd(), "apps_submitted")
+DEFAULT_INTAKE_DIR = os.path.join(os.getcwd(), "apps")
+# Size (in bytes) of the chunks read to compute the md5 of the uploaded apks.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Largest request (in MB) accepted, a bigger upload is refused before it is written on disk.
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', 512))
+# The API is reachable from this host only, unless another address is given (e.g. 0.0.0.0 for the coordinator).
+DEFAULT_API_HOST = '127.0.0.1'
+
+# Job ledger, scheduler of the analysis loop (None when the API runs on its own), upload directory, apps directory of
+# the daemon and number of apps analyzed at the same time (reported to the coordinator of more analysis hosts).
+job_api_context = {'ledger': None, 'scheduler': None, 'upload_dir': DEFAULT_UPLOAD_DIR, 'apps_dir': None,
+                   'workers': None}
+# Submissions are serialized, so the same apk submitted twice at the same time is queued once.
+submit_lock = threading.Lock()
+
+
+def create_app():
+    logger.info('Starting the application ')
+    flask_app = Flask(__name__)
+    flask_app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+    return flask_app
+
+
+app = create_app()
+
+
+@app.errorhandler(HTTPStatus.BAD_REQUEST)
+def bad_request(error):
+    logger.error(f'{error}\nRequest that generated the error: {request}')
+    return make_response(jsonify(
+        {'error': f'{HTTPStatus.BAD_REQUEST.phrase}: {error.description}'}),
+        HTTPStatus.BAD_REQUEST, {'Content-Type': 'application/json'})
+
+
+@app.errorhandler(HTTPStatus.NOT_FOUND)
+def not_found(error):
+    logger.error(f'{error}\nRequest that generated the error: {request}')
+    return make_response(jsonify(
+        {'error': f'{HTTPStatus.NOT_FOUND.phrase}: {HTTPStatus.NOT_FOUND.description}'}),
+        HTTPStatus.NOT_FOUND, {'Content-Type': 'application/json'})
+
+
+@app.errorhandler(HTTPStatus.CONFLICT)
+def conflict(error):
+    logger.error(f'{error}\nRequest that generated the error: {request}')
+    return make_response(jsonify(
+        {'error': f'{HTTPStatus.CONFLICT.phrase}: {error.description}'}),
+        HTTPStatus.CONFLICT, {'Content-Type': 'application/json'})
+
+
+@app.errorhandler(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+def too_large(error):
+    logger.error(f'{error}\nRequest that generated the error: {request}')
+    return make_response(jsonify(
+        {'error': f'{HTTPStatus.REQUEST_ENTITY_TOO_LARGE.phrase}: the limit is {MAX_UPLOAD_MB} MB'}),
+        HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'Content-Type': 'application/json'})
+
+
+@app.errorhandler(HTTPStatus.INTERNAL_SERVER_ERROR)
+def internal_error(error):
+    logger.error(f'{error}\nRequest that generated the error: {request}')
+    return make_response(jsonify(
+        {'error': f'{HTTPStatus.INTERNAL_SERVER_ERROR.phrase}: {HTTPStatus.INTERNAL_SERVER_ERROR.description}'}),
+        HTTPStatus.INTERNAL_SERVER_ERROR, {'Content-Type': 'application/json'})
+
+
+def configure_job_api(ledger: JobLedger = None, scheduler: AppScheduler = None, upload_dir: str = None,
+                      workers: int = None, apps_dir: str = None):
+    job_api_context['ledger'] = ledger if ledger is not None else JobLedger()
+    job_api_context['scheduler'] = scheduler
+    job_api_context['workers'] = workers
+    job_api_context['apps_dir'] = apps_dir
+    if upload_dir is not None:
+        job_api_context['upload_dir'] = upload_dir
+    os.makedirs(job_api_context['upload_dir'], exist_ok=True)
+
+
+def get_ledger() -> JobLedger:
+    if job_api_context['ledger'] is None:
+        configure_job_api()
+    return job_api_context['ledger']
+
+
+def get_logs_dir(md5_app: str) -> str:
+    return os.path.join(os.getcwd(), 'logs', md5_app)
+
+
+def get_verdict_file(md5_app: str) -> str:
+    return os.path.join(get_logs_dir(md5_app), f'{md5_app}.json')
+
+
+def read_verdict(md5_app: str):
+    verdict_file = get_verdict_file(md5_app)
+    if not os.path.exists(verdict_file):
+        return None
+    with open(verdict_file, 'r') as json_file:
+        return json.load(json_file)
+
+
+def is_submittable_path(apk_path: str) -> bool:
+    """
+    True if the apk is in the upload directory or in the apps directory of the daemon (symbolic links resolved), the
+    path field cannot make the daemon read any other file of the host.
+    """
+    real_path = os.path.realpath(apk_path)
+    for directory in [job_api_context['upload_dir'], job_api_context['apps_dir']]:
+        if directory is None:
+            continue
+        real_dir = os.path.realpath(directory)
+        if os.path.commonpath([real_path, real_dir]) == real_dir:
+            return True
+    return False
+
+
+def save_upload(upload) -> str:
+    """
+    Store the uploaded apk as <md5>.apk in the upload directory, the md5 is computed while the file is written.
+    """
+    upload_dir = job_api_context['upload_dir']
+    hash_md5 = hashlib.md5()
+    fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=upload_dir)
+    try:
+        with os.fdopen(fd, 'wb') as apk_file:
+            for chunk in iter(lambda: upload.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                hash_md5.update(chunk)
+                apk_file.write(chunk)
+        apk_path = os.path.join(upload_dir, f'{hash_md5.hexdigest()}.apk')
+        os.replace(tmp_path, apk_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return apk_path
+
+
+def get_job_status(job: sqlite3.Row) -> dict:
+    scheduler = job_api_context['scheduler']
+    position = None
+    if scheduler is not None and job['state'] == STATE_QUEUED:
+        position = scheduler.position(job['apk_path'])
+    return {'job_id': job['md5'],
+            'apk_path': job['apk_path'],
+            'package_name': job['package_name'],
+            'state': job['state'],
+            'phase': job['phase'],
+            'attempts': job['attempts'],
+            'position': position,
+            'error': job['error'],
+            'verdict_available': job['state'] in [STATE_DONE, STATE_FAILED]}
+
+
+def is_pending(job: sqlite3.Row) -> bool:
+    """
+    True if the job will be analyzed without queueing it again: in analysis, or waiting in the scheduler (when the
+    API runs on its own the daemon takes every job of the intake directory).
+    """
+    scheduler = job_api_context['scheduler']
+    if job['state'] != STATE_QUEUED or scheduler is None:
+        return True
+    return job['apk_path'] in scheduler
+
+
+@app.route('/jobs', methods=['POST'], strict_slashes=False)
+def submit():
+    """
+        Submit an apk
+        This endpoint can be used to submit an apk to analyze, uploaded (multipart field "apk", at most
+        MAX_UPLOAD_MB) or given as a path on the analysis host ("path" field, form or json), in the apps directory
+        of the daemon or in the upload directory. The apks are deduplicated by md5: an apk already analyzed returns
+        its verdict immediately, an apk already queued returns the status of its job.
+        ---
+        tags:
+          - Job API Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: apk
+            in: formData
+            description: |
+              The apk to analyze
+            required: false
+            type: file
+          - name: path
+            in: formData
+            description: |
+              The path of the apk to analyze on the analysis host, in the apps directory of the daemon or in the
+              upload directory
+            required: false
+            type: string
+        responses:
+          200:
+            description: |
+              The apk was already submitted, the status of its job (and the verdict if available) is returned
+            schema:
+              type: object
+          201:
+            description: |
+              The job was created, its id is the md5 of the apk
+            schema:
+              type: object
+          400:
+            description: |
+              No apk or an invalid path was given
+            schema:
+              type: object
+          413:
+            description: |
+              The uploaded apk is too large
+            schema:
+              type: object
+          500:
+            description: |
+              Server error
+            schema:
+              type: object
+    """
+
+    ledger = get_ledger()
+    scheduler = job_api_context['scheduler']
+    upload = request.files.get('apk')
+    json_request = request.get_json(silent=True) or {}
+    apk_path = request.form.get('path', json_request.get('path'))
+
+    if upload is not None:
+        apk_path = save_upload(upload)
+        md5_app = os.path.splitext(os.path.basename(apk_path))[0]
+    elif apk_path:
+        apk_path = os.path.abspath(apk_path)
+        if not is_submittable_path(apk_path):
+            raise BadRequest(f'"{apk_path}" is not in the apps directory or in the upload directory')
+        if not os.path.isfile(apk_path) or not apk_path.endswith('.apk'):
+            raise BadRequest(f'"{apk_path}" is not an apk')
+        md5_app = ledger.lookup_md5(apk_path) or get_md5(apk_path)
+        if scheduler is None:
+            # the daemon analyzes the apks of its intake directory only
+            intake_path = os.path.join(job_api_context['upload_dir'], f'{md5_app}.apk')
+            if apk_path != intake_path:
+                shutil.copyfile(apk_path, intake_path)
+            apk_path = intake_path
+    else:
+        raise BadRequest('Upload an apk or give its path')
+
+    with submit_lock:
+        job = ledger.get_job(md5_app)
+        if job is not None and ledger.is_finished(md5_app):
+            logger.info(f'App {md5_app} already analyzed')
+            response = get_job_status(job)
+            response['verdict'] = read_verdict(md5_app)
+            return make_response(jsonify(response), HTTPStatus.OK)
+        if job is not None and is_pending(job):
+            logger.info(f'App {md5_app} already submitted')
+            return make_response(jsonify(get_job_status(job)), HTTPStatus.OK)
+
+        ledger.add_job(md5_app, apk_path)
+        if scheduler is not None:
+            scheduler.put(apk_path)
+        logger.info(f'Submitted app {apk_path} (job {md5_app})')
+        return make_response(jsonify(get_job_status(ledger.get_job(md5_app))), HTTPStatus.CREATED)
+
+
+@app.route('/jobs', methods=['GET'], strict_slashes=False)
+def jobs():
+    """
+        Jobs summary
+        This endpoint can be used to get the number of jobs in each state and the number of apps waiting.
+        ---
+        tags:
+          - Job API Endpoint
+        produces:
+          - application/json
+        responses:
+          200:
+            description: |
+              The number of jobs in each state
+            schema:
+              type: object
+    """
+
+    scheduler = job_api_context['scheduler']
+    return make_response(jsonify({'states': get_ledger().count_by_state(),
+                                  'queue_depth': len(scheduler) if scheduler is not None else None,
+                                  'workers': job_api_context['workers']}))
+
+
+@app.route('/jobs/<job_id>', methods=['GET'], strict_slashes=False)
+def status(job_id: str):
+    """
+        Job status
+        This endpoint can be used to get the state, the phase in progress and the position in the queue of a job.
+        ---
+        tags:
+          - Job API Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: job_id
+            in: path
+            description: |
+              The id of the job (md5 of the apk)
+            required: true
+            type: string
+        responses:
+          200:
+            description: |
+              The status of the job
+            schema:
+              type: object
+          404:
+            description: |
+              The specified job doesn't exist
+            schema:
+              type: object
+    """
+
+    job = get_ledger().get_job(job_id)
+    if job is None:
+        raise NotFound(f'Job "{job_id}" does not exist')
+    return make_response(jsonify(get_job_status(job)))
+
+
+@app.route('/jobs/<job_id>/verdict', methods=['GET'], strict_slashes=False)
+def verdict(job_id: str):
+    """
+        Job verdict
+        This endpoint can be used to get the result of the analysis (logs/<md5>/<md5>.json) of a finished job.
+        ---
+        tags:
+          - Job API Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: job_id
+            in: path
+            description: |
+              The id of the job (md5 of the apk)
+            required: true
+            type: string
+        responses:
+          200:
+            description: |
+              The result of the analysis
+            schema:
+              type: object
+          404:
+            description: |
+              The specified job doesn't exist
+            schema:
+              type: object
+          409:
+            description: |
+              The analysis of the app is not finished
+            schema:
+              type: object
+    """
+
+    ledger = get_ledger()
+    job = ledger.get_job(job_id)
+    if job is None:
+        raise NotFound(f'Job "{job_id}" does not exist')
+    if not ledger.is_finished(job_id):
+        raise Conflict(f'Job "{job_id}" is {job["state"]}')
+    result = read_verdict(job_id)
+    if result is None:
+        # e.g. the logs directory was cleaned, the verdict is kept in the ledger as well
+        result = json.loads(job['verdict']) if job['verdict'] else None
+    if result is None:
+        raise NotFound(f'Verdict of job "{job_id}" not found')
+    return make_response(jsonify(result))
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'], strict_slashes=False)
+def withdraw(job_id: str):
+    """
+        Withdraw a job
+        This endpoint can be used to take back a job still waiting in the queue, e.g. to analyze it on another host.
+        ---
+        tags:
+          - Job API Endpoint
+        produces:
+          - application/json
+        parameters:
+          - name: job_id
+            in: path
+            description: |
+              The id of the job (md5 of the apk)
+            required: true
+            type: string
+        responses:
+          200:
+            description: |
+              The job was removed from the queue
+            schema:
+              type: object
+          404:
+            description: |
+              The specified job doesn't exist
+            schema:
+              type: object
+          409:
+            description: |
+              The analysis of the app is started or finished (or the API runs on its own)
+            schema:
+              type: object
+    """
+
+    ledger = get_ledger()
+    scheduler = job_api_context['scheduler']
+    with submit_lock:
+        job = ledger.get_job(job_id)
+        if job is None:
+            raise NotFound(f'Job "{job_id}" does not exist')
+        if scheduler is None or job['state'] != STATE_QUEUED or not scheduler.remove(job['apk_path']):
+            raise Conflict(f'Job "{job_id}" is not waiting in the queue')
+    logger.info(f'Job {job_id} withdrawn')
+    return make_response(jsonify({'message': f'Job "{job_id}" withdrawn'}))
+
+
+@app.route('/jobs/<job_id>/logs', methods=['GET'], strict_slashes=False)
+def logs(job_id: str):
+    """
+        Job logs
+        This endpoint can be used to download the logs directory (logs/<md5>) of a finished job, as a tar.gz archive.
+        ---
+        tags:
+          - Job API Endpoint
+        produces:
+          - application/gzip
+        parameters:
+          - name: job_id
+            in: path
+            description: |
+              The id of the job (md5 of the apk)
+            required: true
+            type: string
+        responses:
+          200:
+            description: |
+              The archive of the logs, with the <md5> directory at its root
+          404:
+            description: |
+              The specified job doesn't exist
+            schema:
+              type: object
+          409:
+            description: |
+              The analysis of the app is not finished
+            schema:
+              type: object
+    """
+
+    ledger = get_ledger()
+    job = ledger.get_job(job_id)
+    if job is None:
+        raise NotFound(f'Job "{job_id}" does not exist')
+    if not ledger.is_finished(job_id):
+        raise Conflict(f'Job "{job_id}" is {job["state"]}')
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+        if os.path.isdir(get_logs_dir(job_id)):
+            tar.add(get_logs_dir(job_id), arcname=job_id)
+    archive.seek(0)
+    return send_file(archive, mimetype='application/gzip', as_attachment=True,
+                     attachment_filename=f'{job_id}.tar.gz')
+
+
+def start_job_api(scheduler: AppScheduler = None, ledger: JobLedger = None, upload_dir: str = None,
+                  port: int = job_api_port, workers: int = None, host: str = DEFAULT_API_HOST,
+                  apps_dir: str = None) -> threading.Thread:
+    """
+    Serve the job API in a background thread, next to the analysis loop that consumes the scheduler. The apks given
+    by path are accepted from the upload directory and from apps_dir (the apps directory of the daemon).
+    """
+    configure_job_api(ledger, scheduler, upload_dir, workers, apps_dir)
+    thread = threading.Thread(target=app.run, name='job-api', daemon=True,
+                              kwargs={'host': host, 'port': port, 'threaded': True})
+    thread.start()
+    logger.info(f'Job API listening on {host}:{port}')
+    return thread
+
+
+def get_cmd_args(args: list = None):
+    """
+    Parse and return the command line parameters needed for the script execution.
+    :param args: List of arguments to be parsed (by default sys.argv is used).
+    :return: The command line needed parameters.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='python job_api.py',
+        description='Job API of an analysis daemon (python 3PDroid.py --daemon) running on the same host'
+    )
+
+    parser.add_argument('-p', '--port', type=int, metavar='PORT', default=job_api_port,
+                        help='The port of the job API')
+    parser.add_argument('--host', type=str, metavar='HOST', default=DEFAULT_API_HOST,
+                        help='The address the job API listens on (0.0.0.0 to reach it from other hosts)')
+    parser.add_argument('-d', '--dir-app', type=str, metavar='DIR', default=DEFAULT_INTAKE_DIR,
+                        help='The intake directory of the daemon, where the submitted apks are stored')
+    parser.add_argument('--ledger', type=str, metavar='LEDGER', default=None,
+                        help='The job ledger (default logs/ledger.sqlite)')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    arguments = get_cmd_args()
+    configure_job_api(JobLedger(arguments.ledger), None, arguments.dir_app)
+    app.run(host=arguments.host, port=arguments.port, threaded=True)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional, List
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+DEFAULT_LEDGER_PATH = os.path.join(os.getcwd(), "logs", "ledger.sqlite")
+LOGS_DIR = os.path.join(os.getcwd(), "logs")
+
+# States of an analysis job.
+STATE_QUEUED = "queued"
+STATE_STATIC = "static"
+STATE_DYNAMIC = "dynamic"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATES = [STATE_QUEUED, STATE_STATIC, STATE_DYNAMIC, STATE_DONE, STATE_FAILED]
+
+# Seconds to wait for the lock of the database held by another worker.
+LEDGER_TIMEOUT = 60
+
+CREATE_TABLE_JOBS = """
+CREATE TABLE IF NOT EXISTS jobs (
+    md5 TEXT PRIMARY KEY,
+    apk_path TEXT,
+    apk_size INTEGER,
+    apk_mtime REAL,
+    package_name TEXT,
+    state TEXT NOT NULL,
+    phase TEXT,
+    snapshot TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    compliant INTEGER,
+    verdict TEXT,
+    error TEXT,
+    static_time REAL,
+    dynamic_time REAL,
+    created_at REAL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL
+)
+"""
+# Columns added to the table after its first version, added to the ledgers created before them.
+ADDED_COLUMNS = ["phase", "snapshot"]
+
+
+def get_md5(apk_path: str, block_size=65536) -> str:
+    md5_hash = hashlib.md5()
+    with open(apk_path, 'rb') as apk_file:
+        for chunk in iter(lambda: apk_file.read(block_size), b''):
+            md5_hash.update(chunk)
+    return md5_hash.hexdigest()
+
+
+class JobLedger(object):
+    """
+    Embedded (SQLite) ledger with the state of the analysis of every app, keyed by md5: state
+    (queued/static/dynamic/done/failed), attempts, timings and verdict. A new run resumes from the ledger without
+    probing the logs dir or moving the apk files. The ledger can be shared by more worker processes, each of them has
+    to open its own JobLedger.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path if path else DEFAULT_LEDGER_PATH
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, timeout=LEDGER_TIMEOUT, check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(CREATE_TABLE_JOBS)
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(jobs)")]
+            for column in ADDED_COLUMNS:
+                if column not in columns:
+                    # ledger created by an older version
+                    self.connection.execute("ALTER TABLE jobs ADD COLUMN {} TEXT".format(column))
+            self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_apk_path ON jobs (apk_path)")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def execute(self, query: str, parameters: tuple = ()):
+        with self.lock:
+            return self.connection.execute(query, parameters).fetchall()
+
+    def get_job(self, md5_app: str) -> Optional[sqlite3.Row]:
+        rows = self.execute("SELECT * FROM jobs WHERE md5 = ?", (md5_app,))
+        return rows[0] if rows else None
+
+    def get_jobs(self, state: str = None) -> List[sqlite3.Row]:
+        if state is None:
+            return self.execute("SELECT * FROM jobs ORDER BY created_at")
+        return self.execute("SELECT * FROM jobs WHERE state = ? ORDER BY created_at", (state,))
+
+    def lookup_md5(self, apk_path: str) -> Optional[str]:
+        """
+        md5 of an apk already in the ledger, if the file did not change (same size and modification time), so the
+        apk is not read again.
+        """
+        try:
+            apk_stat = os.stat(apk_path)
+        except OSError:
+            return None
+        rows = self.execute("SELECT md5 FROM jobs WHERE apk_path = ? AND apk_size = ? AND apk_mtime = ?",
+                            (apk_path, apk_stat.st_size, apk_stat.st_mtime))
+        return rows[0]["md5"] if rows else None
+
+    def add_job(self, md5_app: str, apk_path: str) -> sqlite3.Row:
+        """
+        Add the app to the ledger (state queued) if it is not already there, and returns its job.
+        """
+        now = time.time()
+        apk_stat = os.stat(apk_path)
+        with self.lock:
+            self.connection.execute("INSERT OR IGNORE INTO jobs (md5, state, attempts, created_at, updated_at) "
+                                    "VALUES (?, ?, 0, ?, ?)", (md5_app, STATE_QUEUED, now, now))
+            self.connection.execute("UPDATE jobs SET apk_path = ?, apk_size = ?, apk_mtime = ? WHERE md5 = ?",
+                                    (apk_path, apk_stat.st_size, apk_stat.st_mtime, md5_app))
+        return self.get_job(md5_app)
+
+    def register_app(self, apk_path: str) -> sqlite3.Row:
+        """
+        Add the app to the ledger and returns its job. The md5 is computed only if the apk is not already in the
+        ledger. The verdict of an app analyzed before the ledger existed (logs/<md5>/<md5>.json) is imported.
+        """
+        md5_app = self.lookup_md5(apk_path)
+        if md5_app is None:
+            md5_app = get_md5(apk_path)
+        job = self.add_job(md5_app, apk_path)
+        if job["state"] == STATE_QUEUED and job["attempts"] == 0:
+            file_log = os.path.join(LOGS_DIR, md5_app, "{}.json".format(md5_app))
+            if os.path.exists(file_log):
+                with open(file_log, "r") as json_file:
+                    dict_analysis_app = json.load(json_file)
+                # the json is written also during the dynamic analysis, only a verdict means analyzed
+                if dict_analysis_app.get("dynamic_analysis_needed") is False or "app_analyzed" in dict_analysis_app:
+                    logger.info("Import the verdict of app {} in the ledger".format(md5_app))
+                    self.finish(md5_app, dict_analysis_app,
+                                STATE_DONE if dict_analysis_app.get("app_analyzed", True) else STATE_FAILED)
+                    job = self.get_job(md5_app)
+        return job
+
+    def is_finished(self, md5_app: str) -> bool:
+        job = self.get_job(md5_app)
+        return job is not None and job["state"] in (STATE_DONE, STATE_FAILED)
+
+    def start_attempt(self, md5_app: str):
+        now = time.time()
+        self.execute("UPDATE jobs SET state = ?, phase = NULL, attempts = attempts + 1, started_at = ?, error = NULL, "
+                     "updated_at = ? WHERE md5 = ?", (STATE_STATIC, now, now, md5_app))
+
+    def set_phase(self, md5_app: str, phase: str):
+        """
+        The phase of the analysis in progress (e.g., install, exploration), shown by the job API.
+        """
+        self.execute("UPDATE jobs SET phase = ?, updated_at = ? WHERE md5 = ?", (phase, time.time(), md5_app))
+
+    def set_snapshot(self, md5_app: str, snapshot: str):
+        """
+        The snapshot (emulator:snapshot) taken after the app was installed, restored by the next tentative.
+        """
+        self.execute("UPDATE jobs SET snapshot = ?, updated_at = ? WHERE md5 = ?", (snapshot, time.time(), md5_app))
+
+    def set_state(self, md5_app: str, state: str, **fields):
+        """
+        Update the state of the job, together with the given columns (e.g., package_name, static_time).
+        """
+        if state not in STATES:
+            raise ValueError('Unknown job state "{0}"'.format(state))
+        columns = ["state = ?", "updated_at = ?"]
+        parameters = [state, time.time()]
+        for column, value in fields.items():
+            columns.append("{} = ?".format(column))
+            parameters.append(value)
+        parameters.append(md5_app)
+        self.execute("UPDATE jobs SET {} WHERE md5 = ?".format(", ".join(columns)), tuple(parameters))
+
+    def finish(self, md5_app: str, dict_analysis_app: dict, state: str = STATE_DONE, error: str = None, **fields):
+        """
+        Store the verdict of the app (the same dict written on the json log of the app).
+        """
+        compliant = dict_analysis_app.get("app_is_compliant_with_google_play_store")
+        self.set_state(md5_app, state, verdict=json.dumps(dict_analysis_app),
+                       package_name=dict_analysis_app.get("package_name"),
+                       compliant=None if compliant is None else int(compliant),
+                       error=error, phase=None, snapshot=None, finished_at=time.time(), **fields)
+
+    def retry_later(self, md5_app: str, error: str):
+        self.set_state(md5_app, STATE_QUEUED, error=error)
+
+    def cancel_attempt(self, md5_app: str, error: str):
+        """
+        Put back in the queue the job whose tentative could not start for a reason that does not depend on the app
+        (e.g. not enough memory on the host), the tentative is not counted.
+        """
+        self.execute("UPDATE jobs SET state = ?, phase = NULL, attempts = MAX(attempts - 1, 0), error = ?, "
+                     "updated_at = ? WHERE md5 = ?", (STATE_QUEUED, error, time.time(), md5_app))
+
+    def recover_interrupted(self) -> int:
+        """
+        Put back in the queue the jobs left in the static or dynamic state by a run that crashed. Call it only before
+        starting the workers, otherwise the jobs in progress would be reset.
+
+        :return: The number of jobs put back in the queue.
+        """
+        rows = self.execute("SELECT md5 FROM jobs WHERE state IN (?, ?)", (STATE_STATIC, STATE_DYNAMIC))
+        self.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE state IN (?, ?)",
+                     (STATE_QUEUED, time.time(), STATE_STATIC, STATE_DYNAMIC))
+        if rows:
+            logger.info("{} interrupted jobs put back in the queue".format(len(rows)))
+        return len(rows)
+
+    def requeue(self, state: str) -> int:
+        """
+        Put back in the queue (with no attempts) all the jobs in the given state, e.g. to analyze again the failed apps.
+        """
+        rows = self.execute("SELECT md5 FROM jobs WHERE state = ?", (state,))
+        self.execute("UPDATE jobs SET state = ?, attempts = 0, error = NULL, updated_at = ? WHERE state = ?",
+                     (STATE_QUEUED, time.time(), state))
+        return len(rows)
+
+    def count_by_state(self) -> dict:
+        counts = {state: 0 for state in STATES}
+        for row in self.execute("SELECT state, COUNT(*) AS jobs FROM jobs GROUP BY state"):
+            counts[row["state"]] = row["jobs"]
+        return counts
+
+
+def get_cmd_args(args: list = None):
+    """
+    Parse and return the command line parameters needed for the script execution.
+    :param args: List of arguments to be parsed (by default sys.argv is used).
+    :return: The command line needed parameters.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='python job_ledger.py',
+        description='Inspect the ledger of the analysis jobs'
+    )
+
+    parser.add_argument('command', choices=["status", "export", "requeue"],
+                        help='status: number of jobs in each state, export: md5,package name,state of every job '
+                             '(csv), requeue: put back in the queue the jobs in the state given by --state')
+    parser.add_argument('--ledger', type=str, metavar='PATH', default=DEFAULT_LEDGER_PATH,
+                        help='Path of the ledger database')
+    parser.add_argument('--state', type=str, default=STATE_FAILED, choices=STATES,
+                        help='State of the jobs to requeue')
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    arguments = get_cmd_args()
+    ledger = JobLedger(arguments.ledger)
+    if arguments.command == "status":
+        print(json.dumps(ledger.count_by_state(), indent=4))
+    elif arguments.command == "export":
+        for job in ledger.get_jobs():
+            print("{},{},{}".format(job["md5"], job["package_name"], job["state"]))
+    else:
+        print("{} jobs put back in the queue".format(ledger.requeue(arguments.state)))
+    ledger.close()
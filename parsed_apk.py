@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import hashlib
+import json
+import logging
+import os
+from typing import List, Optional
+
+from androguard.core.bytecodes.apk import APK
+from androguard.misc import AnalyzeAPK
+
+from host_resources import apk_analysis_memory_mb, wait_for_headroom, HeadroomError
+
+# Directory of the persistent cache, one json file for each app (named with the md5 of the apk).
+DEFAULT_CACHE_DIR = os.path.join(os.getcwd(), "cache", "parsed_apk")
+# Increase when the content of the cache changes, the old entries are parsed again.
+CACHE_VERSION = 1
+
+
+def load_cached_info(md5_app: str, cache_dir: str = None) -> Optional[dict]:
+    """
+    Information of an app already parsed (None if the app is not in the cache), the apk is not read.
+    """
+    cache_file = os.path.join(cache_dir if cache_dir else DEFAULT_CACHE_DIR, '{0}.json'.format(md5_app))
+    try:
+        with open(cache_file, 'r') as cache_json:
+            info = json.load(cache_json)
+    except Exception:
+        return None
+    return info if info.get('version') == CACHE_VERSION else None
+
+
+def analyze_apk(apk_path: str):
+    """
+    AnalyzeAPK of androguard, started only when the memory of the host can hold it.
+
+    :raise HeadroomError: The memory needed was not freed in time.
+    """
+    if not wait_for_headroom(apk_analysis_memory_mb(apk_path), 'androguard analysis of {0}'.format(apk_path)):
+        raise HeadroomError('Not enough memory to analyze app {0} with androguard'.format(apk_path))
+    return AnalyzeAPK(apk_path)
+
+
+class ParsedApk(object):
+    """
+    An app parsed once and shared by all the stages of the analysis (static analysis, DroidBot, RandomInteraction).
+    The manifest information, the result of the static analysis and the text fields found by the smart input
+    generation of DroidBot are stored on disk, keyed by the md5 of the apk,
+    so a new tentative or a new run on the same app does not parse the apk again. The androguard objects are created
+    only when a stage needs them, and at most once.
+    """
+
+    def __init__(self, apk_path: str, md5_app: str = None, cache_dir: str = None):
+        self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
+
+        if not os.path.isfile(apk_path):
+            raise FileNotFoundError('The input application file "{0}" was not found'.format(apk_path))
+
+        self.apk_path = apk_path
+        self.md5 = md5_app if md5_app else self.get_md5()
+        self.cache_file = os.path.join(cache_dir if cache_dir else DEFAULT_CACHE_DIR, '{0}.json'.format(self.md5))
+
+        self._apk: Optional[APK] = None
+        self._dalvik = None
+        self._analysis = None
+
+        self.info = self.load_cache()
+        if self.info is None:
+            self.info = self.parse_manifest()
+            self.save_cache()
+
+    def get_md5(self, block_size=65536) -> str:
+        md5_hash = hashlib.md5()
+        with open(self.apk_path, 'rb') as filename:
+            for chunk in iter(lambda: filename.read(block_size), b''):
+                md5_hash.update(chunk)
+        return md5_hash.hexdigest()
+
+    def get_hashes(self, block_size=65536) -> List[str]:
+        """
+        Calculate MD5, SHA1 and SHA256 hashes of the input application file.
+
+        :param block_size: The size of the block used for the hash functions.
+        :return: A list containing the MD5, SHA1 and SHA256 hashes of the input application file.
+        """
+        md5_hash = hashlib.md5()
+        sha1_hash = hashlib.sha1()
+        sha256_hash = hashlib.sha256()
+        with open(self.apk_path, 'rb') as filename:
+            for chunk in iter(lambda: filename.read(block_size), b''):
+                md5_hash.update(chunk)
+                sha1_hash.update(chunk)
+                sha256_hash.update(chunk)
+        return [md5_hash.hexdigest(), sha1_hash.hexdigest(), sha256_hash.hexdigest()]
+
+    def load_cache(self) -> Optional[dict]:
+        if not os.path.isfile(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, 'r') as cache_file:
+                info = json.load(cache_file)
+        except Exception as e:
+            self.logger.warning('Unable to read the cache of app {0}: {1}'.format(self.md5, e))
+            return None
+        if info.get('version') != CACHE_VERSION:
+            return None
+        self.logger.debug('App {0} loaded from cache'.format(self.md5))
+        return info
+
+    def save_cache(self):
+        """
+        Write the cache of the app (write and rename, the cache can be shared by more processes).
+        """
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp_cache_file = '{0}.{1}.tmp'.format(self.cache_file, os.getpid())
+            with open(tmp_cache_file, 'w') as cache_file:
+                json.dump(self.info, cache_file)
+            os.replace(tmp_cache_file, self.cache_file)
+        except Exception as e:
+            self.logger.warning('Unable to write the cache of app {0}: {1}'.format(self.md5, e))
+
+    def parse_manifest(self) -> dict:
+        self.logger.info('Parse app {0}'.format(self.apk_path))
+        receivers = {}
+        for receiver in self.apk.get_receivers():
+            intent_filters = self.apk.get_intent_filters('receiver', receiver)
+            receivers[receiver] = {
+                'action': list(intent_filters['action']) if 'action' in intent_filters else [],
+                'category': list(intent_filters['category']) if 'category' in intent_filters else []
+            }
+        return {
+            'version': CACHE_VERSION,
+            'hashes': self.get_hashes(),
+            'package_name': self.apk.get_package(),
+            'main_activities': list(self.apk.get_main_activities()),
+            'permissions': list(self.apk.get_permissions()),
+            'activities': list(self.apk.get_activities()),
+            'receivers': receivers,
+            'static_result': None
+        }
+
+    @property
+    def apk(self) -> APK:
+        if self._apk is None:
+            self._apk = APK(self.apk_path)
+        return self._apk
+
+    def get_analysis(self):
+        """
+        Full androguard analysis of the app (parsed at the first call only).
+
+        :return: The APK, the list of DalvikVMFormat and the Analysis objects, as returned by AnalyzeAPK.
+        """
+        if self._analysis is None:
+            self.logger.info('Analyze app {0} with androguard'.format(self.apk_path))
+            self._apk, self._dalvik, self._analysis = analyze_apk(self.apk_path)
+        return self._apk, self._dalvik, self._analysis
+
+    def release_analysis(self):
+        """
+        Free the memory used by the dex analysis, the information already computed remains available.
+        """
+        self._dalvik = None
+        self._analysis = None
+
+    @property
+    def package_name(self) -> str:
+        return self.info['package_name']
+
+    @property
+    def hashes(self) -> List[str]:
+        return self.info['hashes']
+
+    @property
+    def main_activities(self) -> List[str]:
+        return self.info['main_activities']
+
+    @property
+    def permissions(self) -> List[str]:
+        return self.info['permissions']
+
+    @property
+    def activities(self) -> List[str]:
+        return self.info['activities']
+
+    @property
+    def receivers(self) -> dict:
+        """
+        :return: A dictionary, each key is a receiver and each value its intent filters ('action' and 'category').
+        """
+        return self.info['receivers']
+
+    def get_static_result(self) -> Optional[dict]:
+        static_result = self.info.get('static_result')
+        if static_result is None:
+            return None
+        static_result = dict(static_result)
+        static_result['api_to_monitoring'] = [tuple(api) for api in static_result['api_to_monitoring']]
+        return static_result
+
+    def set_static_result(self, static_result: dict):
+        self.info['static_result'] = static_result
+        self.save_cache()
+
+    def get_smart_inputs(self) -> Optional[dict]:
+        """
+        :return: The text fields found by the smart input generation of DroidBot (see SmartInput), by activity ('all'
+                 for the fields of all the layouts), each one as [id, name, input type, is password].
+        """
+        return self.info.get('smart_inputs')
+
+    def set_smart_inputs(self, smart_inputs: dict):
+        self.info['smart_inputs'] = smart_inputs
+        self.save_cache()
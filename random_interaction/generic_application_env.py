@@ -15,7 +15,7 @@ import logging
 class GenericApplicationEnv(gym.Env):
 
     # Appium configuration parameters
-    def __init__(self, application_dict, app, appPackage='', appActivity='', register_sequence=True):
+    def __init__(self, application_dict, app, appPackage='', appActivity='', register_sequence=True, udid=None):
         self.logger = logging.getLogger('{0}.{1}'.format(__name__, self.__class__.__name__))
 
         self.register_sequence = register_sequence
@@ -54,6 +54,11 @@ class GenericApplicationEnv(gym.Env):
                     self.logger.error('Wrong File Format')
                     exit(1)
 
+        # The device serial of the emulator worker overrides the one of the configuration file
+        if udid is not None:
+            desired_caps['udid'] = udid
+            desired_caps['deviceName'] = udid
+
         self.logger.info(desired_caps)
 
         # after this the app is installed
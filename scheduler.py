@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import heapq
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import zipfile
+from typing import Optional
+
+from job_ledger import JobLedger
+from parsed_apk import load_cached_info
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+# Scheduling orders: shortest job first, longest job first (balance the load of more emulators) or directory order.
+ORDER_SJF = "sjf"
+ORDER_LJF = "ljf"
+ORDER_FIFO = "fifo"
+ORDERS = [ORDER_SJF, ORDER_LJF, ORDER_FIFO]
+
+# Weights (in estimated seconds) of the static features of an app.
+COST_BASE = 60
+COST_PER_MB = 2
+COST_PER_DEX = 20
+COST_PER_ACTIVITY = 3
+COST_PER_API = 5
+# Cost of an app without API to monitoring, no emulator is needed.
+COST_CLEANED = 5
+
+# Seconds an app that failed waits before a new tentative, doubled at each failure.
+RETRY_BACKOFF = 30
+MAX_RETRY_BACKOFF = 600
+
+
+def count_dex(app: str) -> int:
+    try:
+        with zipfile.ZipFile(app) as apk_zip:
+            return max(len([name for name in apk_zip.namelist()
+                            if name.startswith("classes") and name.endswith(".dex")]), 1)
+    except (zipfile.BadZipFile, OSError):
+        return 1
+
+
+def estimate_cost(app: str, ledger: JobLedger = None) -> float:
+    """
+    Estimated cost (seconds) of the analysis of the app, from the size of the apk, the number of dex files and, if the
+    app was already parsed (e.g. by the triage), the number of activities and of API to monitoring.
+    """
+    try:
+        size_mb = os.path.getsize(app) / (1024 * 1024)
+    except OSError:
+        return COST_BASE
+
+    info = None
+    md5_app = ledger.lookup_md5(app) if ledger is not None else None
+    if md5_app is not None:
+        info = load_cached_info(md5_app)
+
+    cost = COST_BASE + COST_PER_MB * size_mb + COST_PER_DEX * count_dex(app)
+    if info is not None:
+        static_result = info.get("static_result")
+        if static_result is not None and len(static_result["api_to_monitoring"]) == 0:
+            return COST_CLEANED
+        cost += COST_PER_ACTIVITY * len(info["activities"])
+        if static_result is not None:
+            cost += COST_PER_API * len(static_result["api_to_monitoring"])
+    return cost
+
+
+class AppScheduler(object):
+    """
+    Queue of the apps to analyze ordered by estimated cost. The apps whose tentative failed go to the back of the
+    queue: they are analyzed again after all the other apps, and not before their backoff is expired. Iterating over
+    the scheduler returns the apps ready, it stops when the queue is empty or only retries waiting for their backoff
+    are left (see wait_time).
+    """
+
+    def __init__(self, list_apps: list = None, order: str = ORDER_SJF, ledger: JobLedger = None):
+        if order not in ORDERS:
+            raise ValueError('Unknown scheduling order "{0}"'.format(order))
+        self.order = order
+        self.ledger = ledger
+        self.counter = itertools.count()
+        self.queue = []
+        self.retries = []
+        self.attempts = {}
+        self.lock = threading.Lock()
+        for app in list_apps if list_apps else []:
+            self.put(app)
+
+    def get_priority(self, app: str) -> float:
+        if self.order == ORDER_FIFO:
+            return 0
+        cost = estimate_cost(app, self.ledger)
+        return cost if self.order == ORDER_SJF else -cost
+
+    def put(self, app: str):
+        priority = self.get_priority(app)
+        with self.lock:
+            heapq.heappush(self.queue, (priority, next(self.counter), app))
+
+    def retry(self, app: str):
+        """
+        Put back the app at the end of the queue, it will be returned again after the backoff.
+        """
+        with self.lock:
+            self.attempts[app] = self.attempts.get(app, 0) + 1
+            backoff = min(RETRY_BACKOFF * 2 ** (self.attempts[app] - 1), MAX_RETRY_BACKOFF)
+            heapq.heappush(self.retries, (time.time() + backoff, next(self.counter), app))
+        logger.info("App {} will be analyzed again in {} seconds".format(app, backoff))
+
+    def task_done(self, app: str, done: bool):
+        if not done:
+            self.retry(app)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.queue) + len(self.retries)
+
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    def __contains__(self, app: str) -> bool:
+        with self.lock:
+            return any(entry[2] == app for entry in itertools.chain(self.queue, self.retries))
+
+    def remove(self, app: str) -> bool:
+        """
+        Withdraw an app not yet returned (e.g. taken by another analysis host), False if it is not queued.
+        """
+        with self.lock:
+            for entries in (self.queue, self.retries):
+                for index, entry in enumerate(entries):
+                    if entry[2] == app:
+                        entries.pop(index)
+                        heapq.heapify(entries)
+                        return True
+        return False
+
+    def position(self, app: str) -> Optional[int]:
+        """
+        Number of apps that will be returned before the app (0 if it is the next one), None if it is not queued.
+        """
+        with self.lock:
+            ordered = sorted(self.queue) + sorted(self.retries)
+        for index, entry in enumerate(ordered):
+            if entry[2] == app:
+                return index
+        return None
+
+    def get_nowait(self) -> Optional[str]:
+        """
+        Next app to analyze, None if the queue is empty or all the retries are waiting for their backoff.
+        """
+        with self.lock:
+            if self.queue:
+                return heapq.heappop(self.queue)[2]
+            if self.retries and self.retries[0][0] <= time.time():
+                return heapq.heappop(self.retries)[2]
+            return None
+
+    def wait_time(self) -> float:
+        """
+        Seconds to wait for the next app (0 if an app is ready or the queue is empty).
+        """
+        with self.lock:
+            if self.queue or not self.retries:
+                return 0
+            return max(self.retries[0][0] - time.time(), 0)
+
+    def __iter__(self):
+        app = self.get_nowait()
+        while app is not None:
+            yield app
+            app = self.get_nowait()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+DEFAULT_SPANS_FILE = os.path.join(os.getcwd(), "logs", "spans.jsonl")
+# The id of the run is shared with the worker processes through the environment.
+RUN_ID_ENV = "SPANS_RUN_ID"
+
+# App and emulator of the analysis executed by the current thread, added to every span.
+_context = threading.local()
+
+
+def start_run() -> str:
+    """
+    Start a new run, all the spans written from now on (also by the child processes) belong to it.
+    """
+    run_id = "{0}-{1}".format(time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:6])
+    os.environ[RUN_ID_ENV] = run_id
+    return run_id
+
+
+def set_context(**fields):
+    """
+    Set the fields (e.g., md5 and emulator) added to the spans of the current thread, None removes a field.
+    """
+    context = getattr(_context, "fields", {})
+    for key, value in fields.items():
+        if value is None:
+            context.pop(key, None)
+        else:
+            context[key] = value
+    _context.fields = context
+
+
+def write_record(record: dict, spans_file: str = None):
+    spans_file = spans_file if spans_file else DEFAULT_SPANS_FILE
+    try:
+        os.makedirs(os.path.dirname(spans_file), exist_ok=True)
+        # a single write in append mode, the records of more processes are not interleaved
+        fd = os.open(spans_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(record) + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+    except Exception as e:
+        logger.warning("Unable to write span {0}: {1}".format(record.get("phase"), e))
+
+
+@contextmanager
+def span(phase: str, **attributes):
+    """
+    Time the code executed within the context and write a record (one line of the spans file) with the phase, the
+    app and emulator of the current thread, start, duration, status (ok or error) and the given attributes. The
+    record is yielded, so more attributes can be added by the phase.
+    """
+    record = {"run": os.environ.get(RUN_ID_ENV), "phase": phase}
+    record.update(getattr(_context, "fields", {}))
+    record.update(attributes)
+    start = time.time()
+    record["start"] = start
+    record["status"] = "ok"
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration"] = time.time() - start
+        write_record(record)
+
+
+def read_records(spans_file: str = None, run_id: str = None) -> list:
+    """
+    Records of the spans file, only the ones of the given run (by default the last run in the file).
+    """
+    records = []
+    with open(spans_file if spans_file else DEFAULT_SPANS_FILE, "r") as file_spans:
+        for line in file_spans:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    if run_id is None and records:
+        run_id = records[-1].get("run")
+    return [record for record in records if record.get("run") == run_id]
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0
+    index = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def summarize(records: list) -> dict:
+    """
+    Count, errors, p50, p95, max and total duration (seconds) of each phase.
+    """
+    durations = {}
+    errors = {}
+    for record in records:
+        durations.setdefault(record["phase"], []).append(record["duration"])
+        if record.get("status") != "ok":
+            errors[record["phase"]] = errors.get(record["phase"], 0) + 1
+    return {phase: {"count": len(values),
+                    "errors": errors.get(phase, 0),
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                    "max": max(values),
+                    "total": sum(values)}
+            for phase, values in durations.items()}
+
+
+def print_summary(summary: dict):
+    print("{:<24}{:>8}{:>8}{:>10}{:>10}{:>10}{:>12}".format("phase", "count", "errors", "p50", "p95", "max",
+                                                          "total"))
+    for phase, values in sorted(summary.items(), key=lambda item: -item[1]["total"]):
+        print("{:<24}{:>8}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>12.1f}".format(phase, values["count"], values["errors"],
+                                                                         values["p50"], values["p95"], values["max"],
+                                                                         values["total"]))
+
+
+def get_cmd_args(args: list = None):
+    """
+    Parse and return the command line parameters needed for the script execution.
+    :param args: List of arguments to be parsed (by default sys.argv is used).
+    :return: The command line needed parameters.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='python spans.py',
+        description='Summary (p50/p95 per phase) of the timing spans of a run'
+    )
+
+    parser.add_argument('-f', '--file', type=str, metavar='FILE', default=DEFAULT_SPANS_FILE,
+                        help='The spans file (JSONL)')
+    parser.add_argument('-r', '--run', type=str, metavar='RUN', default=None,
+                        help='The id of the run (default the last run in the file)')
+    parser.add_argument('--json', action='store_true', help='Print the summary as json')
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    arguments = get_cmd_args()
+    summary_run = summarize(read_records(arguments.file, arguments.run))
+    if arguments.json:
+        print(json.dumps(summary_run, indent=4))
+    else:
+        print_summary(summary_run)
@@ -0,0 +1,85 @@
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import app_analyzer
+from job_ledger import JobLedger
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+
+def pre_analyze_app(app: str, ledger_path: str = None):
+    """
+    Static analysis of the app executed by the pool, None if the app was already analyzed
+    """
+    ledger = JobLedger(ledger_path)
+    try:
+        job = ledger.register_app(app)
+        if ledger.is_finished(job["md5"]):
+            return None
+    finally:
+        ledger.close()
+    return app_analyzer.static_analysis(app, job["md5"])
+
+
+class StaticAnalysisPipeline(object):
+    """
+    Statically pre-analyze the next apps on a bounded pool of processes while the emulator analyzes the current one.
+    Iterating over the pipeline returns (app, static result) as soon as the static analysis of an app is finished.
+    At most max_pending apps are analyzed or waiting to be consumed, so the memory used stays bounded. The list of
+    apps can be an endless stream (see intake): None means that no app is ready yet.
+    """
+
+    def __init__(self, list_apps, max_workers: int = 2, max_pending: int = None, ledger_path: str = None):
+        self.list_apps = list_apps
+        self.ledger_path = ledger_path
+        self.max_workers = max_workers
+        self.max_pending = max_pending if max_pending else max_workers + 1
+        self.exhausted = False
+
+    def __iter__(self):
+        iter_apps = iter(self.list_apps)
+        pending = {}
+        self.exhausted = False
+        # Spawn instead of fork, the parent process may hold frida and tensorflow state.
+        with ProcessPoolExecutor(max_workers=self.max_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            self.submit_next_apps(executor, iter_apps, pending)
+            while pending or not self.exhausted:
+                if not pending:
+                    # no app ready yet, ask again
+                    self.submit_next_apps(executor, iter_apps, pending)
+                    continue
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = next(iter(done))
+                app = pending.pop(future)
+                try:
+                    static_result = future.result()
+                except Exception as e:
+                    logger.error("Static analysis of {} failed, Exception: {}".format(app, e))
+                    static_result = None
+                # start the next app before the dynamic analysis of this one
+                self.submit_next_apps(executor, iter_apps, pending)
+                logger.info("Static analysis of {} ready, {} apps in pipeline".format(app, len(pending)))
+                yield app, static_result
+
+    def submit_next_apps(self, executor: ProcessPoolExecutor, iter_apps, pending: dict):
+        while len(pending) < self.max_pending:
+            try:
+                app = next(iter_apps)
+            except StopIteration:
+                self.exhausted = True
+                return
+            if app is None:
+                return
+            pending[executor.submit(pre_analyze_app, app, self.ledger_path)] = app
@@ -55,6 +55,31 @@ class Statistic:
         self.apps_with_home_buttons_accepts += 1 if result_app.home_button_change_page else 0
         self.apps_with_back_buttons_accepts += 1 if result_app.back_button_change_page else 0
 
+    def merge(self, other):
+        """
+        Add the counters of another Statistic (e.g., the one of another emulator worker) to this one.
+        """
+        self.list_max_actions.extend(other.list_max_actions)
+        self.apps_with_timeout += other.apps_with_timeout
+        self.apps_privacy_policy_page_detected += other.apps_privacy_policy_page_detected
+        self.apps_with_home_buttons_accepts += other.apps_with_home_buttons_accepts
+        self.apps_with_back_buttons_accepts += other.apps_with_back_buttons_accepts
+        self.update_stats_counter(self.stats_permission, other.stats_permission)
+        self.update_stats_counter(self.stats_trackers, other.stats_trackers)
+        self.apps_cleaned += other.apps_cleaned
+        self.apps_not_analyzed += other.apps_not_analyzed
+        self.api_privacy_relevant_invoked.extend(other.api_privacy_relevant_invoked)
+        self.apps_not_compliant += other.apps_not_compliant
+        self.app_compliant += other.app_compliant
+
+    @staticmethod
+    def update_stats_counter(stats_counter: dict, other_stats_counter: dict):
+        for key, value in other_stats_counter.items():
+            if key in stats_counter:
+                stats_counter[key] += value
+            else:
+                stats_counter[key] = value
+
     def write_on_file(self, path_file: str, app_analyzed: int):
         mean_actions = sum(self.list_max_actions) / len(self.list_max_actions) if len(self.list_max_actions) > 0 else 0
         mean_api_privacy_relevant = sum(self.api_privacy_relevant_invoked) / len(self.api_privacy_relevant_invoked) if \
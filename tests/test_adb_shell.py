@@ -0,0 +1,155 @@
+import os
+import re
+import subprocess
+
+import pytest
+
+import adb_shell
+from adb_shell import ShellSession, ShellSessionError
+
+COMMAND_RE = re.compile(rb'\{ (.*)\n\} </dev/null 2>&1; printf "\\n%s %d\\n" (\S+) "\$\?"\n', re.DOTALL)
+
+
+class FakeStdin(object):
+
+    def __init__(self, process):
+        self.process = process
+        self.closed = False
+
+    def write(self, data: bytes):
+        if self.closed or self.process.returncode is not None:
+            raise BrokenPipeError('Broken pipe')
+        match = COMMAND_RE.fullmatch(data)
+        assert match, data
+        self.process.commands.append(match.group(1).decode())
+        self.process.run(match.group(1).decode(), match.group(2))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeShellProcess(object):
+    """
+    An `adb shell` that answers the commands sent by ShellSession with the output of a few fake commands, through a
+    real pipe read by the thread of the session. With newline b'\\r\\n' it ends the lines as a shell in a pty.
+    """
+
+    def __init__(self, args, newline: bytes = b'\n', chunk_size: int = 0):
+        self.args = args
+        self.newline = newline
+        self.chunk_size = chunk_size
+        self.commands = []
+        self.returncode = None
+        read_fd, self.write_fd = os.pipe()
+        self.stdout = os.fdopen(read_fd, 'rb')
+        self.stdin = FakeStdin(self)
+
+    def write(self, data: bytes):
+        chunk_size = self.chunk_size if self.chunk_size else len(data)
+        for index in range(0, len(data), chunk_size):
+            os.write(self.write_fd, data[index:index + chunk_size])
+
+    def run(self, command: str, marker: bytes):
+        if command == 'sleep 100':
+            # never answers
+            return
+        if command == 'reboot':
+            self.write(b'rebooting' + self.newline)
+            self.exit(0)
+            return
+        if command.startswith('echo '):
+            output, exit_code = command[len('echo '):].encode() + self.newline, 0
+        elif command == 'false':
+            output, exit_code = b'', 1
+        else:
+            output, exit_code = command.encode() + b': not found' + self.newline, 127
+        self.write(output + self.newline + marker + ' {}'.format(exit_code).encode() + self.newline)
+
+    def exit(self, returncode: int):
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+        if self.returncode is None:
+            self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        self.exit(-9)
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+
+@pytest.fixture
+def processes(monkeypatch, request):
+    """
+    The fake processes started by the shell sessions, the parameter of the test (if any) gives the options of the
+    fake processes.
+    """
+    started = []
+    options = getattr(request, 'param', {})
+
+    def popen(args, **kwargs):
+        process = FakeShellProcess(args, **options)
+        started.append(process)
+        return process
+
+    monkeypatch.setattr(adb_shell.subprocess, 'Popen', popen)
+    return started
+
+
+@pytest.fixture
+def session(processes):
+    shell_session = ShellSession(['adb', '-s', 'emulator-5554'])
+    yield shell_session
+    shell_session.close()
+
+
+@pytest.mark.parametrize('processes', [{'newline': b'\n'}, {'newline': b'\r\n'}, {'chunk_size': 3}],
+                         indirect=True, ids=['shell_v2', 'pty', 'chunked'])
+def test_run(session, processes):
+    output, exit_code = session.run(['echo', 'hello'], timeout=5)
+    assert exit_code == 0
+    # a shell in a pty ends the lines of the output with \r\n too
+    newline = processes[0].newline.decode()
+    assert output == 'hello' + newline
+    assert session.run(['false'], timeout=5) == ('', 1)
+    assert session.run(['unknown'], timeout=5) == ('unknown: not found' + newline, 127)
+    # every command runs in the same session
+    assert len(processes) == 1
+    assert processes[0].args == ['adb', '-s', 'emulator-5554', 'shell']
+    assert processes[0].commands == ['echo hello', 'false', 'unknown']
+
+
+def test_timeout_reopen(session, processes):
+    with pytest.raises(subprocess.TimeoutExpired):
+        session.run(['sleep', '100'], timeout=0.2)
+    # the session that did not answer was closed, the next command runs in a new one
+    assert processes[0].returncode is not None
+    assert session.run(['echo', 'hello'], timeout=5) == ('hello\n', 0)
+    assert len(processes) == 2
+    assert processes[1].commands == ['echo hello']
+
+
+def test_closed_while_running(session, processes):
+    assert session.run(['echo', 'hello'], timeout=5) == ('hello\n', 0)
+    with pytest.raises(ShellSessionError, match='rebooting'):
+        session.run(['reboot'], timeout=5)
+    assert session.run(['echo', 'hello'], timeout=5) == ('hello\n', 0)
+    assert len(processes) == 2
+
+
+def test_closed_before_command(session, processes):
+    assert session.run(['echo', 'hello'], timeout=5) == ('hello\n', 0)
+    # the session is closed between two commands, the next command starts a new one
+    processes[0].exit(0)
+    assert session.run(['echo', 'again'], timeout=5) == ('again\n', 0)
+    # the stdin of the session is broken, but the process is still running
+    processes[1].stdin.close()
+    assert session.run(['echo', 'hello'], timeout=5) == ('hello\n', 0)
+    assert len(processes) == 3
@@ -0,0 +1,150 @@
+import json
+import sqlite3
+
+import pytest
+
+import job_ledger
+from job_ledger import JobLedger, get_md5, STATE_QUEUED, STATE_STATIC, STATE_DYNAMIC, STATE_DONE, STATE_FAILED
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    job_ledger_db = JobLedger(str(tmp_path / "ledger.sqlite"))
+    yield job_ledger_db
+    job_ledger_db.close()
+
+
+@pytest.fixture
+def logs_dir(tmp_path, monkeypatch):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    monkeypatch.setattr(job_ledger, "LOGS_DIR", str(logs))
+    return logs
+
+
+def make_apk(directory, name: str, content: bytes) -> str:
+    apk_path = directory / name
+    apk_path.write_bytes(content)
+    return str(apk_path)
+
+
+def write_log(logs_dir, md5_app: str, dict_analysis_app: dict):
+    (logs_dir / md5_app).mkdir()
+    with open(str(logs_dir / md5_app / "{}.json".format(md5_app)), "w") as json_file:
+        json.dump(dict_analysis_app, json_file)
+
+
+def test_register_app(ledger, logs_dir, tmp_path):
+    apk_path = make_apk(tmp_path, "app.apk", b"app")
+    job = ledger.register_app(apk_path)
+    assert job["md5"] == get_md5(apk_path)
+    assert job["state"] == STATE_QUEUED
+    assert job["attempts"] == 0
+    assert ledger.lookup_md5(apk_path) == job["md5"]
+    # registered again, the job is not duplicated
+    assert ledger.register_app(apk_path)["md5"] == job["md5"]
+    assert len(ledger.get_jobs()) == 1
+
+
+def test_register_app_imports_legacy_verdict(ledger, logs_dir, tmp_path):
+    analyzed_apk = make_apk(tmp_path, "analyzed.apk", b"analyzed")
+    write_log(logs_dir, get_md5(analyzed_apk), {"package_name": "com.analyzed", "app_analyzed": True,
+                                                "app_is_compliant_with_google_play_store": False})
+    not_analyzed_apk = make_apk(tmp_path, "not_analyzed.apk", b"not analyzed")
+    write_log(logs_dir, get_md5(not_analyzed_apk), {"package_name": "com.not.analyzed", "app_analyzed": False})
+    cleaned_apk = make_apk(tmp_path, "cleaned.apk", b"cleaned")
+    write_log(logs_dir, get_md5(cleaned_apk), {"package_name": "com.cleaned", "dynamic_analysis_needed": False})
+    # written by a dynamic analysis that did not end, no verdict
+    interrupted_apk = make_apk(tmp_path, "interrupted.apk", b"interrupted")
+    write_log(logs_dir, get_md5(interrupted_apk), {"package_name": "com.interrupted", "trackers_inside": []})
+
+    job = ledger.register_app(analyzed_apk)
+    assert job["state"] == STATE_DONE
+    assert job["package_name"] == "com.analyzed"
+    assert job["compliant"] == 0
+    assert json.loads(job["verdict"])["app_analyzed"] is True
+    assert ledger.register_app(not_analyzed_apk)["state"] == STATE_FAILED
+    assert ledger.register_app(cleaned_apk)["state"] == STATE_DONE
+    assert ledger.register_app(interrupted_apk)["state"] == STATE_QUEUED
+
+
+def test_recover_interrupted(ledger, logs_dir, tmp_path):
+    md5_apps = [ledger.register_app(make_apk(tmp_path, "{}.apk".format(index), str(index).encode()))["md5"]
+                for index in range(4)]
+    for md5_app in md5_apps:
+        ledger.start_attempt(md5_app)
+    ledger.start_attempt(md5_apps[1])
+    ledger.set_state(md5_apps[1], STATE_DYNAMIC)
+    ledger.finish(md5_apps[2], {"app_analyzed": True})
+    ledger.retry_later(md5_apps[3], "crash")
+
+    assert ledger.recover_interrupted() == 2
+    assert ledger.count_by_state() == {STATE_QUEUED: 3, STATE_STATIC: 0, STATE_DYNAMIC: 0, STATE_DONE: 1,
+                                       STATE_FAILED: 0}
+    # the tentatives of the interrupted jobs are still counted
+    assert ledger.get_job(md5_apps[0])["state"] == STATE_QUEUED
+    assert ledger.get_job(md5_apps[0])["attempts"] == 1
+    assert ledger.get_job(md5_apps[1])["state"] == STATE_QUEUED
+    assert ledger.get_job(md5_apps[1])["attempts"] == 2
+    assert ledger.recover_interrupted() == 0
+
+
+def test_cancel_attempt(ledger, logs_dir, tmp_path):
+    md5_app = ledger.register_app(make_apk(tmp_path, "app.apk", b"app"))["md5"]
+    ledger.start_attempt(md5_app)
+    ledger.set_phase(md5_app, "boot")
+    ledger.cancel_attempt(md5_app, "Not enough memory")
+    job = ledger.get_job(md5_app)
+    assert job["state"] == STATE_QUEUED
+    assert job["attempts"] == 0
+    assert job["phase"] is None
+    assert job["error"] == "Not enough memory"
+
+    # a tentative that ran is still counted
+    ledger.start_attempt(md5_app)
+    ledger.retry_later(md5_app, "crash")
+    ledger.start_attempt(md5_app)
+    ledger.cancel_attempt(md5_app, "Not enough memory")
+    assert ledger.get_job(md5_app)["attempts"] == 1
+
+
+def test_requeue(ledger, logs_dir, tmp_path):
+    md5_app = ledger.register_app(make_apk(tmp_path, "app.apk", b"app"))["md5"]
+    ledger.start_attempt(md5_app)
+    ledger.finish(md5_app, {"app_analyzed": False}, STATE_FAILED, error="crash")
+    assert ledger.is_finished(md5_app)
+    assert ledger.requeue(STATE_FAILED) == 1
+    job = ledger.get_job(md5_app)
+    assert job["state"] == STATE_QUEUED
+    assert job["attempts"] == 0
+    assert job["error"] is None
+
+
+def test_migrate_old_ledger(tmp_path):
+    ledger_path = str(tmp_path / "ledger.sqlite")
+    # the table of a ledger created before the columns in ADDED_COLUMNS
+    old_connection = sqlite3.connect(ledger_path)
+    old_connection.execute("CREATE TABLE jobs (md5 TEXT PRIMARY KEY, apk_path TEXT, apk_size INTEGER, "
+                           "apk_mtime REAL, package_name TEXT, state TEXT NOT NULL, "
+                           "attempts INTEGER NOT NULL DEFAULT 0, compliant INTEGER, verdict TEXT, error TEXT, "
+                           "static_time REAL, dynamic_time REAL, created_at REAL, started_at REAL, "
+                           "finished_at REAL, updated_at REAL)")
+    old_connection.execute("INSERT INTO jobs (md5, state, attempts) VALUES ('0123', ?, 2)", (STATE_QUEUED,))
+    old_connection.commit()
+    old_connection.close()
+
+    ledger = JobLedger(ledger_path)
+    columns = [row[1] for row in ledger.execute("PRAGMA table_info(jobs)")]
+    assert all(column in columns for column in job_ledger.ADDED_COLUMNS)
+    job = ledger.get_job("0123")
+    assert job["attempts"] == 2
+    assert job["phase"] is None
+    ledger.set_phase("0123", "install")
+    ledger.set_snapshot("0123", "emulator-1:app-0123")
+    assert ledger.get_job("0123")["snapshot"] == "emulator-1:app-0123"
+    ledger.close()
+
+    # opened again, the columns are not added twice
+    ledger = JobLedger(ledger_path)
+    assert ledger.get_job("0123")["phase"] == "install"
+    ledger.close()
@@ -0,0 +1,108 @@
+import pytest
+
+import scheduler
+from scheduler import AppScheduler, ORDER_FIFO, RETRY_BACKOFF, MAX_RETRY_BACKOFF
+
+
+class FakeClock(object):
+    """
+    Replaces the time module of the scheduler, the backoff expires only when the test moves the clock forward.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(scheduler, "time", fake_clock)
+    return fake_clock
+
+
+def test_unknown_order():
+    with pytest.raises(ValueError):
+        AppScheduler(order="random")
+
+
+def test_retry_after_fresh_apps(clock):
+    app_scheduler = AppScheduler(["a.apk", "b.apk"], order=ORDER_FIFO)
+    assert app_scheduler.get_nowait() == "a.apk"
+    app_scheduler.task_done("a.apk", False)
+    app_scheduler.put("c.apk")
+    # the backoff of the retry is expired, the fresh apps are returned first anyway
+    clock.sleep(MAX_RETRY_BACKOFF)
+    assert list(app_scheduler) == ["b.apk", "c.apk", "a.apk"]
+    assert app_scheduler.empty()
+
+
+def test_task_done(clock):
+    app_scheduler = AppScheduler(["a.apk"], order=ORDER_FIFO)
+    assert app_scheduler.get_nowait() == "a.apk"
+    app_scheduler.task_done("a.apk", True)
+    assert app_scheduler.empty()
+    assert app_scheduler.wait_time() == 0
+
+
+def test_backoff(clock):
+    app_scheduler = AppScheduler(order=ORDER_FIFO)
+    app_scheduler.retry("a.apk")
+    assert len(app_scheduler) == 1
+    assert app_scheduler.get_nowait() is None
+    assert app_scheduler.wait_time() == RETRY_BACKOFF
+
+    clock.sleep(RETRY_BACKOFF / 2)
+    assert app_scheduler.get_nowait() is None
+    assert 0 < app_scheduler.wait_time() <= RETRY_BACKOFF / 2
+
+    clock.sleep(RETRY_BACKOFF / 2)
+    assert app_scheduler.wait_time() == 0
+    assert app_scheduler.get_nowait() == "a.apk"
+    assert app_scheduler.get_nowait() is None
+
+
+def test_fresh_app_during_backoff(clock):
+    app_scheduler = AppScheduler(order=ORDER_FIFO)
+    app_scheduler.retry("a.apk")
+    app_scheduler.put("b.apk")
+    assert app_scheduler.wait_time() == 0
+    assert app_scheduler.get_nowait() == "b.apk"
+    assert app_scheduler.get_nowait() is None
+
+
+def test_backoff_capped(clock):
+    app_scheduler = AppScheduler(order=ORDER_FIFO)
+    backoffs = []
+    for _ in range(10):
+        app_scheduler.retry("a.apk")
+        backoffs.append(app_scheduler.wait_time())
+        clock.sleep(app_scheduler.wait_time())
+        assert app_scheduler.get_nowait() == "a.apk"
+
+    assert backoffs[:3] == [RETRY_BACKOFF, 2 * RETRY_BACKOFF, 4 * RETRY_BACKOFF]
+    assert backoffs == sorted(backoffs)
+    assert max(backoffs) == MAX_RETRY_BACKOFF
+    assert backoffs[-1] == MAX_RETRY_BACKOFF
+
+
+def test_position_and_remove(clock):
+    app_scheduler = AppScheduler(["a.apk", "b.apk", "c.apk"], order=ORDER_FIFO)
+    app_scheduler.retry("d.apk")
+    assert [app_scheduler.position(app) for app in ["a.apk", "b.apk", "c.apk", "d.apk"]] == [0, 1, 2, 3]
+    assert app_scheduler.position("e.apk") is None
+
+    assert app_scheduler.remove("b.apk")
+    assert not app_scheduler.remove("b.apk")
+    assert "b.apk" not in app_scheduler
+    assert app_scheduler.position("c.apk") == 1
+
+    # a retry waiting for its backoff can be withdrawn too
+    assert app_scheduler.remove("d.apk")
+    assert list(app_scheduler) == ["a.apk", "c.apk"]
+    assert app_scheduler.wait_time() == 0
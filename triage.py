@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis_worker import store_app_cleaned, update_dict_static_result, get_num_log, get_stats_files
+from job_ledger import JobLedger
+from static_pipeline import pre_analyze_app
+from stats import Statistic
+
+if 'LOG_LEVEL' in os.environ:
+    log_level = os.environ['LOG_LEVEL']
+else:
+    log_level = logging.INFO
+
+# Logging configuration.
+logger = logging.getLogger(__name__)
+logging.basicConfig(format='%(asctime)s> [%(levelname)s][%(name)s][%(funcName)s()] %(message)s',
+                    datefmt='%d/%m/%Y %H:%M:%S', level=log_level, stream=sys.stdout)
+
+
+def triage_apps(list_apps: list, max_workers: int = None, type_analysis: str = "Droidbot", ledger_path: str = None):
+    """
+    Static-only pass over all the apps, executed in parallel before any emulator is started. The apps without API to
+    monitoring are cleaned: their verdict is written and their job is done in the ledger. The apps already analyzed
+    are skipped.
+
+    Parameters
+    ----------
+    list_apps
+    max_workers, number of processes (default number of CPUs)
+    type_analysis
+    ledger_path, path of the job ledger (default logs/ledger.sqlite)
+
+    Returns the list of apps that need the dynamic analysis, the stats and the number of apps triaged
+    -------
+
+    """
+    stats = Statistic(type_analysis)
+    count = 0
+    list_apps_dynamic = []
+
+    ledger = JobLedger(ledger_path)
+    logger.info("Start triage of {} apps".format(len(list_apps)))
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [(app, executor.submit(pre_analyze_app, app, ledger_path)) for app in list_apps]
+        for app, future in futures:
+            try:
+                static_result = future.result()
+            except Exception as e:
+                # the dynamic stage will try again (and report the failure)
+                logger.error("Static analysis of {} failed, Exception: {}".format(app, e))
+                list_apps_dynamic.append(app)
+                continue
+
+            if static_result is None:
+                logger.info("App {} already analyzed".format(app))
+                count += 1
+            elif len(static_result["api_to_monitoring"]) == 0:
+                logger.info("App {} does not need privacy policy page".format(app))
+                md5_app = static_result["md5"]
+                dict_analysis_app = {"md5": md5_app}
+                update_dict_static_result(dict_analysis_app, static_result)
+                store_app_cleaned(md5_app, dict_analysis_app, static_result, stats, ledger)
+                count += 1
+            else:
+                list_apps_dynamic.append(app)
+    ledger.close()
+
+    logger.info("End triage: {} apps cleaned, {} apps need the dynamic analysis".format(stats.apps_cleaned,
+                                                                                          len(list_apps_dynamic)))
+    return list_apps_dynamic, stats, count
+
+
+def get_cmd_args(args: list = None):
+    """
+    Parse and return the command line parameters needed for the script execution.
+    :param args: List of arguments to be parsed (by default sys.argv is used).
+    :return: The command line needed parameters.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='python triage.py',
+        description='Static-only triage of the apps, the apps cleaned are marked as analyzed in the job ledger'
+    )
+
+    parser.add_argument('-d', '--dir-app', type=str, metavar='DIR', default=os.path.join(os.getcwd(), 'apps'),
+                        help='The directory where is the apps')
+    parser.add_argument('-w', '--workers', type=int, metavar='N', default=None,
+                        help='Number of processes used for the static analysis (default number of CPUs)')
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    arguments = get_cmd_args()
+    list_apps = glob.glob(os.path.join(arguments.dir_app, "*.apk"))
+    _, stats_triage, count_triage = triage_apps(list_apps, arguments.workers)
+    log_analysis_file, log_permission_file, log_trackers_file = get_stats_files("triage_{}".format(get_num_log() + 1))
+    stats_triage.write_on_file(log_analysis_file, count_triage)
+    stats_triage.write_stats_permissions(log_permission_file)
+    stats_triage.write_stats_trackers(log_trackers_file)